@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Per file time to read the meta data needed for indexing.
+
+"full" is the previous GetImageMeta: exifread over the file plus PIL for the size,
+which decodes HEIF files completely. "header" is picframe.image_header, which only
+reads the JPEG segments or HEIF boxes in front of the image data. Both are checked
+to give the same size and EXIF tags.
+
+Usage:
+    python scripts/benchmark_meta.py                      # test/kamera and test/mixed
+    python scripts/benchmark_meta.py ~/Pictures/2020 --repeat 3
+"""
+import io
+import os
+import sys
+import time
+import argparse
+
+import exifread
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from picframe import folder_scanner, image_header  # noqa: E402
+
+try:
+    from pi_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test')
+
+
+def full_read(path):
+    with open(path, 'rb') as f:
+        tags = exifread.process_file(f, details=False)
+    image = Image.open(path)
+    if image.format.upper() in ('HEIF', 'HEIC'):
+        image.load()
+    return image.size, tags
+
+
+def header_read(path):
+    header = image_header.read_header(path)
+    if header is None:
+        return None
+    tags = exifread.process_file(io.BytesIO(header.exif), details=False) if header.exif else {}
+    return (header.width, header.height), tags
+
+
+def best_time(func, path, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def same_tags(a, b):
+    def printable(tags):
+        return {k: str(v) for k, v in tags.items() if k != 'JPEGThumbnail'}
+    return printable(a) == printable(b)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dirs", nargs='*', help="folders with images (default: test/kamera test/mixed)")
+    parser.add_argument("--repeat", type=int, default=5, help="best of n runs per file")
+    args = parser.parse_args()
+    dirs = args.dirs or [os.path.join(TEST_DIR, 'kamera'), os.path.join(TEST_DIR, 'mixed')]
+
+    files = []
+    for dir in dirs:
+        for name in sorted(os.listdir(dir)):
+            extension = os.path.splitext(name)[1].lower()
+            if folder_scanner.is_media_file(dir, name) and extension in folder_scanner.IMAGE_EXTENSIONS:
+                files.append(os.path.join(dir, name))
+
+    print("{:<42} {:>10} {:>10} {:>8}  {}".format("file", "full ms", "header ms", "speedup", "same result"))
+    total_full = total_header = 0.0
+    for path in files:
+        full_s, (full_size, full_tags) = best_time(full_read, path, args.repeat)
+        header_s, result = best_time(header_read, path, args.repeat)
+        if result is None:
+            print("{:<42} {:>10.2f} {:>10} {:>8}  fallback to the full reader".format(
+                os.path.basename(path)[:42], full_s * 1000, "-", "-"))
+            total_full += full_s
+            total_header += full_s
+            continue
+        same = result[0] == full_size and same_tags(result[1], full_tags)
+        total_full += full_s
+        total_header += header_s
+        print("{:<42} {:>10.2f} {:>10.2f} {:>7.1f}x  {}".format(
+            os.path.basename(path)[:42], full_s * 1000, header_s * 1000, full_s / header_s, same))
+    if files:
+        print("{:<42} {:>10.2f} {:>10.2f} {:>7.1f}x".format(
+            "per file", total_full / len(files) * 1000, total_header / len(files) * 1000, total_full / total_header))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Time ImageCache.query_cache on synthetic libraries of 10k, 100k and 500k files.
+
+Each library has albums of 100 files with random dates, ratings and GPS positions
+(a third of them with a location description). The queries are the ones Model
+builds: one album (also with the fname LIKE filter used before schema v5), the
+whole library sorted by date, for recent_n and by rating, and five star files.
+"--no-index" drops the schema v6 rating index and the planner statistics to
+show the times without them.
+
+Usage:
+    python scripts/benchmark_query.py
+    python scripts/benchmark_query.py --rows 10000 100000 --repeat 3 --no-index
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import sqlite3
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from picframe.image_cache import ImageCache  # noqa: E402
+from picframe.query_filter import path_filter  # noqa: E402
+
+LIBRARY = '/library'  # outside the picture directory, so the cache's own scans leave it alone
+FILES_PER_ALBUM = 100
+NEW_INDEXES = ('meta_rating',)
+
+
+def fill(db_file, rows):
+    db = sqlite3.connect(db_file)
+    rnd = random.Random(rows)
+    now = time.time()
+    albums = (rows + FILES_PER_ALBUM - 1) // FILES_PER_ALBUM
+    db.executemany("INSERT INTO folder(folder_id, name, last_modified) VALUES(?, ?, ?)",
+                   [(i + 1, '{}/{}/album{:05d}'.format(LIBRARY, 2000 + i % 25, i), now) for i in range(albums)])
+    files = []
+    meta = []
+    locations = set()
+    for i in range(rows):
+        lat = round(rnd.uniform(35, 60), 4)
+        lon = round(rnd.uniform(-10, 30), 4)
+        files.append((i + 1, i // FILES_PER_ALBUM + 1, 'IMG_{:06d}'.format(i), 'jpg', now - rnd.uniform(0, 3e8)))
+        meta.append((i + 1, now - rnd.uniform(0, 8e8), rnd.choice((None, 1, 2, 3, 4, 5)), lat, lon,
+                     4000, rnd.choice((3000, 6000))))
+        if i % 3 == 0:
+            locations.add((lat, lon, 'Place {}'.format(i)))
+    db.executemany("INSERT INTO file(file_id, folder_id, basename, extension, last_modified) VALUES(?, ?, ?, ?, ?)",
+                   files)
+    db.executemany("INSERT INTO meta(file_id, exif_datetime, rating, latitude, longitude, width, height) "
+                   "VALUES(?, ?, ?, ?, ?, ?, ?)", meta)
+    db.executemany("INSERT INTO location(latitude, longitude, description) VALUES(?, ?, ?)", locations)
+    db.commit()
+    return db, albums
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs='+', default=[10000, 100000, 500000], help="library sizes")
+    parser.add_argument("--repeat", type=int, default=5, help="best of n runs per query")
+    parser.add_argument("--no-index", action='store_true', help="drop the v6 index and the statistics")
+    args = parser.parse_args()
+
+    print("{:>8} {:<22} {:>8} {:>10}".format("rows", "query", "result", "ms"))
+    for rows in args.rows:
+        tmp = tempfile.mkdtemp()
+        try:
+            pictures = os.path.join(tmp, 'pictures')
+            os.mkdir(pictures)
+            db_file = os.path.join(tmp, 'cache.db3')
+            cache = ImageCache(pictures, False, db_file, None, 3600)
+            cache.stop()
+            db, albums = fill(db_file, rows)
+            if args.no_index:
+                for index in NEW_INDEXES:
+                    db.execute("DROP INDEX IF EXISTS {}".format(index))
+                db.execute("DROP TABLE IF EXISTS sqlite_stat1")
+            else:
+                db.execute("PRAGMA analysis_limit = 1000")
+                db.execute("ANALYZE")
+            db.commit()
+            db.close()
+
+            cache = ImageCache(pictures, False, db_file, None, 3600)
+            library = path_filter(LIBRARY)
+            recent = "last_modified < {:.0f}".format(time.time() - 3600 * 24 * 30)
+            album = '{}/{}/album{:05d}'.format(LIBRARY, 2000 + albums // 2 % 25, albums // 2)
+            queries = (
+                ("album", path_filter(album), "fname ASC"),
+                ("album, fname LIKE", ("fname LIKE ?", (album + '/%',)), "fname ASC"),
+                ("library by date", library, "exif_datetime DESC,fname ASC"),
+                ("library recent_n", library, recent + ",fname ASC"),
+                ("library by rating", library, "rating DESC,fname ASC"),
+                ("rated 5, by date", ("rating = 5", ()), "exif_datetime DESC"),
+            )
+            for name, (where, params), sort in queries:
+                elapsed, result = best_time(lambda: cache.query_cache(where, sort, params), args.repeat)
+                print("{:>8} {:<22} {:>8} {:>10.1f}".format(rows, name, len(result), elapsed * 1000))
+            cache.stop()
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""
+Counts the filesystem calls the image cache needs to find new files.
+
+Compares the previous os.walk/os.listdir/os.path.getmtime scan with the single
+os.scandir pass in picframe.folder_scanner. Every counted call is at least one
+syscall: a "dir read" is an openat + getdents64 + close, a "stat" is a stat/newfstatat.
+Only the filesystem side is measured, the database lookups are the same in both.
+
+Usage:
+    python scripts/benchmark_scan.py                 # synthetic library in a temp dir
+    python scripts/benchmark_scan.py ~/Pictures      # existing library
+    python scripts/benchmark_scan.py --albums 500 --files 40
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from picframe import folder_scanner  # noqa: E402
+
+COUNTS = Counter()
+
+
+class CountingDirEntry:
+    """Wraps a DirEntry to count the stat calls that actually reach the kernel."""
+
+    def __init__(self, entry):
+        self.__entry = entry
+        self.__stat = None
+        self.name = entry.name
+        self.path = entry.path
+
+    def is_dir(self, follow_symlinks=True):
+        return self.__entry.is_dir(follow_symlinks=follow_symlinks)
+
+    def is_file(self, follow_symlinks=True):
+        return self.__entry.is_file(follow_symlinks=follow_symlinks)
+
+    def is_symlink(self):
+        return self.__entry.is_symlink()
+
+    def inode(self):
+        return self.__entry.inode()
+
+    def stat(self, follow_symlinks=True):
+        if self.__stat is None:
+            COUNTS['stat'] += 1  # DirEntry caches the result, only the first call is a syscall
+            self.__stat = self.__entry.stat(follow_symlinks=follow_symlinks)
+        return self.__stat
+
+
+class CountingScandir:
+    def __init__(self, path):
+        COUNTS['dir read'] += 1
+        self.__it = REAL_SCANDIR(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.__it.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return CountingDirEntry(next(self.__it))
+
+    def close(self):
+        self.__it.close()
+
+
+REAL_SCANDIR = os.scandir
+REAL_STAT = os.stat
+REAL_LISTDIR = os.listdir
+
+
+def counting_stat(*args, **kwargs):
+    COUNTS['stat'] += 1
+    return REAL_STAT(*args, **kwargs)
+
+
+def counting_listdir(*args, **kwargs):
+    COUNTS['dir read'] += 1
+    return REAL_LISTDIR(*args, **kwargs)
+
+
+def legacy_scan(top, modified):
+    """The previous ImageCache.__get_modified_folders + __get_modified_files + __insert_file"""
+    folders = []
+    for dir in [d[0] for d in os.walk(top)]:
+        if os.path.basename(dir):
+            if os.path.basename(dir)[0] == '.' or '.tmp' in dir:
+                continue
+        mod_tm = int(os.stat(dir).st_mtime)
+        if modified:
+            folders.append((dir, mod_tm))
+    files = []
+    for dir, _ in folders:
+        for file in os.listdir(dir):
+            if folder_scanner.is_media_file(dir, file):
+                full_file = os.path.join(dir, file)
+                os.path.getmtime(full_file)
+                files.append(full_file)
+    for file in files:
+        os.path.getmtime(file)  # __insert_file stat'ed every file again
+    return len(files)
+
+
+def scandir_scan(top, modified):
+    indexed = 0
+    for dir, mod_tm, entries in folder_scanner.scan_folders(top):
+        if modified:
+            indexed += sum(1 for _ in folder_scanner.stat_files(entries))
+    return indexed
+
+
+def make_library(root, albums, files):
+    for a in range(albums):
+        album = os.path.join(root, str(2000 + a % 25), 'album_{:05d}'.format(a))
+        os.makedirs(album)
+        for f in range(files):
+            open(os.path.join(album, 'IMG_{:04d}.jpg'.format(f)), 'wb').close()
+        open(os.path.join(album, '._IMG_0000.jpg'), 'wb').close()  # Apple junk, filtered by name
+        open(os.path.join(album, 'notes.txt'), 'wb').close()
+    os.makedirs(os.path.join(root, '2000', 'incoming.tmp'))
+
+
+def measure(name, func, top, modified):
+    COUNTS.clear()
+    os.scandir, os.stat, os.listdir = CountingScandir, counting_stat, counting_listdir
+    try:
+        start = time.perf_counter()
+        indexed = func(top, modified)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.scandir, os.stat, os.listdir = REAL_SCANDIR, REAL_STAT, REAL_LISTDIR
+    total = sum(COUNTS.values())
+    per_file = "{:.2f}".format(total / indexed) if indexed else "-"
+    print("{:<10} {:>8} files {:>8} dir reads {:>8} stats {:>8} calls/file {:>8.3f} s".format(
+        name, indexed, COUNTS['dir read'], COUNTS['stat'], per_file, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pic_dir", nargs='?', help="library to scan (default: build a synthetic one)")
+    parser.add_argument("--albums", type=int, default=200)
+    parser.add_argument("--files", type=int, default=50)
+    args = parser.parse_args()
+
+    tmp_dir = None
+    top = os.path.expanduser(args.pic_dir) if args.pic_dir else None
+    if top is None:
+        tmp_dir = tempfile.mkdtemp()
+        top = os.path.join(tmp_dir, 'pics')
+        make_library(top, args.albums, args.files)
+    try:
+        print("first index (every folder modified):")
+        measure("os.walk", legacy_scan, top, True)
+        measure("scandir", scandir_scan, top, True)
+        print("steady state (no folder modified):")
+        measure("os.walk", legacy_scan, top, False)
+        measure("scandir", scandir_scan, top, False)
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -242,6 +242,8 @@ run_sync() {
         touch -r "$source_album_path" "$tmp_dest_album_path"
         log_msg "Finalizing album: $random_year/$random_album"
         mv "$tmp_dest_album_path" "$dest_album_path"
+        # ask picframe to index just this album now instead of at its next scheduled scan
+        echo "$dest_album_path" >> /dev/shm/picframe_rescan
     done
 
     # --- Unmount ---
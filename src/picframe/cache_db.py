@@ -0,0 +1,53 @@
+"""
+Connections to the image cache database.
+
+There is one writer connection, used by the cache thread and, under the
+cache's write lock, by the few display time writes. Every other thread gets
+its own read-only connection the first time it asks for one. In WAL mode the
+readers see the last committed state and never wait for, or share cursor
+state with, a scan that is writing in the background.
+"""
+import sqlite3
+import logging
+import threading
+import urllib.parse
+
+
+class CacheDb:
+
+    def __init__(self, db_file):
+        self.__logger = logging.getLogger("cache_db.CacheDb")
+        self.__db_file = db_file
+        self.__local = threading.local()
+        self.__readers = []
+        self.__readers_lock = threading.Lock()
+        self.writer = self.__connect()
+
+    def __connect(self, read_only=False):
+        if read_only and self.__db_file != ':memory:':
+            uri = 'file:{}?mode=ro'.format(urllib.parse.quote(self.__db_file))
+            db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            db = sqlite3.connect(self.__db_file, check_same_thread=False)
+        db.row_factory = sqlite3.Row  # make results accessible by field name
+        return db
+
+    def reader(self):
+        """The read-only connection of the calling thread."""
+        db = getattr(self.__local, 'db', None)
+        if db is None:
+            if self.__db_file == ':memory:':
+                return self.writer  # an in memory db only exists for its own connection
+            db = self.__connect(read_only=True)
+            self.__local.db = db
+            with self.__readers_lock:
+                self.__readers.append(db)
+            self.__logger.debug('Opened reader for thread %s', threading.current_thread().name)
+        return db
+
+    def close(self):
+        with self.__readers_lock:
+            for db in self.__readers:
+                db.close()
+            self.__readers.clear()
+        self.writer.close()
@@ -69,6 +69,59 @@ class Controller:
         self.__model.delete_file()
         self.next()
 
+    def rescan(self, path=None):
+        self.__model.rescan(path)
+
+    def purge_files(self):
+        self.__model.purge_files()
+
+    @property
+    def location_filter(self):
+        return self.__model.location_filter
+
+    @location_filter.setter
+    def location_filter(self, val):
+        self.__model.location_filter = val
+        self.__next_tm = 0
+
+    @property
+    def tags_filter(self):
+        return self.__model.tags_filter
+
+    @tags_filter.setter
+    def tags_filter(self, val):
+        self.__model.tags_filter = val
+        self.__next_tm = 0
+
+    @property
+    def date_from(self):
+        return self.__model.date_from
+
+    @date_from.setter
+    def date_from(self, val):
+        self.__model.date_from = self.__parse_date(val)
+        self.__next_tm = 0
+
+    @property
+    def date_to(self):
+        return self.__model.date_to
+
+    @date_to.setter
+    def date_to(self, val):
+        self.__model.date_to = self.__parse_date(val)
+        self.__next_tm = 0
+
+    def __parse_date(self, val):
+        # unix time or a date like 2020/12/31, anything else (e.g. "") clears the filter
+        try:
+            return float(val)
+        except (ValueError, TypeError):
+            pass
+        try:
+            return make_date(val)
+        except (ValueError, TypeError, OverflowError):
+            return None
+
     def get_current_path(self):
         pics = self.__model.get_current_pics()
         if pics and pics[0]:
@@ -119,6 +172,11 @@ class Controller:
                             self.__model.save_resume_state() # Save state for file AFTER this video
                             # Play video. The viewer is now responsible for cleaning up the console *after* playback.
                             self.__viewer.play_video(pics[0].fname) 
+                            in_process = self.__model.get_model_config()['video_handoff'] == 'in_process'
+                            if in_process and self.__restart_display():
+                                self.__force_navigate = False
+                                self.__next_tm = 0 # Show the next image straight away
+                                continue
                             exit_code = 10 # Special exit code to signal restart
                             self.keep_looping = False
                             break # Exit loop to allow service restart
@@ -217,6 +275,21 @@ class Controller:
                 self.__http_config.get('password')
             )
 
+    def __restart_display(self):
+        """Recreates the display after mpv has run, keeping the rest of picframe running.
+        False if that failed and the process has to be restarted instead.
+        """
+        from picframe.interface_peripherals import InterfacePeripherals
+        try:
+            self.__viewer.slideshow_start()
+            # the touch/mouse menu was drawn with the old display
+            self.__interface_peripherals.stop()
+            self.__interface_peripherals = InterfacePeripherals(self.__model, self.__viewer, self)
+        except Exception as e:
+            self.__logger.error("Could not recreate the display after the video: %s. Restarting picframe.", e)
+            return False
+        return True
+
     def stop(self):
         self.keep_looping = False
         if self.__interface_peripherals:
@@ -0,0 +1,112 @@
+"""
+Single pass os.scandir walk of the picture directory.
+
+`scan_folders` visits every album folder once and takes the folder mtime from the
+parent's DirEntry, so a folder costs one directory read and one stat. The files of
+a folder are only stat'ed by `stat_files` if the caller decides the folder has
+changed. All name based filters (hidden, .tmp, .AppleDouble, extension) run before
+any stat call.
+"""
+import os
+import hashlib
+import logging
+from collections import namedtuple
+from picframe.controller import VIDEO_EXTENSIONS
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.heif', '.heic')
+MEDIA_EXTENSIONS = frozenset(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS)
+
+FileStat = namedtuple('FileStat', ['path', 'mtime', 'size', 'inode'])
+
+PARTIAL_HASH_BLOCK = 64 * 1024  # bytes hashed from the start and from the end of a file
+
+logger = logging.getLogger("folder_scanner")
+
+
+def is_ignored_dir(name):
+    """Hidden and temporary directories are neither scanned nor watched."""
+    return name.startswith('.') or '.tmp' in name
+
+
+def is_media_file(dir, file):
+    # have to filter out all the Apple junk
+    extension = os.path.splitext(file)[1].lower()
+    return (extension in MEDIA_EXTENSIONS and
+            '.AppleDouble' not in dir and not file.startswith('.') and
+            '.tmp' not in dir and '.tmp' not in file)
+
+
+def scan_folders(top, follow_links=False):
+    """Yield (dir, mtime, entries) for `top` and every folder below it.
+
+    `entries` are the DirEntry objects of the media files in `dir`, filtered by
+    name only. Nothing below a hidden or temporary folder is visited.
+    """
+    try:
+        top_mtime = os.stat(top).st_mtime
+    except OSError as e:
+        logger.warning("Directory not found during scan: %s (%s)", top, e)
+        return
+    stack = [(top, top_mtime)]
+    while stack:
+        dir, mod_tm = stack.pop()
+        files = []
+        sub_dirs = []
+        try:
+            with os.scandir(dir) as it:
+                for entry in it:
+                    name = entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=follow_links):
+                            if not is_ignored_dir(name):
+                                sub_dirs.append(entry)
+                        elif is_media_file(dir, name):
+                            files.append(entry)
+                    except OSError:
+                        continue  # dangling link or vanished in the meantime
+        except (FileNotFoundError, NotADirectoryError, PermissionError) as e:
+            logger.warning("Directory not readable during scan: %s (%s)", dir, e)
+            continue
+        yield dir, mod_tm, files
+        for entry in reversed(sub_dirs):  # keep the os.walk top down order
+            try:
+                stack.append((entry.path, entry.stat().st_mtime))
+            except OSError:
+                continue
+
+
+def stat_files(entries):
+    """Yield a FileStat for each DirEntry using its (cached) stat result."""
+    for entry in entries:
+        try:
+            st = entry.stat()
+        except OSError:
+            continue  # deleted since the folder was listed
+        yield FileStat(entry.path, st.st_mtime, st.st_size, st.st_ino)
+
+
+def partial_hash(path, size):
+    """Hash of the size plus the first and last PARTIAL_HASH_BLOCK bytes. Enough to tell
+    photos and videos apart without reading them completely, None if the file can't be read.
+    """
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    try:
+        with open(path, 'rb') as f:
+            digest.update(f.read(PARTIAL_HASH_BLOCK))
+            if size > 2 * PARTIAL_HASH_BLOCK:
+                f.seek(-PARTIAL_HASH_BLOCK, os.SEEK_END)
+                digest.update(f.read(PARTIAL_HASH_BLOCK))
+            elif size > PARTIAL_HASH_BLOCK:
+                digest.update(f.read())
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def stat_file(path):
+    """FileStat for a single path, or None if it can't be stat'ed."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return FileStat(path, st.st_mtime, st.st_size, st.st_ino)
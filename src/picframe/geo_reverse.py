@@ -1,10 +1,33 @@
+import os
 import json
+import math
 import urllib.request
 import locale
 import logging
+import numpy as np
 
 URL = "https://nominatim.openstreetmap.org/reverse?format=geojson&lat={}&lon={}&zoom={}&email={}&accept-language={}"
 
+EARTH_RADIUS_KM = 6371.0
+MAX_PLACE_DISTANCE_KM = 50.0  # further from any place counts as no address
+CELL_DEGREES = 1.0  # size of the lat/lon cells places are bucketed in
+VILLAGE_POPULATION = 10000  # smaller places are villages, bigger ones cities, as Nominatim would call them
+
+
+def format_address(adr, key_list=None):
+    """Join the parts of a Nominatim style address dict picked by key_list."""
+    # some experimentation might be needed to get a good set of alternatives in key_list
+    adr_list = []
+    if key_list is not None:
+        for part in key_list:
+            for option in part:
+                if option in adr:
+                    adr_list.append(adr[option])
+                    break  # add just the first one from the options
+    else:
+        adr_list = adr.values()
+    return ", ".join(adr_list)
+
 
 class GeoReverse:
     def __init__(self, geo_key, zoom=18, key_list=None):
@@ -12,29 +35,137 @@ class GeoReverse:
         self.__geo_key = geo_key
         self.__zoom = zoom
         self.__key_list = key_list
-        self.__geo_locations = {}
         self.__language = locale.getlocale()[0][:2]
 
     def get_address(self, lat, lon):
+        """Address of lat, lon, "" if there is none and None if the geocoder couldn't be reached."""
         try:
             with urllib.request.urlopen(URL.format(lat, lon, self.__zoom, self.__geo_key, self.__language),
                                         timeout=3.0) as req:
                 data = json.loads(req.read().decode())
             adr = data['features'][0]['properties']['address']
-            # some experimentation might be needed to get a good set of alternatives in key_list
-            adr_list = []
-            if self.__key_list is not None:
-                for part in self.__key_list:
-                    for option in part:
-                        if option in adr:
-                            adr_list.append(adr[option])
-                            break  # add just the first one from the options
-            else:
-                adr_list = adr.values()
-            return ", ".join(adr_list)
+            return format_address(adr, self.__key_list)
         except urllib.error.URLError as e:
             self.__logger.error("Network error when trying to reverse geocode lat=%f, lon=%f: %s", lat, lon, e)
-            return ""
+            return None
         except Exception as e:
-            self.__logger.error("An unexpected error occurred when trying to reverse geocode lat=%f, lon=%f: %s", lat, lon, e)
+            self.__logger.error("An unexpected error occurred when trying to reverse geocode lat=%f, lon=%f: %s",
+                                lat, lon, e)
             return ""
+
+
+class OfflineGeoReverse:
+    """Nearest place from a GeoNames cities file (e.g. cities1000.txt from
+    https://download.geonames.org/export/dump/), no network needed. admin1CodesASCII.txt,
+    admin2Codes.txt and countryInfo.txt next to it are used for state, county and country names.
+
+    The places are read on the first lookup and bucketed in CELL_DEGREES cells, a lookup
+    only measures the distance to the places in the cells around the position.
+    """
+
+    def __init__(self, places_file, key_list=None, max_distance=MAX_PLACE_DISTANCE_KM):
+        self.__logger = logging.getLogger("geo_reverse.OfflineGeoReverse")
+        self.__places_file = os.path.expanduser(places_file)
+        self.__key_list = key_list
+        self.__max_distance = max_distance
+        self.__places = None  # loaded on first use
+
+    def get_address(self, lat, lon):
+        """Address of the place nearest to lat, lon, "" if there is none within max_distance."""
+        if self.__places is None:
+            self.__load()
+        place = self.__nearest(lat, lon)
+        if place is None:
+            return ""
+        return format_address(self.__address(place), self.__key_list)
+
+    def __load(self):
+        lats = []
+        lons = []
+        places = []
+        try:
+            with open(self.__places_file, encoding='utf-8') as f:
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) < 15:
+                        continue
+                    lats.append(float(fields[4]))
+                    lons.append(float(fields[5]))
+                    # name, country code, admin1 code, admin2 code, population
+                    places.append((fields[1], fields[8], fields[10], fields[11], int(fields[14] or 0)))
+        except (OSError, ValueError) as e:
+            self.__logger.error("Can't read places from %s: %s", self.__places_file, e)
+        lat = np.radians(np.array(lats, dtype=np.float64))
+        lon = np.radians(np.array(lons, dtype=np.float64))
+        cells = self.__cell(np.degrees(lat), np.degrees(lon))
+        order = np.argsort(cells, kind='stable')
+        self.__lat = lat[order]
+        self.__lon = lon[order]
+        self.__places = [places[i] for i in order]
+        codes, starts, counts = np.unique(cells[order], return_index=True, return_counts=True)
+        self.__cells = {int(code): (int(start), int(start + count))
+                        for code, start, count in zip(codes, starts, counts)}
+        directory = os.path.dirname(self.__places_file)
+        self.__admin1 = self.__read_names(os.path.join(directory, 'admin1CodesASCII.txt'), 0, 1)
+        self.__admin2 = self.__read_names(os.path.join(directory, 'admin2Codes.txt'), 0, 1)
+        self.__countries = self.__read_names(os.path.join(directory, 'countryInfo.txt'), 0, 4)
+        self.__logger.info("Loaded %d places from %s", len(self.__places), self.__places_file)
+
+    def __read_names(self, path, key_column, name_column):
+        names = {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.startswith('#'):
+                        continue
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) > name_column:
+                        names[fields[key_column]] = fields[name_column]
+        except OSError:
+            pass  # optional, the codes are used instead
+        return names
+
+    @staticmethod
+    def __cell(lat, lon):
+        lat_cell = np.floor((np.asarray(lat) + 90.0) / CELL_DEGREES).astype(np.int64)
+        lon_cell = np.floor((np.asarray(lon) + 180.0) / CELL_DEGREES).astype(np.int64) % int(360 / CELL_DEGREES)
+        return lat_cell * int(360 / CELL_DEGREES) + lon_cell
+
+    def __nearest(self, lat, lon):
+        lon_cells = int(360 / CELL_DEGREES)
+        lat_cell = int(math.floor((lat + 90.0) / CELL_DEGREES))
+        lon_cell = int(math.floor((lon + 180.0) / CELL_DEGREES))
+        # enough cells to cover max_distance, more of them in longitude towards the poles
+        lat_span = int(math.ceil(math.degrees(self.__max_distance / EARTH_RADIUS_KM) / CELL_DEGREES))
+        lon_span = min(int(math.ceil(lat_span / max(math.cos(math.radians(lat)), 0.01))), lon_cells // 2)
+        candidates = []
+        for i in range(lat_cell - lat_span, lat_cell + lat_span + 1):
+            for j in range(lon_cell - lon_span, lon_cell + lon_span + 1):
+                found = self.__cells.get(i * lon_cells + j % lon_cells)
+                if found is not None:
+                    candidates.append(np.arange(*found))
+        if not candidates:
+            return None
+        index = np.concatenate(candidates)
+        lat1 = math.radians(lat)
+        lat2 = self.__lat[index]
+        # haversine
+        a = (np.sin((lat2 - lat1) / 2) ** 2
+             + math.cos(lat1) * np.cos(lat2) * np.sin((self.__lon[index] - math.radians(lon)) / 2) ** 2)
+        best = int(np.argmin(a))
+        if 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a[best], 1.0))) > self.__max_distance:
+            return None
+        return self.__places[index[best]]
+
+    def __address(self, place):
+        name, country_code, admin1, admin2, population = place
+        adr = {'village' if population < VILLAGE_POPULATION else 'city': name}
+        county = self.__admin2.get("{}.{}.{}".format(country_code, admin1, admin2))
+        if county:
+            adr['county'] = county
+        state = self.__admin1.get("{}.{}".format(country_code, admin1))
+        if state:
+            adr['state'] = state
+        adr['country'] = self.__countries.get(country_code, country_code)
+        adr['country_code'] = country_code.lower()
+        return adr
@@ -1,4 +1,5 @@
 import exifread
+import io
 import os
 import logging
 import time
@@ -6,6 +7,7 @@ import subprocess
 import json
 from PIL import Image
 from datetime import datetime
+from picframe import image_header, video_header
 
 class GetImageMeta:
     """
@@ -16,6 +18,10 @@ class GetImageMeta:
         self.__logger = logging.getLogger("get_image_meta.GetImageMeta")
         self.__filename = filename
         self.__tags = {}
+        self.__iptc = {}
+        if self.__read_header():
+            return
+        # not a JPEG or HEIF file or an unusual one, read EXIF from the file and decode it for the size
         try:
             with open(self.__filename, 'rb') as f:
                 self.__tags = exifread.process_file(f, details=False)
@@ -33,6 +39,20 @@ class GetImageMeta:
             self.__logger.warning("Could not get image properties for %s: %s", self.__filename, e)
             self.width, self.height = 0, 0
 
+    def __read_header(self):
+        """Take size, EXIF and IPTC from the file header without touching the pixel data."""
+        header = image_header.read_header(self.__filename)
+        if header is None:
+            return False
+        if header.exif:
+            try:
+                self.__tags = exifread.process_file(io.BytesIO(header.exif), details=False)
+            except Exception as e:
+                self.__logger.warning("Error reading EXIF data from %s: %s", self.__filename, e)
+        self.__iptc = header.iptc
+        self.width, self.height = header.width, header.height
+        return True
+
     @staticmethod
     def get_image_object(filename):
         try:
@@ -50,6 +70,8 @@ class GetImageMeta:
         return (self.width, self.height)
 
     def get_exif(self, key):
+        if key in self.__iptc:
+            return self.__iptc[key]
         if key in self.__tags:
             if key == 'EXIF DateTimeOriginal':
                 return self.__tags[key].values
@@ -96,9 +118,21 @@ class GetImageMeta:
         return {'latitude': lat, 'longitude': lon}
 
 
-def get_video_info(file_path_name, ffprobe_path=None):
+def probe_video(file_path_name, ffprobe_path=None):
     """
-    Extracts metadata from a video file using ffprobe.
+    Reads width, height (as coded), rotation, duration and creation_time of a video.
+    MP4/MOV files are read in process, ffprobe is only started for other containers.
+    Returns an empty dict if neither works.
+    """
+    info = video_header.read_video_header(file_path_name)
+    if info is not None:
+        return info
+    return probe_video_ffprobe(file_path_name, ffprobe_path)
+
+
+def probe_video_ffprobe(file_path_name, ffprobe_path=None):
+    """
+    Extracts the probe_video() values from a video file using ffprobe.
     """
     logger = logging.getLogger("get_image_meta.get_video_info")
     ffprobe_cmd = ffprobe_path if ffprobe_path else 'ffprobe'
@@ -110,38 +144,35 @@ def get_video_info(file_path_name, ffprobe_path=None):
         "-show_streams",
         file_path_name
     ]
-    meta = {}
+    info = {}
     try:
         result = subprocess.run(command, check=True, capture_output=True, text=True)
-        info = json.loads(result.stdout)
+        probe = json.loads(result.stdout)
 
-        video_stream = next((s for s in info['streams'] if s['codec_type'] == 'video'), None)
+        video_stream = next((s for s in probe['streams'] if s['codec_type'] == 'video'), None)
         if not video_stream:
             logger.warning("No video stream found in %s", file_path_name)
-            return meta
+            return info
 
-        meta['width'] = int(video_stream.get('width', 0))
-        meta['height'] = int(video_stream.get('height', 0))
-        meta['orientation'] = 1 # Default for video
-
-        # Check for rotation tag
-        if 'tags' in video_stream and 'rotate' in video_stream['tags']:
-            rotation = int(video_stream['tags']['rotate'])
-            if rotation == 90 or rotation == 270:
-                meta['width'], meta['height'] = meta['height'], meta['width']
+        info['width'] = int(video_stream.get('width', 0))
+        info['height'] = int(video_stream.get('height', 0))
+        info['rotation'] = int(video_stream.get('tags', {}).get('rotate', 0)) % 360
+        for side_data in video_stream.get('side_data_list', []):  # newer ffprobe versions
+            if 'rotation' in side_data:
+                info['rotation'] = int(side_data['rotation']) % 360
+        duration = probe.get('format', {}).get('duration')
+        info['duration'] = float(duration) if duration is not None else None
 
         # Get creation time from format tags if available
-        creation_time_str = info.get('format', {}).get('tags', {}).get('creation_time')
+        info['creation_time'] = None
+        creation_time_str = probe.get('format', {}).get('tags', {}).get('creation_time')
         if creation_time_str:
             try:
                 # Handle timezone info like '2023-01-01T12:00:00.000000Z'
                 dt_object = datetime.fromisoformat(creation_time_str.replace('Z', '+00:00'))
-                meta['exif_datetime'] = dt_object.timestamp()
+                info['creation_time'] = dt_object.timestamp()
             except ValueError:
                 logger.warning("Could not parse creation_time '%s'", creation_time_str)
-                meta['exif_datetime'] = os.path.getmtime(file_path_name)
-        else:
-            meta['exif_datetime'] = os.path.getmtime(file_path_name)
 
     except FileNotFoundError:
         logger.error("ffprobe command not found. Please ensure it is installed and in your PATH.")
@@ -150,4 +181,26 @@ def get_video_info(file_path_name, ffprobe_path=None):
     except Exception as e:
         logger.error("An error occurred while getting video info for %s: %s", file_path_name, e)
 
+    return info
+
+
+def get_video_info(file_path_name, ffprobe_path=None, info=None):
+    """
+    Extracts metadata from a video file. `info` is a previous probe_video() result,
+    if it is None the file is probed.
+    """
+    if info is None:
+        info = probe_video(file_path_name, ffprobe_path)
+    meta = {}
+    if not info:
+        return meta
+    meta['width'] = info['width']
+    meta['height'] = info['height']
+    meta['orientation'] = 1 # Default for video
+    if info.get('rotation') in (90, 270):
+        meta['width'], meta['height'] = meta['height'], meta['width']
+    if info.get('creation_time'):
+        meta['exif_datetime'] = info['creation_time']
+    else:
+        meta['exif_datetime'] = os.path.getmtime(file_path_name)
     return meta
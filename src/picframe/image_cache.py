@@ -1,16 +1,48 @@
 import sqlite3
 import os
+import json
 import time
 import logging
 import threading
-from picframe import get_image_meta
+import multiprocessing
+import concurrent.futures
+from collections import Counter, deque, namedtuple
+from typing import Optional
+from picframe import get_image_meta, folder_scanner
+from picframe.cache_db import CacheDb
 from picframe.controller import VIDEO_EXTENSIONS
-
+from picframe.inotify_watcher import InotifyWatcher
+
+RESCAN_POLL_INTERVAL = 1.0  # seconds between checks of the rescan trigger file while waiting
+GEO_REQUEST_INTERVAL = 1.0  # seconds between geocoder requests (the Nominatim usage policy allows one per second)
+GEO_ERROR_BACKOFF = 300.0  # seconds without geocoder requests after a network error
+GEO_GRID_OFFSET = 1e9  # keeps grid keys positive, so int() in Python and CAST in SQL both round down
+GEO_FILL_BATCH = 20  # rows with a missing location looked at per idle poll
+STATS_FLUSH_INTERVAL = 30.0  # seconds display statistics are collected in memory before they are written
+ALBUM_DEPTH = 2  # albums are the folders year/album below the picture root in use, see get_albums()
+FILE_ROWS_BATCH = 500  # file ids per IN (...) query of get_file_rows(), below the 999 variables of older sqlite
+OPTIMIZE_INTERVAL = 6 * 3600  # seconds between refreshes of the query planner statistics
+ANALYSIS_LIMIT = 1000  # rows sampled per index by ANALYZE, keeps it fast on an SD card
+
+# the files of a list of albums (json array of folder names) and their sub folders, see query_cache()
+ALBUM_JOIN = """all_data INNER JOIN json_each(?) AS album
+    ON all_data.folder = album.value
+        OR (all_data.folder >= album.value || '/' AND all_data.folder < album.value || '0')"""
+
+# SQL for the group a portrait has to share with its partner, see query_cache()
+PAIR_KEYS = {
+    'order': "0",  # the next portrait in the playlist
+    'date': "date(exif_datetime, 'unixepoch', 'localtime')",  # the next one taken on the same day
+    'album': "folder",  # the next one from the same folder
+}
+
+# what extract_meta() found out about one file, meta is None if it couldn't be read
+IndexResult = namedtuple('IndexResult', ['file_stat', 'meta', 'video_info', 'content_hash'])
 
 
 class ImageCache:
 
-    EXTENSIONS = ['.png', '.jpg', '.jpeg', '.heif', '.heic']
+    EXTENSIONS = list(folder_scanner.IMAGE_EXTENSIONS)
 
     EXIF_TO_FIELD = {'EXIF FNumber': 'f_number',
                      'Image Make': 'make',
@@ -25,11 +57,15 @@ class ImageCache:
                      'IPTC Caption/Abstract': 'caption',
                      'IPTC Object Name': 'title'}
 
-    def __init__(self, picture_dir, follow_links, db_file, geo_reverse, update_interval, portrait_pairs=False, ffprobe_path=None):
+    def __init__(self, picture_dir, follow_links, db_file, geo_reverse, update_interval, portrait_pairs=False,
+                 ffprobe_path=None, use_inotify=False, index_workers=1,
+                 full_scan_interval=86400, db_batch_size=100, db_commit_interval=2.0,
+                 max_update_interval=None, rescan_trigger=None, portrait_pairs_by='order',
+                 geo_grid=0.001, geo_retry_interval=86400.0, geo_fill=False):
         # TODO these class methods will crash if Model attempts to instantiate this using a
         # different version from the latest one - should this argument be taken out?
         self.__modified_folders = []
-        self.__modified_files = []
+        self.__modified_files = []  # FileStat tuples waiting to be inserted
         self.__cached_file_stats = []  # collection shared between threads
         self.__logger = logging.getLogger("image_cache.ImageCache")
         self.__logger.debug('Creating an instance of ImageCache')
@@ -37,169 +73,647 @@ class ImageCache:
         self.__follow_links = follow_links
         self.__db_file = db_file
         self.__geo_reverse = geo_reverse
+        self.__geo_grid = geo_grid  # degrees, coordinates in the same cell share one lookup
+        self.__geo_retry_interval = geo_retry_interval  # seconds before a place without address is asked again
+        self.__geo_fill = geo_fill  # look up missing locations while idle
+        self.__next_geo_request = 0.0  # monotonic time the geocoder may be asked again
         self.__update_interval = update_interval
+        # without changes the time between scans doubles up to max_update_interval
+        self.__max_update_interval = max(update_interval, max_update_interval or update_interval)
+        self.__rescan_trigger = rescan_trigger
+        self.__rescan_paths = set()  # None stands for the whole picture directory
+        self.__rescan_lock = threading.Lock()
+        self.__rescan_event = threading.Event()
         self.__portrait_pairs = portrait_pairs  # TODO have a function to turn this on and off?
+        if portrait_pairs_by not in PAIR_KEYS:
+            self.__logger.warning("Unknown portrait_pairs_by '%s', pairing in order", portrait_pairs_by)
+            portrait_pairs_by = 'order'
+        self.__portrait_pairs_by = portrait_pairs_by
         self.__ffprobe_path = ffprobe_path
-        self.__db = self.__create_open_db(self.__db_file)
+        self.__use_inotify = use_inotify
+        self.__index_workers = index_workers
+        self.__pool = None  # worker processes of __insert_modified_files_parallel(), kept until stop()
+        self.__full_scan_interval = full_scan_interval
+        self.__db_batch_size = max(1, db_batch_size)
+        self.__db_commit_interval = db_commit_interval
+        self.__last_commit = time.monotonic()
+        self.__watcher = None  # created by the cache thread, see __loop()
+        self.__initial_scan_done = False
+        # handed over by get_file_info() on the display thread, done by the cache thread
+        self.__display_stats = deque()  # (file_id, time displayed)
+        self.__revalidate_files = deque()  # (file_id, fname, last_modified) to check against the disk
+        self.__geo_requests = deque()  # (latitude, longitude) without a location description
+        self.__last_stats_flush = time.monotonic()
+        self.__dirty_folders = set()  # folders whose row in the folder_count table is out of date
+        self.__pending_files = Counter()  # folder -> files waiting to be indexed
+        self.__file_changes = 0  # files written, moved or deleted, see get_change_count()
+        self.__committed_file_changes = 0
+        # writer connection for the cache thread, read-only connections for everybody else
+        self.__cache_db = CacheDb(self.__db_file)
+        self.__db = self.__create_open_db(self.__cache_db.writer)
         self.__db_write_lock = threading.Lock()  # lock to serialize db writes between threads
         # NB this is where the required schema is set
-        self.__update_schema(3)
+        self.__update_schema(12)
+        self.__fts = self.__create_fts()
+        self.__check_folder_counts()
 
         self.__keep_looping = True
         self.__pause_looping = False
         self.__shutdown_completed = False
         self.__purge_files = False
+        self.__next_full_scan = self.__first_full_scan()
+        self.__next_optimize = 0.0  # as soon as the initial scan is done
 
         t = threading.Thread(target=self.__loop)
         t.start()
 
     def __loop(self):
+        if self.__use_inotify:
+            # start watching before the first full scan so nothing changing during the scan is lost
+            self.__watcher = InotifyWatcher(self.__picture_dir, self.__follow_links)
+            if not self.__watcher.start():
+                self.__watcher = None
+        interval = self.__update_interval
+        paused = False
         while self.__keep_looping:
             if not self.__pause_looping:
-                self.update_cache()
-                time.sleep(self.__update_interval)
+                paused = False
+                rescan_paths = self.__take_rescan_requests()
+                if rescan_paths and None not in rescan_paths and self.__initial_scan_done:
+                    changed = self.__rescan_subtrees(rescan_paths)
+                elif (self.__watcher is not None and self.__initial_scan_done and not rescan_paths and
+                      not self.__full_scan_due()):
+                    changed = self.__update_from_watcher()
+                else:
+                    changed = self.update_cache()
+                    self.__initial_scan_done = not self.__modified_files
+                if changed or self.__watcher is not None:
+                    interval = self.__update_interval
+                else:
+                    interval = min(2 * interval, self.__max_update_interval)
+                if self.__initial_scan_done and time.monotonic() >= self.__next_optimize:
+                    self.__optimize_db()
+                    self.__next_optimize = time.monotonic() + OPTIMIZE_INTERVAL
+                self.__wait_for_next_update(interval)
+            else:
+                # no scanning while paused, but what the display path queued is still done
+                if not paused:
+                    self.__flush_display_stats()
+                    paused = True
+                self.__run_display_jobs()
             time.sleep(0.01)
+        if self.__watcher is not None:
+            self.__watcher.close()
+        self.__run_display_jobs(lookups=False)  # a missing location is looked up when the file is shown again
+        self.__flush_display_stats()
         self.__db_write_lock.acquire()
         self.__db.commit()  # close after update_cache finished for last time
         self.__db_write_lock.release()
-        self.__db.close()
+        self.__cache_db.close()
         self.__shutdown_completed = True
 
+    def __optimize_db(self):
+        """Keep the query planner statistics up to date. The first run after the initial scan
+        does a full (sampled) ANALYZE, later runs let PRAGMA optimize decide which tables changed
+        enough to need it.
+        """
+        starttime = time.monotonic()
+        self.__db_write_lock.acquire()
+        try:
+            self.__db.execute("PRAGMA analysis_limit = {}".format(ANALYSIS_LIMIT))
+            if self.__db.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is None:
+                self.__db.execute("ANALYZE")
+            else:
+                self.__db.execute("PRAGMA optimize")
+            self.__commit(force=True)
+        finally:
+            self.__db_write_lock.release()
+        self.__logger.debug('Optimized db in %.0f ms', (time.monotonic() - starttime) * 1000)
+
     def pause_looping(self, value):
         self.__pause_looping = value
 
     def stop(self):
         self.__keep_looping = False
+        self.__rescan_event.set()
         while not self.__shutdown_completed:
             time.sleep(0.05)  # make function blocking to ensure staged shutdown
+        if self.__pool is not None:
+            self.__pool.shutdown(cancel_futures=True)
+            self.__pool = None
 
     def purge_files(self):
+        """Compare every file in the db with the disk on the next update."""
         self.__purge_files = True
 
+    def rescan(self, path=None):
+        """Look for changes straight away instead of waiting for the next scheduled update.
+        `path` (absolute or relative to the picture directory) limits the scan to that subtree.
+        """
+        dir = self.__resolve_rescan_path(path)
+        if dir is False:
+            return
+        self.__logger.info('Rescan of %s requested', dir if dir else self.__picture_dir)
+        with self.__rescan_lock:
+            self.__rescan_paths.add(dir)
+        self.__rescan_event.set()
+
+    def __resolve_rescan_path(self, path):
+        if not path or not path.strip():
+            return None
+        dir = os.path.normpath(os.path.join(self.__picture_dir, path.strip()))  # absolute paths replace picture_dir
+        top = os.path.normpath(self.__picture_dir)
+        if dir == top:
+            return None
+        if not dir.startswith(top + os.sep):
+            self.__logger.warning('Ignoring rescan of %s, it is not below %s', path, top)
+            return False
+        if os.path.isfile(dir):
+            dir = os.path.dirname(dir)
+        return None if dir == top else dir
+
+    def __take_rescan_requests(self):
+        self.__read_rescan_trigger()
+        with self.__rescan_lock:
+            paths = self.__rescan_paths
+            self.__rescan_paths = set()
+            self.__rescan_event.clear()
+        return paths
+
+    def __read_rescan_trigger(self):
+        """The trigger file holds one path per line, an empty file asks for a scan of everything."""
+        if not self.__rescan_trigger or not os.path.exists(self.__rescan_trigger):
+            return False
+        work_file = self.__rescan_trigger + '.work'
+        try:
+            os.replace(self.__rescan_trigger, work_file)  # anything written from now on goes to a new file
+            with open(work_file, 'r') as f:
+                lines = [line.strip() for line in f]
+            os.remove(work_file)
+        except OSError as e:
+            self.__logger.warning('Could not read rescan trigger %s: %s', self.__rescan_trigger, e)
+            return False
+        paths = [line for line in lines if line]
+        for path in paths or [None]:
+            self.rescan(path)
+        return True
+
+    def __wait_for_next_update(self, interval):
+        """Sleep until the next update is due, a rescan is requested or the cache is paused or stopped."""
+        deadline = time.monotonic() + interval
+        while self.__keep_looping and not self.__pause_looping:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if self.__rescan_event.wait(min(remaining, RESCAN_POLL_INTERVAL)):
+                return
+            if self.__read_rescan_trigger():
+                return
+            self.__run_display_jobs()
+            self.__fill_locations()
+
+    def __full_scan_due(self):
+        return self.__purge_files or time.monotonic() >= self.__next_full_scan
+
+    def __first_full_scan(self):
+        """Monotonic time of the first full reconciliation after start up. The viewer is restarted
+        after every video, so it is only done straight away if the last one that finished is more
+        than full_scan_interval ago (or with 0, if there never was one). Until then the scans of
+        the changed folders catch up with what happened while picframe was not running.
+        """
+        last_full_scan = self.__db.execute("SELECT last_full_scan FROM db_info").fetchone()[0]
+        if self.__full_scan_interval <= 0:
+            return time.monotonic() if last_full_scan == 0 else float('inf')
+        # clamped, a Pi without a clock may start in 1970 and only get the time from the network later
+        remaining = min(max(last_full_scan + self.__full_scan_interval - time.time(), 0), self.__full_scan_interval)
+        return time.monotonic() + remaining
+
     def update_cache(self):
         """Update the cache database with new and/or modified files
+
+        Returns True if anything changed on disk or files are still waiting to be indexed.
         """
 
         self.__logger.debug('Updating cache')
+        changed = bool(self.__modified_files)
+        full = False
 
         # If the current collection of updated files is empty, check for disk-based changes
         if not self.__modified_files:
             self.__logger.debug('No unprocessed files in memory, checking disk')
-            self.__modified_folders = self.__get_modified_folders()
-            self.__modified_files = self.__get_modified_files(self.__modified_folders)
+            full = self.__full_scan_due()
+            if full:
+                self.__logger.info('Full reconciliation of the cache with %s', self.__picture_dir)
+                self.__purge_files = False
+                self.__next_full_scan = (time.monotonic() + self.__full_scan_interval
+                                         if self.__full_scan_interval > 0 else float('inf'))
+            (self.__modified_folders, self.__modified_files,
+             deleted_folders, deleted_files) = self.__get_modified_folders_and_files(full=full)
             self.__logger.debug('Found %d new files on disk', len(self.__modified_files))
+            self.__delete_from_db(deleted_folders, deleted_files)
+            changed = bool(self.__modified_files or deleted_folders or deleted_files)
 
-        # While we have files to process and looping isn't paused
-        while self.__modified_files and not self.__pause_looping:
-            file = self.__modified_files.pop(0)
-            self.__logger.debug('Inserting: %s', file)
-            self.__insert_file(file)
+        self.__insert_modified_files()
 
-        # If we've process all files in the current collection, update the cached folder info
-        if not self.__modified_files:
-            self.__update_folder_info(self.__modified_folders)
-            self.__modified_folders.clear()
+        # Commit the current set of changes
+        self.__db_write_lock.acquire()
+        if full and not self.__modified_files:
+            self.__purge_video_info()
+            self.__db.execute("UPDATE db_info SET last_full_scan = ?", (time.time(),))
+        self.__commit(force=True)
+        self.__db_write_lock.release()
+        return changed
 
-        # If looping is still not paused, remove any files or folders from the db that are no longer on disk
-        if not self.__pause_looping:
-            self.__purge_missing_files_and_folders()
+    def __purge_video_info(self):
+        """Drop the probe results of videos that are no longer in the file table. Only done once a
+        full scan is indexed, so a video removed and added again in between isn't probed again.
+        The caller holds __db_write_lock.
+        """
+        videos = ", ".join("'{}'".format(ext.lstrip('.')) for ext in VIDEO_EXTENSIONS)
+        cursor = self.__db.execute("""
+            DELETE FROM video_info WHERE fname NOT IN (
+                SELECT folder.name || "/" || file.basename || "." || file.extension FROM file
+                    INNER JOIN folder ON folder.folder_id = file.folder_id
+                    WHERE lower(file.extension) IN ({}))
+            """.format(videos))
+        if cursor.rowcount:
+            self.__logger.info('Removed the probe results of %d videos that are gone', cursor.rowcount)
+
+    def __update_from_watcher(self):
+        """Update the cache database from the paths reported by inotify instead of walking
+        the whole picture directory. Falls back to a full update after a queue overflow.
+        """
+        events = self.__watcher.read_events()
+        if events.overflow:
+            self.__watcher.add_tree(self.__picture_dir)  # pick up directories created while events were lost
+            return self.update_cache()
+
+        if events:
+            self.__logger.debug('inotify: %d changed, %d deleted files, %d new, %d deleted folders',
+                                len(events.changed_files), len(events.deleted_files),
+                                len(events.new_dirs), len(events.deleted_dirs))
+            pending = set(f.path for f in self.__modified_files)
+            for dir in events.new_dirs:
+                # files may have arrived before the watch was in place, so index the whole subtree
+                self.__scan_subtree(dir, pending)
+
+            for file in events.changed_files:
+                dir, file_only = os.path.split(file)
+                if file in pending or not folder_scanner.is_media_file(dir, file_only):
+                    continue
+                file_stat = folder_scanner.stat_file(file)
+                try:
+                    mod_tm = os.stat(dir).st_mtime
+                except OSError:
+                    continue  # gone again, the delete event will follow
+                if file_stat is None:
+                    continue
+                pending.add(file)
+                self.__modified_files.append(file_stat)
+                self.__modified_folders.append((dir, mod_tm))
+
+            # after queueing the new files, so files that were only moved can be recognised
+            self.__purge_paths(events.deleted_files, events.deleted_dirs)
+
+        if self.__modified_files or self.__modified_folders:
+            self.__insert_modified_files()
 
-        # Commit the current set of changes
         self.__db_write_lock.acquire()
-        self.__db.commit()
+        self.__commit(force=True)
+        self.__db_write_lock.release()
+        return bool(events)
+
+    def __rescan_subtrees(self, dirs):
+        """Index only the requested folders, e.g. the albums sync_photos.sh has just moved in."""
+        pending = set(f.path for f in self.__modified_files)
+        changed = False
+        gone = [dir for dir in dirs if not os.path.isdir(dir)]
+        for dir in sorted(set(dirs) - set(gone)):
+            changed |= self.__scan_subtree(dir, pending)
+        if gone:
+            self.__purge_paths([], gone)
+            changed = True
+        if self.__modified_files or self.__modified_folders:
+            self.__insert_modified_files()
+
+        self.__db_write_lock.acquire()
+        self.__commit(force=True)
         self.__db_write_lock.release()
+        return changed
+
+    def __scan_subtree(self, dir, pending):
+        """Diff the folders below `dir` against the db and queue new files that aren't `pending`."""
+        if self.__watcher is not None:
+            self.__watcher.add_tree(dir)
+        folders, files, deleted_folders, deleted_files = self.__get_modified_folders_and_files(dir)
+        self.__modified_folders.extend(folders)
+        for file_stat in files:
+            if file_stat.path not in pending:
+                pending.add(file_stat.path)
+                self.__modified_files.append(file_stat)
+        self.__delete_from_db(deleted_folders, deleted_files)
+        return bool(files or deleted_folders or deleted_files)
+
+    def __insert_modified_files(self):
+        self.__update_pending_counts()
+        if self.__index_workers > 1 and len(self.__modified_files) > self.__index_workers:
+            self.__insert_modified_files_parallel()
+        else:
+            # While we have files to process and looping isn't paused
+            results = []
+            while self.__modified_files and not self.__pause_looping and self.__keep_looping:
+                file_stat = self.__pop_modified_file()
+                results.append(extract_meta(file_stat, self.__ffprobe_path, self.__get_cached_video_info(file_stat)))
+                if len(results) >= self.__db_batch_size:
+                    self.__write_files(results)
+                    results = []
+                    self.__run_display_jobs()  # between batches, the first index of a library takes hours
+            self.__write_files(results)
 
-    def query_cache(self, where_clause, sort_clause='fname ASC'):
-        cursor = self.__db.cursor()
+        # If we've process all files in the current collection, update the cached folder info
+        if not self.__modified_files:
+            self.__update_folder_info(self.__modified_folders)
+            self.__modified_folders.clear()
+        self.__update_pending_counts()
+
+    def __pop_modified_file(self):
+        file_stat = self.__modified_files.pop(0)
+        self.__logger.debug('Inserting: %s', file_stat.path)
+        self.__pending_files[os.path.dirname(file_stat.path)] -= 1
+        return file_stat
+
+    def __insert_modified_files_parallel(self):
+        """Read meta data in a pool of worker processes (so PIL, exifread and ffprobe parsing
+        aren't serialised by the GIL) and hand the results to the single db writer in batches.
+        At most two files per worker are in flight, so pausing or stopping only has to wait
+        for those to finish, everything else stays in __modified_files for the next update.
+        """
+        self.__logger.info('Indexing %d files with %d workers', len(self.__modified_files), self.__index_workers)
+        in_flight = set()
+        results = []
+        pool = self.__get_pool()
+        try:
+            while True:
+                while (self.__modified_files and len(in_flight) < 2 * self.__index_workers and
+                       not self.__pause_looping and self.__keep_looping):
+                    file_stat = self.__pop_modified_file()
+                    video_info = self.__get_cached_video_info(file_stat)
+                    if video_info is not None:
+                        results.append(extract_meta(file_stat, self.__ffprobe_path, video_info))  # no probing left
+                        if len(results) >= self.__db_batch_size:
+                            self.__write_files(results)
+                            results = []
+                            self.__run_display_jobs()
+                    else:
+                        try:
+                            in_flight.add(pool.submit(extract_meta, file_stat, self.__ffprobe_path))
+                        except concurrent.futures.BrokenExecutor:
+                            self.__modified_files.insert(0, file_stat)  # for the next update
+                            raise
+                if not in_flight:
+                    break
+                done, in_flight = concurrent.futures.wait(in_flight,
+                                                          return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        results.append(future.result())
+                    except Exception as e:  # i.e. a worker process died
+                        self.__logger.error("Metadata worker failed: %s", e)
+                if len(results) >= self.__db_batch_size:
+                    self.__write_files(results)
+                    results = []
+                    self.__run_display_jobs()
+        except concurrent.futures.BrokenExecutor as e:
+            self.__logger.error("Metadata workers failed, starting new ones with the next update: %s", e)
+            self.__pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+        self.__write_files(results)
+
+    def __get_pool(self):
+        """The worker processes for indexing, started on first use and kept for the life of the cache,
+        so the imports in every worker are only paid once and not on every update with new files.
+        """
+        if self.__pool is None:
+            # spawn rather than fork, the main process has the display, mqtt and http threads running
+            self.__pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.__index_workers,
+                                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self.__pool
+
+    def query_cache(self, where_clause, sort_clause='fname ASC', params=(), albums=None):
+        """file_ids matching `where_clause`, with ? placeholders for `params` (see query_filter).
+        With a list of `albums` (folder names, see get_albums()) only their files are selected, album
+        by album in the order given and sorted by `sort_clause` within each, all with one query.
+        """
+        cursor = self.__cache_db.reader().cursor()
         cursor.row_factory = None  # we don't want the "sqlite3.Row" setting from the db here...
+        source = "all_data"
+        group_key = PAIR_KEYS[self.__portrait_pairs_by]
+        if albums is not None:
+            source = ALBUM_JOIN
+            sort_clause = "album.key, " + sort_clause
+            group_key = "album.key || '/' || " + group_key  # no pairs across albums
+            params = (json.dumps(list(albums)),) + tuple(params)
         try:
-            if not self.__portrait_pairs:  # TODO SQL insertion? Does it matter in this app?
-                sql = """SELECT file_id FROM all_data WHERE {0} ORDER BY {1}
-                    """.format(where_clause, sort_clause)
-                return cursor.execute(sql).fetchall()
-            else:  # make two SELECTS
-                sql = """SELECT
-                            CASE
-                                WHEN is_portrait = 0 THEN file_id
-                                ELSE -1
-                            END
-                            FROM all_data WHERE {0} ORDER BY {1}
-                                        """.format(where_clause, sort_clause)
-                full_list = cursor.execute(sql).fetchall()
-                sql = """SELECT file_id FROM all_data
-                            WHERE ({0}) AND is_portrait = 1 ORDER BY {1}
-                                        """.format(where_clause, sort_clause)
-                pair_list = cursor.execute(sql).fetchall()
+            if not self.__portrait_pairs:
+                sql = """SELECT file_id FROM {0} WHERE {1} ORDER BY {2}
+                    """.format(source, where_clause, sort_clause)
+                return cursor.execute(sql, params).fetchall()
+            else:
+                # One pass over the sorted list: a portrait takes the place of the first portrait
+                # in its group (see PAIR_KEYS) that is still waiting for a partner, or waits itself.
+                sql = """SELECT file_id, is_portrait, {3} FROM {0} WHERE {1} ORDER BY {2}
+                    """.format(source, where_clause, sort_clause, group_key)
                 newlist = []
-                skip_portrait_slot = False
-                for i in range(len(full_list)):
-                    if full_list[i][0] != -1:
-                        newlist.append(full_list[i])
-                    elif skip_portrait_slot:
-                        skip_portrait_slot = False
-                        continue
-                    elif pair_list:
-                        elem = pair_list.pop(0)
-                        if pair_list:
-                            elem += pair_list.pop(0)
-                            # Here, we just doubled-up a set of portrait images.
-                            # Skip the next available "portrait slot" as it's unneeded.
-                            skip_portrait_slot = True
-                        newlist.append(elem)
+                waiting = {}  # group -> index in newlist of a single portrait
+                for file_id, is_portrait, group in cursor.execute(sql, params):
+                    if not is_portrait:
+                        newlist.append((file_id,))
+                    elif group in waiting:
+                        i = waiting.pop(group)
+                        newlist[i] += (file_id,)
+                    else:
+                        waiting[group] = len(newlist)
+                        newlist.append((file_id,))
                 return newlist
         except Exception:
             return []
 
     def get_file_info(self, file_id):
+        """The all_data row of a file that is about to be shown. Only reads the db: checking the file
+        against the disk, looking up a missing location and counting the display are left to the
+        cache thread, so a changed file or new location shows up from the next display on.
+        """
         if not file_id:
             return None
-        sql = "SELECT * FROM all_data where file_id = {0}".format(file_id)
-        row = self.__db.execute(sql).fetchone()
-        try:
-            if row is not None and row['last_modified'] != os.path.getmtime(row['fname']):
-                self.__logger.debug('Cache miss: File %s changed on disk', row['fname'])
-                self.__insert_file(row['fname'], file_id)
-                row = self.__db.execute(sql).fetchone()  # description inserted in table
-        except OSError:
-            self.__logger.warning("Image '%s' does not exists or is inaccessible", row['fname'])
-        if row is not None and row['latitude'] is not None and row['longitude'] is not None and row['location'] is None:
-            if self.__get_geo_location(row['latitude'], row['longitude']):
-                row = self.__db.execute(sql).fetchone()  # description inserted in table
-        sql = "UPDATE file SET displayed_count = displayed_count + 1, last_displayed = ? WHERE file_id = ?"
-        starttime = round(time.time() * 1000)
-        self.__db_write_lock.acquire()
-        waittime = round(time.time() * 1000)
-        self.__db.execute(sql, (time.time(), file_id))  # Add file stats
-        self.__db_write_lock.release()
-        now = round(time.time() * 1000)
-        self.__logger.debug(
-            'Update file stats: Wait for %d ms and need %d ms for update ',
-            waittime - starttime, now - waittime)
+        sql = "SELECT * FROM all_data where file_id = ?"
+        row = self.__cache_db.reader().execute(sql, (file_id,)).fetchone()
+        self.record_display(file_id, row)
         return row  # NB if select fails (i.e. moved file) will return None
 
+    def get_file_rows(self, file_ids):
+        """The all_data rows of several files, by file_id, read with one query per
+        FILE_ROWS_BATCH ids. Unlike get_file_info() nothing is recorded; call record_display()
+        when one of them is shown. Files that are no longer in the db are left out.
+        """
+        file_ids = list(dict.fromkeys(file_id for file_id in file_ids if file_id))
+        rows = {}
+        reader = self.__cache_db.reader()
+        for i in range(0, len(file_ids), FILE_ROWS_BATCH):
+            batch = file_ids[i:i + FILE_ROWS_BATCH]
+            sql = "SELECT * FROM all_data WHERE file_id IN ({})".format(",".join("?" * len(batch)))
+            for row in reader.execute(sql, batch):
+                rows[row['file_id']] = row
+        return rows
+
+    def record_display(self, file_id, row):
+        """Queue the jobs for a file that is being shown: checking it against the disk, looking up
+        a missing location and counting the display. `row` is its all_data row or None.
+        """
+        if row is not None:
+            self.__revalidate_files.append((file_id, row['fname'], row['last_modified']))
+            if row['latitude'] is not None and row['longitude'] is not None and row['location'] is None:
+                self.__geo_requests.append((row['latitude'], row['longitude']))
+        self.__display_stats.append((file_id, time.time()))
+
+    def __run_display_jobs(self, lookups=True):
+        """Work through what get_file_info() handed over, on the cache thread while it waits for the
+        next update, between the batches of an indexing run, while paused and on stopping. Without
+        `lookups` the queued location requests are dropped instead of asking the geocoder.
+        """
+        while self.__revalidate_files:
+            file_id, fname, last_modified = self.__revalidate_files.popleft()
+            file_stat = folder_scanner.stat_file(fname)
+            if file_stat is None:
+                self.__logger.warning("Image '%s' does not exists or is inaccessible", fname)
+            elif last_modified != file_stat.mtime:
+                self.__logger.debug('Cache miss: File %s changed on disk', fname)
+                self.__insert_file(file_stat, file_id)
+        if not lookups:
+            self.__geo_requests.clear()
+        while self.__geo_requests:
+            lat, lon = self.__geo_requests.popleft()
+            sql = "SELECT 1 FROM location WHERE latitude = ? AND longitude = ?"
+            if self.__geo_reverse is not None and self.__db.execute(sql, (lat, lon)).fetchone() is None:
+                self.__get_geo_location(lat, lon)
+        if time.monotonic() - self.__last_stats_flush >= STATS_FLUSH_INTERVAL:
+            self.__flush_display_stats()
+
+    def __fill_locations(self):
+        """Look up the locations still missing for the photos in the db, a few at a time while the
+        cache thread is idle. Cells with a recent negative answer are skipped.
+        """
+        if not self.__geo_fill or self.__geo_reverse is None or time.monotonic() < self.__next_geo_request:
+            return
+        sql = """
+            SELECT DISTINCT meta.latitude, meta.longitude FROM meta
+                LEFT JOIN location
+                    ON location.latitude = meta.latitude AND location.longitude = meta.longitude
+                WHERE meta.latitude IS NOT NULL AND meta.longitude IS NOT NULL AND location.id IS NULL
+                    AND NOT EXISTS (SELECT 1 FROM geo_cache
+                        WHERE grid = :grid AND description = '' AND looked_up > :retry
+                            AND lat_key = CAST(meta.latitude / :grid + :offset AS INTEGER)
+                            AND lon_key = CAST(meta.longitude / :grid + :offset AS INTEGER))
+                LIMIT :batch"""
+        rows = self.__db.execute(sql, {'grid': self.__geo_grid, 'retry': time.time() - self.__geo_retry_interval,
+                                       'offset': GEO_GRID_OFFSET, 'batch': GEO_FILL_BATCH}).fetchall()
+        for lat, lon in rows:
+            self.__get_geo_location(lat, lon)
+            if time.monotonic() < self.__next_geo_request:
+                break  # asked the geocoder, the rest has to wait for the next poll
+
+    def __flush_display_stats(self):
+        """Write the display counts collected since the last flush with one executemany."""
+        self.__last_stats_flush = time.monotonic()
+        stats = {}
+        while self.__display_stats:
+            file_id, displayed = self.__display_stats.popleft()
+            count, _ = stats.get(file_id, (0, 0))
+            stats[file_id] = (count + 1, displayed)
+        if not stats:
+            return
+        sql = "UPDATE file SET displayed_count = displayed_count + ?, last_displayed = ? WHERE file_id = ?"
+        self.__db_write_lock.acquire()
+        try:
+            self.__db.executemany(sql, [(count, displayed, file_id) for file_id, (count, displayed) in stats.items()])
+            self.__commit(force=True)
+        finally:
+            self.__db_write_lock.release()
+        self.__logger.debug('Wrote display statistics of %d files', len(stats))
+
+    def get_file_id(self, fname):
+        """file_id of the file at path `fname` or None, looked up through the file and folder indexes."""
+        dir, file_only = os.path.split(fname)
+        base, extension = os.path.splitext(file_only)
+        sql = """
+            SELECT file_id FROM file
+                WHERE folder_id = (SELECT folder_id FROM folder WHERE name = ? AND missing = 0)
+                    AND basename = ? AND extension = ?
+            """
+        row = self.__cache_db.reader().execute(sql, (dir, base, extension.lstrip("."))).fetchone()
+        return row[0] if row is not None else None
+
+    def get_missing_file_ids(self, file_ids):
+        """The ids of `file_ids` that are no longer in the db."""
+        sql = "SELECT value FROM json_each(?) WHERE value NOT IN (SELECT file_id FROM file)"
+        return [row[0] for row in self.__cache_db.reader().execute(sql, (json.dumps(list(file_ids)),))]
+
+    def get_change_count(self):
+        """A number that goes up whenever files were added, changed, moved or deleted, once the readers
+        can see the change. A playlist built while it had the same value is still complete.
+        """
+        return self.__committed_file_changes
+
     def get_column_names(self):
         sql = "PRAGMA table_info(all_data)"
-        rows = self.__db.execute(sql).fetchall()
+        rows = self.__cache_db.reader().execute(sql).fetchall()
         return [row['name'] for row in rows]
 
     def delete_file_from_db(self, file_id):
         sql_delete_file = "DELETE FROM file WHERE file_id = ?"
         self.__db_write_lock.acquire()
         self.__db.execute(sql_delete_file, (file_id,))
+        self.__file_changes += 1
         self.__db.commit() # Commit immediately for this specific deletion
+        self.__committed_file_changes = self.__file_changes
         self.__db_write_lock.release()
         self.__logger.info("Deleted file_id %s from database.", file_id)
 
-    def __get_geo_location(self, lat, lon):  # TODO periodically check all lat/lon in meta with no location and try again # noqa: E501
-        location = self.__geo_reverse.get_address(lat, lon)
+    def __geo_key(self, lat, lon):
+        # NB same arithmetic as the CAST in __fill_locations()
+        return (self.__geo_grid, int(lat / self.__geo_grid + GEO_GRID_OFFSET),
+                int(lon / self.__geo_grid + GEO_GRID_OFFSET))
+
+    def __get_geo_location(self, lat, lon):
+        """Find the location description of lat, lon in the geo_cache or ask the geocoder, at most
+        once per GEO_REQUEST_INTERVAL. Returns False if there is no description (yet).
+        """
+        key = self.__geo_key(lat, lon)
+        sql = "SELECT description, looked_up FROM geo_cache WHERE grid = ? AND lat_key = ? AND lon_key = ?"
+        row = self.__db.execute(sql, key).fetchone()
+        if row is not None and (row['description'] or time.time() - row['looked_up'] < self.__geo_retry_interval):
+            location = row['description']
+        else:
+            now = time.monotonic()
+            if now < self.__next_geo_request:
+                return False
+            self.__next_geo_request = now + GEO_REQUEST_INTERVAL
+            location = self.__geo_reverse.get_address(lat, lon)
+            if location is None:  # network trouble, not an answer
+                self.__next_geo_request = now + GEO_ERROR_BACKOFF
+                return False
+            self.__db_write_lock.acquire()
+            self.__db.execute("INSERT OR REPLACE INTO geo_cache VALUES(?, ?, ?, ?, ?)", key + (location, time.time()))
+            self.__commit(force=True)
+            self.__db_write_lock.release()
         if len(location) == 0:
-            return False  # TODO this will continue to try even if there is some permanant cause
+            return False
         else:
             sql = "INSERT OR REPLACE INTO location (latitude, longitude, description) VALUES (?, ?, ?)"
             starttime = round(time.time() * 1000)
             self.__db_write_lock.acquire()
             waittime = round(time.time() * 1000)
             self.__db.execute(sql, (lat, lon, location))
+            self.__commit(force=True)  # so the reader connections see it straight away
             self.__db_write_lock.release()
             now = round(time.time() * 1000)
             self.__logger.debug(
@@ -207,7 +721,7 @@ class ImageCache:
                 waittime - starttime, now - waittime)
             return True
 
-    def __create_open_db(self, db_file):
+    def __create_open_db(self, db):
         sql_folder_table = """
             CREATE TABLE IF NOT EXISTS folder (
                 folder_id INTEGER NOT NULL PRIMARY KEY,
@@ -247,6 +761,20 @@ class ImageCache:
                 tags TEXT
             )"""
 
+        # probe results of videos keyed by path, size and mtime. Rows outlive the file record until the
+        # next full scan, so a video that is removed and added again (or re-indexed) isn't probed again
+        sql_video_info_table = """
+            CREATE TABLE IF NOT EXISTS video_info (
+                fname TEXT NOT NULL PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_modified REAL NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                rotation INTEGER DEFAULT 0 NOT NULL,
+                duration REAL,
+                creation_time REAL
+            )"""
+
         sql_meta_index = """
             CREATE INDEX IF NOT EXISTS exif_datetime ON meta (exif_datetime)"""
 
@@ -303,14 +831,68 @@ class ImageCache:
                 DELETE FROM meta WHERE file_id = OLD.file_id;
             END"""
 
-        db = sqlite3.connect(db_file, check_same_thread=False)
-        db.row_factory = sqlite3.Row  # make results accessible by field name
-        for item in (sql_folder_table, sql_file_table, sql_meta_table, sql_location_table, sql_meta_index,
-                     sql_all_data_view, sql_db_info_table, sql_clean_file_trigger, sql_clean_meta_trigger):
+        # readers don't wait for the writer in WAL mode and a commit doesn't need an fsync of the main db
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = NORMAL")
+        for item in (sql_folder_table, sql_file_table, sql_meta_table, sql_video_info_table, sql_location_table,
+                     sql_meta_index, sql_all_data_view, sql_db_info_table,
+                     sql_clean_file_trigger, sql_clean_meta_trigger):
             db.execute(item)
 
         return db
 
+    def __create_fts(self):
+        """Full text index over tags, caption, title and location description of every file, kept
+        up to date by triggers on meta and location. It is optional and not part of the schema
+        version: without FTS5 in the sqlite3 library this returns False and the filters use LIKE.
+        """
+        if self.__db.execute("SELECT 1 FROM sqlite_master WHERE name = 'meta_fts'").fetchone() is not None:
+            return True
+        try:
+            self.__db.execute("""
+                CREATE VIRTUAL TABLE meta_fts USING fts5(
+                    tags, caption, title, location, tokenize = 'unicode61 remove_diacritics 2'
+                )""")
+        except sqlite3.OperationalError as e:
+            self.__logger.info('No full text index, filters will use LIKE: %s', e)
+            return False
+
+        # rowid is the file_id. meta and location rows are written with INSERT OR REPLACE, which
+        # doesn't fire delete triggers, so the insert triggers replace the index entry themselves.
+        fts_row = """
+                INSERT OR REPLACE INTO meta_fts(rowid, tags, caption, title, location)
+                    VALUES(NEW.file_id, NEW.tags, NEW.caption, NEW.title,
+                        (SELECT description FROM location
+                            WHERE latitude = NEW.latitude AND longitude = NEW.longitude));"""
+        fts_location = """
+                UPDATE meta_fts SET location = {0}
+                    WHERE rowid IN (SELECT file_id FROM meta
+                                        WHERE latitude = {1}.latitude AND longitude = {1}.longitude);"""
+        for item in (
+                "CREATE TRIGGER IF NOT EXISTS Fts_Meta_Insert AFTER INSERT ON meta BEGIN {} END".format(fts_row),
+                "CREATE TRIGGER IF NOT EXISTS Fts_Meta_Update AFTER UPDATE ON meta BEGIN {} END".format(fts_row),
+                """CREATE TRIGGER IF NOT EXISTS Fts_Meta_Delete AFTER DELETE ON meta BEGIN
+                    DELETE FROM meta_fts WHERE rowid = OLD.file_id; END""",
+                "CREATE TRIGGER IF NOT EXISTS Fts_Location_Insert AFTER INSERT ON location BEGIN {} END".format(
+                    fts_location.format("NEW.description", "NEW")),
+                "CREATE TRIGGER IF NOT EXISTS Fts_Location_Update AFTER UPDATE ON location BEGIN {} END".format(
+                    fts_location.format("NEW.description", "NEW")),
+                "CREATE TRIGGER IF NOT EXISTS Fts_Location_Delete AFTER DELETE ON location BEGIN {} END".format(
+                    fts_location.format("NULL", "OLD"))):
+            self.__db.execute(item)
+        self.__db.execute("""
+            INSERT INTO meta_fts(rowid, tags, caption, title, location)
+                SELECT meta.file_id, meta.tags, meta.caption, meta.title, location.description
+                    FROM meta LEFT JOIN location
+                        ON location.latitude = meta.latitude AND location.longitude = meta.longitude""")
+        self.__db.commit()
+        self.__logger.info('Created the full text index')
+        return True
+
+    def fts_available(self):
+        """True if the meta_fts full text index can be used by the filters."""
+        return self.__fts
+
     def __update_schema(self, required_db_schema_version):
         sql_select = "SELECT schema_version from db_info"
         schema_version = self.__db.execute(sql_select).fetchone()
@@ -355,101 +937,249 @@ class ImageCache:
                 self.__db.execute("ALTER TABLE file ADD COLUMN displayed_count INTEGER default 0 NOT NULL")
                 self.__db.execute("ALTER TABLE file ADD COLUMN last_displayed REAL DEFAULT 0 NOT NULL")
 
-            # Finally, update the db's schema version stamp to the app's requested version
+            if schema_version <= 3:
+                # Migrate to db schema v4
+                # Identify files by size, inode and a partial content hash to recognise moved files and duplicates.
+                # Existing rows get size and inode at the next full scan, the hash when they are indexed again.
+                self.__db.execute("ALTER TABLE file ADD COLUMN size INTEGER")
+                self.__db.execute("ALTER TABLE file ADD COLUMN inode INTEGER")
+                self.__db.execute("ALTER TABLE file ADD COLUMN content_hash TEXT")
+                self.__db.execute("CREATE INDEX IF NOT EXISTS file_size ON file (size)")
+
+            if schema_version <= 4:
+                # Migrate to db schema v5
+                # Expose the folder path in the all_data view. Albums are selected with a range over
+                # folder.name (see query_filter.path_filter()), which is answered by the folder's unique name index
+                # instead of building and matching fname for every file.
+                self.__db.execute("DROP VIEW all_data")
+                self.__db.execute("""
+                    CREATE VIEW IF NOT EXISTS all_data
+                    AS
+                    SELECT
+                        folder.name || "/" || file.basename || "." || file.extension AS fname,
+                        folder.name AS folder,
+                        file.last_modified,
+                        meta.*,
+                        meta.height > meta.width as is_portrait,
+                        location.description as location
+                    FROM file
+                        INNER JOIN folder
+                            ON folder.folder_id = file.folder_id
+                        LEFT JOIN meta
+                            ON file.file_id = meta.file_id
+                        LEFT JOIN location
+                            ON location.latitude = meta.latitude AND location.longitude = meta.longitude
+                    WHERE folder.missing = 0
+                    """)
+
+            if schema_version <= 5:
+                # Migrate to db schema v6
+                # Indexes for the playlist sorts on last_modified (recent_n) and rating. file.folder_id and the
+                # location join are already covered by the UNIQUE indexes of file and location.
+                self.__db.execute("CREATE INDEX IF NOT EXISTS file_last_modified ON file (last_modified)")
+                self.__db.execute("CREATE INDEX IF NOT EXISTS meta_rating ON meta (rating)")
+
+            if schema_version <= 6:
+                # Migrate to db schema v7
+                # Reverse geocoding results per grid cell, including places without an address, so nearby
+                # photos share one lookup and failed ones are only retried after geo_retry_interval.
+                self.__db.execute("""
+                    CREATE TABLE IF NOT EXISTS geo_cache (
+                        grid REAL NOT NULL,
+                        lat_key INTEGER NOT NULL,
+                        lon_key INTEGER NOT NULL,
+                        description TEXT NOT NULL,
+                        looked_up REAL NOT NULL,
+                        PRIMARY KEY (grid, lat_key, lon_key)
+                    )""")
+
+            if schema_version <= 7:
+                # Migrate to db schema v8
+                # File counts per album (picture_dir/year/album), so group_by_dir picks its albums without walking
+                # the picture directory. Replaced by the folder_count table in v12.
+                self.__db.execute("""
+                    CREATE TABLE IF NOT EXISTS album (
+                        name TEXT NOT NULL PRIMARY KEY,
+                        image_count INTEGER DEFAULT 0 NOT NULL,
+                        video_count INTEGER DEFAULT 0 NOT NULL,
+                        pending INTEGER DEFAULT 0 NOT NULL
+                    )""")
+
+            if schema_version <= 8:
+                # Migrate to db schema v9
+                # Unix time the last full reconciliation finished, so restarting doesn't start another one.
+                self.__db.execute("ALTER TABLE db_info ADD COLUMN last_full_scan REAL DEFAULT 0 NOT NULL")
+
+            if schema_version <= 9:
+                # Migrate to db schema v10
+                # The move detection index also covers the content hash, which serves the duplicate query.
+                # file_last_modified goes: the playlist queries are driven by the folder range of
+                # query_filter.path_filter(), so SQLite never picked it and it only slowed down every write.
+                self.__db.execute("DROP INDEX IF EXISTS file_size")
+                self.__db.execute("CREATE INDEX IF NOT EXISTS file_identity ON file (size, content_hash)")
+                self.__db.execute("DROP INDEX IF EXISTS file_last_modified")
+
+            if schema_version <= 10:
+                # Migrate to db schema v11
+                # The full text index triggers on location look up the meta rows at that position, without
+                # the index every geocoding result (and every row of a location backfill) scanned all of meta.
+                self.__db.execute("CREATE INDEX IF NOT EXISTS meta_position ON meta (latitude, longitude)")
+
+            if schema_version <= 11:
+                # Migrate to db schema v12
+                # The album table had its albums at a fixed depth below picture_dir, but they are the folders
+                # year/album below the subdirectory in use. The file counts are kept per folder instead and
+                # get_albums() adds them up. Filled by __check_folder_counts().
+                self.__db.execute("DROP TABLE IF EXISTS album")
+                self.__db.execute("""
+                    CREATE TABLE IF NOT EXISTS folder_count (
+                        name TEXT NOT NULL PRIMARY KEY,
+                        image_count INTEGER DEFAULT 0 NOT NULL,
+                        video_count INTEGER DEFAULT 0 NOT NULL,
+                        pending INTEGER DEFAULT 0 NOT NULL
+                    )""")
+
+            # Finally, update the db's schema version stamp to the app's requested version. This also
+            # resets last_full_scan, after an upgrade the db is reconciled with the disk once.
             self.__db.execute('DELETE FROM db_info')
-            self.__db.execute('INSERT INTO db_info VALUES(?)', (required_db_schema_version,))
+            self.__db.execute('INSERT INTO db_info(schema_version) VALUES(?)', (required_db_schema_version,))
             self.__db.commit()
 
-    # --- Returns a set of folders matching any of
-    #     - Found on disk, but not currently in the 'folder' table
-    #     - Found on disk, but newer than the associated record in the 'folder' table
-    #     - Found on disk, but flagged as 'missing' in the 'folder' table
-    # --- Note that all folders returned currently exist on disk
-    def __get_modified_folders(self):
+    # --- Compares the folders and files on disk below `top` with the manifest held in the db and returns
+    #     - the folders found on disk, but not in the 'folder' table, newer than their record or flagged 'missing'
+    #     - the FileStat of every media file in those folders that is new or newer than in the 'file' table
+    #     - the folder_ids of folders below `top` that are no longer on disk
+    #     - the file_ids of files in the changed folders that are no longer on disk
+    # --- The 'folder' table is read once per call and each changed folder's files with one query, the
+    # --- comparison itself is done with dicts and sets.
+    def __get_modified_folders_and_files(self, top=None, full=False):
+        """Diff the folders below `top` against the db. Only folders whose mtime changed are
+        listed file by file, unless `full` is set, which also catches files replaced in place
+        without touching the folder. Files and folders missing on disk are returned as deleted
+        ids, so there is no separate purge pass over the whole db.
+        """
         out_of_date_folders = []
-        sql_select = "SELECT * FROM folder WHERE name = ?"
-        for dir in [d[0] for d in os.walk(self.__picture_dir, followlinks=self.__follow_links)]:
-            if os.path.basename(dir):
-                if os.path.basename(dir)[0] == '.' or '.tmp' in dir:
-                    continue  # ignore hidden folders and temporary directories
-            mod_tm = int(os.stat(dir).st_mtime)
-            found = self.__db.execute(sql_select, (dir,)).fetchone()
-            if not found or found['last_modified'] < mod_tm or found['missing'] == 1:
-                out_of_date_folders.append((dir, mod_tm))
-        return out_of_date_folders
-
-    def __get_modified_files(self, modified_folders):
         out_of_date_files = []
-        # sql_select = "SELECT fname, last_modified FROM all_data WHERE fname = ? and last_modified >= ?"
-        sql_select = """
-        SELECT file.basename, file.last_modified
-            FROM file
-                INNER JOIN folder
-                    ON folder.folder_id = file.folder_id
-            WHERE file.basename = ? AND file.extension = ? AND folder.name = ? AND file.last_modified >= ?
-        """
-        for dir, _date in modified_folders:
+        deleted_files = []
+        identity_updates = []
+        sql_select_files = """
+            SELECT file_id, basename, extension, last_modified, size, inode FROM file WHERE folder_id = ?"""
+        top = self.__picture_dir if top is None else top
+        folder_manifest = {row['name']: row for row in
+                           self.__db.execute("SELECT folder_id, name, last_modified, missing FROM folder")}
+        seen_folders = set()
+        for dir, mod_tm, entries in folder_scanner.scan_folders(top, self.__follow_links):
+            seen_folders.add(dir)
+            found = folder_manifest.get(dir)
+            if not full and found and found['last_modified'] >= mod_tm and found['missing'] == 0:
+                continue  # unchanged folder, don't stat its files
+            out_of_date_folders.append((dir, mod_tm))
+            file_manifest = {}
+            if found:
+                file_manifest = {(row['basename'], row['extension']): row for row in
+                                 self.__db.execute(sql_select_files, (found['folder_id'],))}
+            on_disk = set()
+            for file_stat in folder_scanner.stat_files(entries):
+                base, extension = os.path.splitext(os.path.basename(file_stat.path))
+                key = (base, extension.lstrip("."))
+                on_disk.add(key)
+                row = file_manifest.get(key)
+                if row is None or row['last_modified'] < file_stat.mtime:
+                    out_of_date_files.append(file_stat)
+                elif row['size'] != file_stat.size or row['inode'] != file_stat.inode:
+                    identity_updates.append((file_stat.size, file_stat.inode, row['file_id']))
+            deleted_files.extend(file_manifest[key]['file_id'] for key in file_manifest.keys() - on_disk)
+
+        prefix = top.rstrip(os.sep) + os.sep
+        deleted_folders = [row['folder_id'] for name, row in folder_manifest.items()
+                           if (name == top or name.startswith(prefix)) and name not in seen_folders]
+        if identity_updates:  # records from before schema v4 or files copied over in place
+            self.__db_write_lock.acquire()
             try:
-                files_in_dir = os.listdir(dir)
-            except FileNotFoundError:
-                self.__logger.warning("Directory not found during scan: %s", dir)
-                continue # Skip to the next directory
-            except NotADirectoryError:
-                self.__logger.warning("Path is not a directory during scan: %s", dir)
-                continue # Skip to the next directory
-            for file in files_in_dir:
-                base, extension = os.path.splitext(file)
-                # have to filter out all the Apple junk
-                if ((extension.lower() in (ImageCache.EXTENSIONS + list(VIDEO_EXTENSIONS))) and
-                        '.AppleDouble' not in dir and not file.startswith('.') and
-                        '.tmp' not in dir and '.tmp' not in file):
-                    full_file = os.path.join(dir, file)
-                    mod_tm = os.path.getmtime(full_file)
-                    found = self.__db.execute(sql_select, (base, extension.lstrip("."), dir, mod_tm)).fetchone()
-                    if not found:
-                        out_of_date_files.append(full_file)
-        return out_of_date_files
-
-    def __insert_file(self, file, file_id=None):
-        file_insert = "INSERT OR REPLACE INTO file(folder_id, basename, extension, last_modified) VALUES((SELECT folder_id from folder where name = ?), ?, ?, ?)"  # noqa: E501
-        file_update = "UPDATE file SET folder_id = (SELECT folder_id from folder where name = ?), basename = ?, extension = ?, last_modified = ? WHERE file_id = ?"  # noqa: E501
+                self.__db.executemany("UPDATE file SET size = ?, inode = ? WHERE file_id = ?", identity_updates)
+            finally:
+                self.__db_write_lock.release()
+        return out_of_date_folders, out_of_date_files, deleted_folders, deleted_files
+
+    def __insert_file(self, file_stat, file_id=None):
+        result = extract_meta(file_stat, self.__ffprobe_path, self.__get_cached_video_info(file_stat))
+        self.__write_files([result], file_id, commit=True)
+
+    def __write_files(self, results, file_id=None, commit=False):
+        """Single writer for the folder, file, meta and video_info tables. Each table gets one
+        executemany for all extract_meta() results, so the write lock is only held for one batch.
+        `file_id` updates an existing record, which is only used for a single result.
+        `commit` makes the result visible to the reader connections straight away.
+        """
+        file_insert = "INSERT OR REPLACE INTO file(folder_id, basename, extension, last_modified, size, inode, content_hash) VALUES((SELECT folder_id from folder where name = ?), ?, ?, ?, ?, ?, ?)"  # noqa: E501
+        file_update = "UPDATE file SET folder_id = (SELECT folder_id from folder where name = ?), basename = ?, extension = ?, last_modified = ?, size = ?, inode = ?, content_hash = ? WHERE file_id = ?"  # noqa: E501
         # Insert the new folder if it's not already in the table. Update the missing field separately.
         folder_insert = "INSERT OR IGNORE INTO folder(name) VALUES(?)"
         folder_update = "UPDATE folder SET missing = 0 where name = ?"
-
-        mod_tm = os.path.getmtime(file)
-        dir, file_only = os.path.split(file)
-        base, extension = os.path.splitext(file_only)
-
-        # Get the file's meta info and build the INSERT statement dynamically
-        meta = {}
-        try:
-            ext = os.path.splitext(file)[1].lower()
-            if ext in VIDEO_EXTENSIONS: # no exif info available
-                meta = self.__get_video_info(file)
+        video_info_insert = "INSERT OR REPLACE INTO video_info VALUES(?, ?, ?, ?, ?, ?, ?, ?)"
+
+        folders = set()
+        file_rows = []
+        meta_rows = {}  # videos and images have different meta columns
+        video_rows = []
+        for file_stat, meta, video_info, content_hash in results:
+            if meta is None:
+                continue
+            if video_info:
+                video_rows.append((file_stat.path, file_stat.size, file_stat.mtime, video_info['width'],
+                                   video_info['height'], video_info.get('rotation', 0),
+                                   video_info.get('duration'), video_info.get('creation_time')))
+            dir, file_only = os.path.split(file_stat.path)
+            base, extension = os.path.splitext(file_only)
+            key = (dir, base, extension.lstrip("."))
+            folders.add((dir,))
+            self.__dirty_folders.add(dir)
+            identity = (file_stat.mtime, file_stat.size, file_stat.inode, content_hash)
+            if file_id is None:
+                file_rows.append(key + identity)
             else:
-                meta = self.__get_exif_info(file)
-        except Exception as e:
-            self.__logger.error("Could not get metadata for '%s'. Skipping file. Error: %s", file, e)
-            return # Skip this file and continue with the next one
+                file_rows.append(key + identity + (file_id,))
+            meta_rows.setdefault(tuple(meta.keys()), []).append(key + tuple(meta.values()))
+        if not file_rows:
+            return
 
-        meta_insert = self.__get_meta_sql_from_dict(meta)
-        vals = list(meta.values())
-        vals.insert(0, file)
-
-        # Insert this file's info into the folder, file, and meta tables
+        # Insert the files' info into the folder, file, and meta tables
         self.__db_write_lock.acquire()
-        self.__db.execute(folder_insert, (dir,))
-        self.__db.execute(folder_update, (dir,))
-        if file_id is None:
-            self.__db.execute(file_insert, (dir, base, extension.lstrip("."), mod_tm))
-        else:
-            self.__db.execute(file_update, (dir, base, extension.lstrip("."), mod_tm, file_id))
         try:
-            self.__db.execute(meta_insert, vals)
-        except:
-            self.__logger.error(f"###FAILED meta_insert = {meta_insert}, vals = {vals}")
-        self.__db_write_lock.release()
+            self.__db.executemany(folder_insert, folders)
+            self.__db.executemany(folder_update, folders)
+            self.__db.executemany(file_insert if file_id is None else file_update, file_rows)
+            self.__db.executemany(video_info_insert, video_rows)
+            for columns, rows in meta_rows.items():
+                meta_insert = self.__get_meta_sql(columns)
+                try:
+                    self.__db.executemany(meta_insert, rows)
+                except sqlite3.Error as e:
+                    self.__logger.error("###FAILED meta_insert = %s, %d files: %s", meta_insert, len(rows), e)
+            self.__update_folder_counts()
+            self.__file_changes += 1
+            self.__commit(force=commit)
+        finally:
+            self.__db_write_lock.release()
+
+    def __get_cached_video_info(self, file_stat):
+        """The probe_video() result of an unchanged video from an earlier index, or None."""
+        if os.path.splitext(file_stat.path)[1].lower() not in VIDEO_EXTENSIONS:
+            return None
+        row = self.__db.execute(
+            "SELECT width, height, rotation, duration, creation_time FROM video_info WHERE fname = ? AND size = ? AND last_modified = ?",  # noqa: E501
+            (file_stat.path, file_stat.size, file_stat.mtime)).fetchone()
+        return dict(row) if row is not None else None
+
+    def __commit(self, force=False):
+        """Commit if the open transaction is older than db_commit_interval. The caller holds
+        __db_write_lock.
+        """
+        now = time.monotonic()
+        if force or now - self.__last_commit >= self.__db_commit_interval:
+            self.__db.commit()
+            self.__last_commit = now
+            self.__committed_file_changes = self.__file_changes
 
     def __update_folder_info(self, folder_collection):
         update_data = []
@@ -460,143 +1190,342 @@ class ImageCache:
         self.__db.executemany(sql, update_data)
         self.__db_write_lock.release()
 
-    def __get_meta_sql_from_dict(self, dict):
-        columns = ', '.join(dict.keys())
-        ques = ', '.join('?' * len(dict.keys()))
-        return 'INSERT OR REPLACE INTO meta(file_id, {0}) VALUES((SELECT file_id from all_data where fname = ?), {1})'.format(columns, ques)  # noqa: E501
-
-    def __purge_missing_files_and_folders(self):
-        # Find folders in the db that are no longer on disk
-        folder_id_list = []
-        for row in self.__db.execute('SELECT folder_id, name from folder'):
-            if not os.path.exists(row['name']):
-                folder_id_list.append([row['folder_id']])
-
-        # Flag or delete any non-existent folders from the db. Note, deleting will automatically
-        # remove orphaned records from the 'file' and 'meta' tables
-        if len(folder_id_list):
-            self.__db_write_lock.acquire()
-            self.__db.executemany('DELETE FROM folder WHERE folder_id = ?', folder_id_list)
-            self.__db_write_lock.release()
-
-        # Find files in the db that are no longer on disk
-        file_id_list = []
-        for row in self.__db.execute('SELECT file_id, fname from all_data'):
-            if not os.path.exists(row['fname']):
-                file_id_list.append([row['file_id']])
+    def __get_meta_sql(self, columns):
+        # look the file up through the unique (folder_id, basename, extension) index, not the all_data view
+        ques = ', '.join('?' * len(columns))
+        return '''INSERT OR REPLACE INTO meta(file_id, {0}) VALUES(
+            (SELECT file_id FROM file WHERE folder_id = (SELECT folder_id FROM folder WHERE name = ?)
+                AND basename = ? AND extension = ?), {1})'''.format(', '.join(columns), ques)
+
+    def __delete_from_db(self, folder_ids, file_ids):
+        # Deleting folders will automatically remove orphaned records from the 'file' and 'meta' tables
+        if not folder_ids and not file_ids:
+            return
+        sql_select = """
+            SELECT name FROM folder WHERE folder_id IN (SELECT value FROM json_each(?))
+                OR folder_id IN (SELECT folder_id FROM file WHERE file_id IN (SELECT value FROM json_each(?)))
+            """
+        for row in self.__db.execute(sql_select, (json.dumps(list(folder_ids)), json.dumps(list(file_ids)))):
+            self.__dirty_folders.add(row['name'])
+        moved = self.__move_files(folder_ids, file_ids)
+        file_ids = [id for id in file_ids if id not in moved]
+        self.__logger.debug('Removing %d folders and %d files from the db', len(folder_ids), len(file_ids))
+        self.__db_write_lock.acquire()
+        self.__db.executemany('DELETE FROM folder WHERE folder_id = ?', [(id,) for id in folder_ids])
+        self.__db.executemany('DELETE FROM file WHERE file_id = ?', [(id,) for id in file_ids])
+        self.__file_changes += 1
+        self.__update_folder_counts()
+        self.__db_write_lock.release()
 
-        # Delete any non-existent files from the db. Note, this will automatically
-        # remove matching records from the 'meta' table as well.
-        if len(file_id_list):
-            self.__db_write_lock.acquire()
-            self.__db.executemany('DELETE FROM file WHERE file_id = ?', file_id_list)
+    def __move_files(self, folder_ids, file_ids):
+        """Look for the files that are about to be deleted among the files waiting to be indexed.
+        A file with the same size and partial hash (renamed, moved or copied, then deleted) just
+        gets its folder and name updated, so its meta data, location and display statistics
+        survive and it isn't read again. Records from before schema v4 have no hash, they match
+        a file with the same inode and mtime: a rename keeps both, a new file that was given the
+        inode of a deleted one has a new mtime. Returns the file_ids that were moved.
+        """
+        if not self.__modified_files:
+            return set()
+        sql_select = """
+            SELECT file_id, size, inode, content_hash, last_modified FROM file
+                WHERE size IS NOT NULL AND (folder_id IN (SELECT value FROM json_each(?))
+                                            OR file_id IN (SELECT value FROM json_each(?)))
+            """
+        candidates = {}
+        for row in self.__db.execute(sql_select, (json.dumps(list(folder_ids)), json.dumps(list(file_ids)))):
+            candidates.setdefault(row['size'], []).append(row)
+        if not candidates:
+            return set()
+
+        moves = []
+        remaining = []
+        for file_stat in self.__modified_files:
+            rows = candidates.get(file_stat.size)
+            match = None
+            if rows:
+                content_hash = folder_scanner.partial_hash(file_stat.path, file_stat.size)
+                for row in rows:
+                    if row['content_hash'] is None:
+                        same_file = row['inode'] == file_stat.inode and row['last_modified'] == file_stat.mtime
+                    else:
+                        same_file = row['content_hash'] == content_hash
+                    if same_file:
+                        match = row
+                        break
+            if match is None:
+                remaining.append(file_stat)
+                continue
+            rows.remove(match)
+            dir, file_only = os.path.split(file_stat.path)
+            base, extension = os.path.splitext(file_only)
+            moves.append((dir, base, extension.lstrip("."), file_stat.mtime, file_stat.inode, content_hash,
+                          match['file_id']))
+        if not moves:
+            return set()
+
+        self.__logger.info('%d files were moved or renamed, keeping their meta data', len(moves))
+        self.__modified_files = remaining
+        self.__dirty_folders.update(move[0] for move in moves)
+        self.__file_changes += 1
+        self.__db_write_lock.acquire()
+        try:
+            self.__db.executemany("INSERT OR IGNORE INTO folder(name) VALUES(?)", {(move[0],) for move in moves})
+            # OR REPLACE: a stale record under the new name gives way to the moved one
+            self.__db.executemany("""
+                UPDATE OR REPLACE file SET folder_id = (SELECT folder_id FROM folder WHERE name = ?),
+                    basename = ?, extension = ?, last_modified = ?, inode = ?, content_hash = ?
+                    WHERE file_id = ?""", moves)
+        finally:
             self.__db_write_lock.release()
+        return {move[-1] for move in moves}
 
-    def __get_exif_info(self, file_path_name):
-        exifs = get_image_meta.GetImageMeta(file_path_name)
-        # Dict to store interesting EXIF data
-        # Note, the 'key' must match a field in the 'meta' table
-        e = {}
-
-        e['orientation'] = exifs.get_orientation()
-
-        width, height = exifs.size
-        ext = os.path.splitext(file_path_name)[1].lower()
-        if ext not in ('.heif', '.heic') and e['orientation'] in (5, 6, 7, 8):
-            width, height = height, width  # swap values
-        e['width'] = width
-        e['height'] = height
-
-        e['f_number'] = exifs.get_exif('EXIF FNumber')
-        e['make'] = exifs.get_exif('Image Make')
-        e['model'] = exifs.get_exif('Image Model')
-        e['exposure_time'] = exifs.get_exif('EXIF ExposureTime')
-        e['iso'] = exifs.get_exif('EXIF ISOSpeedRatings')
-        e['focal_length'] = exifs.get_exif('EXIF FocalLength')
-        e['rating'] = exifs.get_exif('Image Rating')
-        e['lens'] = exifs.get_exif('EXIF LensModel')
-        e['exif_datetime'] = None
-        val = exifs.get_exif('EXIF DateTimeOriginal')
-        if val is not None:
-            # Remove any subsecond portion of the DateTimeOriginal value. According to the spec, it's
-            # not valid here anyway (should be in SubSecTimeOriginal), but it does exist sometimes.
-            val = val.split('.', 1)[0]
-            try:
-                e['exif_datetime'] = time.mktime(time.strptime(val, '%Y:%m:%d %H:%M:%S'))
-            except Exception:
-                pass
-
-        # If we still don't have a date/time, just use the file's modificaiton time
-        if e['exif_datetime'] is None:
-            e['exif_datetime'] = os.path.getmtime(file_path_name)
-
-        gps = exifs.get_location()
-        lat = gps['latitude']
-        lon = gps['longitude']
-        e['latitude'] = round(lat, 4) if lat is not None else lat  # TODO sqlite requires (None,) to insert NULL
-        e['longitude'] = round(lon, 4) if lon is not None else lon
-
-        # IPTC
-        e['tags'] = exifs.get_exif('IPTC Keywords')
-        e['title'] = exifs.get_exif('IPTC Object Name')
-        e['caption'] = exifs.get_exif('IPTC Caption/Abstract')
-
-        return e
-
-    def __get_video_info(self, file_path_name: str) -> dict:
+    def __check_folder_counts(self):
+        """Fill the folder_count table from the indexed folders after the schema v12 migration. From
+        then on it is kept up to date as files are written or deleted.
         """
-        Extracts metadata information from a video file.
-
-        This method retrieves video metadata using the `get_video_info` function and 
-        organizes it into a dictionary. The metadata includes dimensions, orientation, 
-        and other optional EXIF and IPTC data if available.
+        if self.__db.execute("SELECT 1 FROM folder_count LIMIT 1").fetchone() is not None or \
+                self.__db.execute("SELECT 1 FROM file LIMIT 1").fetchone() is None:
+            return
+        self.__dirty_folders.update(row['name'] for row in self.__db.execute("SELECT name FROM folder"))
+        self.__update_folder_counts()
+        self.__db.commit()
+        self.__logger.info('Rebuilt the folder_count table')
 
-        Args:
-            file_path_name (str): The full path to the video file.
+    def __update_pending_counts(self):
+        """Count the files waiting to be indexed per folder, so albums that are only partly indexed or
+        not yet at all can be told apart from empty ones.
+        """
+        pending = Counter(os.path.dirname(f.path) for f in self.__modified_files)
+        was_pending = {row['name'] for row in self.__db.execute("SELECT name FROM folder_count WHERE pending > 0")}
+        self.__dirty_folders.update(was_pending.union(pending))
+        self.__pending_files = pending
+        self.__db_write_lock.acquire()
+        try:
+            self.__update_folder_counts()
+        finally:
+            self.__db_write_lock.release()
 
-        Returns:
-            dict: A dictionary containing the meta keys.
-            Note, the 'key' must match a field in the 'meta' table
+    def __update_folder_counts(self):
+        """Recount the files of the folders that changed. The caller holds __db_write_lock."""
+        if not self.__dirty_folders:
+            return
+        videos = ", ".join("'{}'".format(ext.lstrip('.')) for ext in VIDEO_EXTENSIONS)
+        sql_count = """
+            SELECT count(file.file_id), total(lower(file.extension) IN ({})) FROM folder
+                INNER JOIN file ON file.folder_id = folder.folder_id
+                WHERE folder.name = ?
+            """.format(videos)
+        replace = []
+        delete = []
+        for folder in self.__dirty_folders:
+            files, video_count = self.__db.execute(sql_count, (folder,)).fetchone()
+            pending = max(0, self.__pending_files.get(folder, 0))
+            if files or pending:
+                replace.append((folder, files - int(video_count), int(video_count), pending))
+            else:
+                delete.append((folder,))
+        self.__db.executemany("INSERT OR REPLACE INTO folder_count VALUES(?, ?, ?, ?)", replace)
+        self.__db.executemany("DELETE FROM folder_count WHERE name = ?", delete)
+        self.__dirty_folders.clear()
+
+    def get_albums(self, top):
+        """Name, image_count, video_count and pending (files found on disk, not indexed yet) of
+        the albums below `top`, the folders ALBUM_DEPTH levels down with their sub folders, by name.
         """
-        meta = get_image_meta.get_video_info(file_path_name, self.__ffprobe_path)
-        if not meta: # If ffprobe failed, meta will be an empty dict
-            self.__logger.warning("Could not extract video metadata for '%s'. Skipping.", file_path_name)
-            # We need to raise an exception to be caught by the caller to stop processing this file.
-            raise ValueError("Empty metadata returned from get_video_info")
-
-        # Dict to store interesting EXIF data
-        # Note, the 'key' must match a field in the 'meta' table
-        e: dict = {}
-
-        # Orientation is set to 1 by default from get_video_info, but can be overridden.
-        e['orientation'] = meta.get('orientation', 1)
-
-        width = meta.get('width', 0)
-        height = meta.get('height', 0)
-        e['width'] = width
-        e['height'] = height
-
-        # Attempt to retrieve additional metadata if available in meta
-        e['f_number'] = meta.get('f_number')
-        e['make'] = meta.get('make')
-        e['model'] = meta.get('model')
-        e['exposure_time'] = meta.get('exposure_time')
-        e['iso'] = meta.get('iso')
-        e['focal_length'] = meta.get('focal_length')
-        e['rating'] = meta.get('rating')
-        e['lens'] = meta.get('lens')
-        e['exif_datetime'] = meta.get('exif_datetime')
-        if e['exif_datetime'] is None:
-            e['exif_datetime'] = os.path.getmtime(file_path_name)
-
-        lat = meta.get('latitude')
-        lon = meta.get('longitude')
-        e['latitude'] = round(lat, 4) if lat is not None else lat  # TODO sqlite requires (None,) to insert NULL
-        e['longitude'] = round(lon, 4) if lon is not None else lon
-
-        # IPTC
-        e['tags'] = meta.get('tags')
-        e['title'] = meta.get('title')
-        e['caption'] = meta.get('caption')
-
-        return e
+        top = top.rstrip('/')
+        sql = "SELECT * FROM folder_count WHERE name >= ? AND name < ?"
+        albums = {}
+        for row in self.__cache_db.reader().execute(sql, (top + '/', top + '0')):
+            parts = row['name'][len(top) + 1:].split('/')
+            if len(parts) < ALBUM_DEPTH:
+                continue  # not in an album
+            name = top + '/' + '/'.join(parts[:ALBUM_DEPTH])
+            album = albums.setdefault(name, {'name': name, 'image_count': 0, 'video_count': 0, 'pending': 0})
+            for key in ('image_count', 'video_count', 'pending'):
+                album[key] += row[key]
+        return sorted(albums.values(), key=lambda album: album['name'])
+
+    def count_album_files(self, albums, where_clause='1', params=()):
+        """Number of files of each of `albums` that `where_clause` selects, see query_cache()."""
+        sql = "SELECT album.value, count(*) FROM {} WHERE {} GROUP BY album.key".format(ALBUM_JOIN, where_clause)
+        counts = dict.fromkeys(albums, 0)
+        counts.update(self.__cache_db.reader().execute(sql, (json.dumps(list(albums)),) + tuple(params)).fetchall())
+        return counts
+
+    def get_duplicate_files(self):
+        """Lists of the paths of files with the same size and partial content hash."""
+        sql = """
+            SELECT folder.name || "/" || file.basename || "." || file.extension AS fname, file.content_hash
+                FROM file INNER JOIN folder ON folder.folder_id = file.folder_id
+                WHERE (file.size, file.content_hash) IN
+                    (SELECT size, content_hash FROM file WHERE content_hash IS NOT NULL
+                        GROUP BY size, content_hash HAVING count(*) > 1)
+                ORDER BY file.content_hash, fname
+            """
+        duplicates = {}
+        for row in self.__cache_db.reader().execute(sql):
+            duplicates.setdefault(row['content_hash'], []).append(row['fname'])
+        return list(duplicates.values())
+
+    def __purge_paths(self, files, dirs):
+        """Remove files and folder trees that are known to be gone, e.g. from inotify events."""
+        file_select = """
+            SELECT file_id FROM file
+                WHERE folder_id = (SELECT folder_id FROM folder WHERE name = ?) AND basename = ? AND extension = ?
+            """
+        folder_select = "SELECT folder_id FROM folder WHERE name = ? OR (name >= ? AND name < ?)"
+        file_list = []
+        for file in files:
+            dir, file_only = os.path.split(file)
+            base, extension = os.path.splitext(file_only)
+            file_list.append((dir, base, extension.lstrip(".")))
+        folder_list = [(dir, dir + '/', dir + '0') for dir in dirs]  # the folder and everything below
+        if not file_list and not folder_list:
+            return
+        # don't try to insert anything that has just gone away
+        gone = set(files)
+        prefixes = tuple(dir + os.sep for dir in dirs)
+        self.__modified_files = [f for f in self.__modified_files
+                                 if f.path not in gone and not (prefixes and f.path.startswith(prefixes))]
+        file_ids = [row[0] for key in file_list for row in self.__db.execute(file_select, key)]
+        folder_ids = [row[0] for key in folder_list for row in self.__db.execute(folder_select, key)]
+        self.__delete_from_db(folder_ids, file_ids)
+
+
+def get_exif_info(file_path_name, mod_tm=None):
+    exifs = get_image_meta.GetImageMeta(file_path_name)
+    # Dict to store interesting EXIF data
+    # Note, the 'key' must match a field in the 'meta' table
+    e = {}
+
+    e['orientation'] = exifs.get_orientation()
+
+    width, height = exifs.size
+    ext = os.path.splitext(file_path_name)[1].lower()
+    if ext not in ('.heif', '.heic') and e['orientation'] in (5, 6, 7, 8):
+        width, height = height, width  # swap values
+    e['width'] = width
+    e['height'] = height
+
+    e['f_number'] = exifs.get_exif('EXIF FNumber')
+    e['make'] = exifs.get_exif('Image Make')
+    e['model'] = exifs.get_exif('Image Model')
+    e['exposure_time'] = exifs.get_exif('EXIF ExposureTime')
+    e['iso'] = exifs.get_exif('EXIF ISOSpeedRatings')
+    e['focal_length'] = exifs.get_exif('EXIF FocalLength')
+    e['rating'] = exifs.get_exif('Image Rating')
+    e['lens'] = exifs.get_exif('EXIF LensModel')
+    e['exif_datetime'] = None
+    val = exifs.get_exif('EXIF DateTimeOriginal')
+    if val is not None:
+        # Remove any subsecond portion of the DateTimeOriginal value. According to the spec, it's
+        # not valid here anyway (should be in SubSecTimeOriginal), but it does exist sometimes.
+        val = val.split('.', 1)[0]
+        try:
+            e['exif_datetime'] = time.mktime(time.strptime(val, '%Y:%m:%d %H:%M:%S'))
+        except Exception:
+            pass
+
+    # If we still don't have a date/time, just use the file's modificaiton time
+    if e['exif_datetime'] is None:
+        e['exif_datetime'] = mod_tm if mod_tm is not None else os.path.getmtime(file_path_name)
+
+    gps = exifs.get_location()
+    lat = gps['latitude']
+    lon = gps['longitude']
+    e['latitude'] = round(lat, 4) if lat is not None else lat  # TODO sqlite requires (None,) to insert NULL
+    e['longitude'] = round(lon, 4) if lon is not None else lon
+
+    # IPTC
+    e['tags'] = exifs.get_exif('IPTC Keywords')
+    e['title'] = exifs.get_exif('IPTC Object Name')
+    e['caption'] = exifs.get_exif('IPTC Caption/Abstract')
+
+    return e
+
+def get_video_meta(file_path_name: str, ffprobe_path: Optional[str] = None,
+                   mod_tm: Optional[float] = None, video_info: Optional[dict] = None) -> dict:
+    """
+    Extracts metadata information from a video file.
+
+    This function retrieves video metadata using the `get_video_info` function and 
+    organizes it into a dictionary. The metadata includes dimensions, orientation, 
+    and other optional EXIF and IPTC data if available.
+
+    Args:
+        file_path_name (str): The full path to the video file.
+        ffprobe_path (Optional[str]): ffprobe executable, None to use the one on the PATH.
+        mod_tm (Optional[float]): The file's modification time, used if the video has no creation time.
+        video_info (Optional[dict]): A cached get_image_meta.probe_video() result, None to probe the file.
+
+    Returns:
+        dict: A dictionary containing the meta keys.
+        Note, the 'key' must match a field in the 'meta' table
+    """
+    meta = get_image_meta.get_video_info(file_path_name, ffprobe_path, video_info)
+    if not meta: # If ffprobe failed, meta will be an empty dict
+        logging.getLogger("image_cache.ImageCache").warning("Could not extract video metadata for '%s'. Skipping.",
+                                                            file_path_name)
+        # We need to raise an exception to be caught by the caller to stop processing this file.
+        raise ValueError("Empty metadata returned from get_video_info")
+
+    # Dict to store interesting EXIF data
+    # Note, the 'key' must match a field in the 'meta' table
+    e: dict = {}
+
+    # Orientation is set to 1 by default from get_video_info, but can be overridden.
+    e['orientation'] = meta.get('orientation', 1)
+
+    width = meta.get('width', 0)
+    height = meta.get('height', 0)
+    e['width'] = width
+    e['height'] = height
+
+    # Attempt to retrieve additional metadata if available in meta
+    e['f_number'] = meta.get('f_number')
+    e['make'] = meta.get('make')
+    e['model'] = meta.get('model')
+    e['exposure_time'] = meta.get('exposure_time')
+    e['iso'] = meta.get('iso')
+    e['focal_length'] = meta.get('focal_length')
+    e['rating'] = meta.get('rating')
+    e['lens'] = meta.get('lens')
+    e['exif_datetime'] = meta.get('exif_datetime')
+    if e['exif_datetime'] is None:
+        e['exif_datetime'] = mod_tm if mod_tm is not None else os.path.getmtime(file_path_name)
+
+    lat = meta.get('latitude')
+    lon = meta.get('longitude')
+    e['latitude'] = round(lat, 4) if lat is not None else lat  # TODO sqlite requires (None,) to insert NULL
+    e['longitude'] = round(lon, 4) if lon is not None else lon
+
+    # IPTC
+    e['tags'] = meta.get('tags')
+    e['title'] = meta.get('title')
+    e['caption'] = meta.get('caption')
+
+    return e
+
+
+def extract_meta(file_stat, ffprobe_path=None, video_info=None):
+    """Read the meta data of one file. This runs in the indexing worker processes, so it
+    has to be a picklable module level function without access to the db.
+
+    Returns an IndexResult, its meta is None if the file can't be read. video_info is the
+    probe result of a video, to be kept in the video_info table.
+    """
+    file = file_stat.path
+    try:
+        ext = os.path.splitext(file)[1].lower()
+        if ext in VIDEO_EXTENSIONS: # no exif info available
+            if video_info is None:
+                video_info = get_image_meta.probe_video(file, ffprobe_path)
+            meta = get_video_meta(file, ffprobe_path, file_stat.mtime, video_info)
+        else:
+            meta = get_exif_info(file, file_stat.mtime)
+    except Exception as e:
+        logging.getLogger("image_cache.ImageCache").error(
+            "Could not get metadata for '%s'. Skipping file. Error: %s", file, e)
+        return IndexResult(file_stat, None, None, None) # Skip this file and continue with the next one
+    return IndexResult(file_stat, meta, video_info, folder_scanner.partial_hash(file, file_stat.size))
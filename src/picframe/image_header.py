@@ -0,0 +1,289 @@
+"""
+Header only meta data reader for JPEG and HEIF files.
+
+Indexing only needs the size, the orientation and a handful of EXIF and IPTC
+fields, all of which are stored in front of the compressed image data. `read_header`
+seeks from segment to segment (JPEG) or box to box (HEIF) and only reads the parts it
+needs, so no pixel data is read or decoded. It returns None for other formats or
+anything it can't make sense of, the caller then falls back to a full decode.
+"""
+import os
+import struct
+import logging
+from collections import namedtuple
+
+HEADER_LIMIT = 4 * 1024 * 1024  # give up if the image size hasn't turned up by then
+META_LIMIT = 1024 * 1024  # largest HEIF meta box or EXIF block that is read into memory
+
+# width and height are as displayed for HEIF (irot applied) but as stored for JPEG,
+# where the EXIF orientation still has to be applied by the caller.
+ImageHeader = namedtuple('ImageHeader', ['format', 'width', 'height', 'exif', 'iptc'])
+
+# IPTC IIM application record datasets, named like the exifread tags they replace
+IPTC_DATASETS = {5: 'IPTC Object Name', 25: 'IPTC Keywords', 120: 'IPTC Caption/Abstract'}
+
+JPEG_SOF = frozenset((0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF))
+JPEG_SOS = 0xDA
+JPEG_EOI = 0xD9
+JPEG_APP1 = 0xE1
+JPEG_APP13 = 0xED
+HEIF_BRANDS = frozenset((b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx', b'mif1', b'msf1', b'avif'))
+
+logger = logging.getLogger("image_header")
+
+
+def read_header(file_path_name):
+    """ImageHeader of a JPEG or HEIF file or None if it has to be decoded."""
+    try:
+        with open(file_path_name, 'rb') as f:
+            start = f.read(12)
+            if start[:2] == b'\xff\xd8':
+                return _read_jpeg(f)
+            if start[4:8] == b'ftyp' and start[8:12] in HEIF_BRANDS:
+                return _read_heif(f)
+    except (OSError, struct.error, ValueError, IndexError) as e:  # IndexError from truncated IPTC or boxes
+        logger.debug("No header info for %s: %s", file_path_name, e)
+    return None
+
+
+def parse_iptc(data):
+    """Object name, keywords and caption from a Photoshop APP13 block."""
+    iptc = {}
+    pos = data.find(b'8BIM\x04\x04')  # IPTC-NAA resource
+    if pos < 0:
+        return iptc
+    pos += 6
+    name_len = data[pos]
+    pos += 1 + name_len + ((name_len + 1) & 1)  # pascal string, padded to even length
+    size = struct.unpack_from('>I', data, pos)[0]
+    pos += 4
+    end = min(pos + size, len(data))
+    while pos + 5 <= end and data[pos] == 0x1C:
+        record, dataset, length = struct.unpack_from('>BBH', data, pos + 1)
+        pos += 5
+        value = data[pos:pos + length]
+        pos += length
+        key = IPTC_DATASETS.get(dataset) if record == 2 else None
+        if key is None:
+            continue
+        text = value.decode('utf-8', errors='replace')
+        if dataset == 25:
+            iptc.setdefault(key, []).append(text)
+        else:
+            iptc[key] = text
+    if 'IPTC Keywords' in iptc:
+        iptc['IPTC Keywords'] = ", ".join(iptc['IPTC Keywords'])
+    return iptc
+
+
+def _read_jpeg(f):
+    f.seek(2)
+    exif = None
+    iptc = {}
+    while f.tell() < HEADER_LIMIT:
+        marker = f.read(2)
+        if len(marker) < 2:
+            return None
+        if marker[0] != 0xFF:
+            return None  # lost sync, let the full decoder deal with it
+        code = marker[1]
+        if code == 0xFF:
+            f.seek(-1, os.SEEK_CUR)  # fill byte
+            continue
+        if code == JPEG_SOS or code == JPEG_EOI:
+            return None  # no SOF in front of the image data
+        if 0xD0 <= code <= 0xD7 or code == 0x01:
+            continue  # markers without a length
+        length = struct.unpack('>H', f.read(2))[0]
+        if length < 2:
+            return None
+        if code in JPEG_SOF:
+            height, width = struct.unpack('>xHH', f.read(5))
+            return ImageHeader('JPEG', width, height, exif, iptc)
+        if code == JPEG_APP1 and exif is None:
+            data = f.read(length - 2)
+            if data[:6] == b'Exif\x00\x00':
+                exif = data[6:]  # a TIFF stream
+        elif code == JPEG_APP13 and not iptc:
+            data = f.read(length - 2)
+            if data.startswith(b'Photoshop 3.0\x00'):
+                iptc = parse_iptc(data)
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+    return None
+
+
+def iter_boxes(data, pos=0, end=None):
+    """Yield (type, payload start, payload end) of the ISO BMFF boxes in data[pos:end]."""
+    end = len(data) if end is None else end
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def _read_heif(f):
+    f.seek(0)
+    meta = None
+    while f.tell() < HEADER_LIMIT:
+        head = f.read(8)
+        if len(head) < 8:
+            return None
+        size, box_type = struct.unpack('>I4s', head)
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header = 16
+        if size < header:
+            return None
+        if box_type == b'meta':
+            if size > META_LIMIT:
+                return None
+            meta = f.read(size - header)
+            break
+        f.seek(size - header, os.SEEK_CUR)
+    if meta is None:
+        return None
+
+    primary = None
+    properties = []
+    associations = {}
+    infos = {}
+    locations = {}
+    for box_type, start, end in iter_boxes(meta, 4):  # meta is a full box
+        if box_type == b'pitm':
+            primary = struct.unpack_from('>H' if meta[start] == 0 else '>I', meta, start + 4)[0]
+        elif box_type == b'iprp':
+            for sub_type, sub_start, sub_end in iter_boxes(meta, start, end):
+                if sub_type == b'ipco':
+                    properties = list(iter_boxes(meta, sub_start, sub_end))
+                elif sub_type == b'ipma':
+                    associations = _parse_ipma(meta, sub_start)
+        elif box_type == b'iinf':
+            infos = _parse_iinf(meta, start, end)
+        elif box_type == b'iloc':
+            locations = _parse_iloc(meta, start)
+    if primary is None:
+        return None
+
+    width = height = None
+    rotation = 0
+    for index in associations.get(primary, ()):
+        if not 0 < index <= len(properties):
+            continue
+        prop_type, prop_start, _ = properties[index - 1]  # 1 based, 0 means none
+        if prop_type == b'ispe':
+            width, height = struct.unpack_from('>II', meta, prop_start + 4)
+        elif prop_type == b'irot':
+            rotation = meta[prop_start] & 0x03  # anti-clockwise in 90 degree steps
+    if not width or not height:
+        return None
+    if rotation in (1, 3):
+        width, height = height, width
+
+    exif = None
+    exif_items = [item for item, item_type in infos.items() if item_type == b'Exif']
+    if exif_items and exif_items[0] in locations:
+        offset, length = locations[exif_items[0]]
+        if 0 < length <= META_LIMIT:
+            f.seek(offset)
+            data = f.read(length)
+            tiff_offset = struct.unpack_from('>I', data)[0]  # from the end of this field
+            exif = data[4 + tiff_offset:]
+    return ImageHeader('HEIF', width, height, exif, {})
+
+
+def _parse_ipma(data, pos):
+    version, flags = data[pos], int.from_bytes(data[pos + 1:pos + 4], 'big')
+    count = struct.unpack_from('>I', data, pos + 4)[0]
+    pos += 8
+    associations = {}
+    for _ in range(count):
+        if version < 1:
+            item = struct.unpack_from('>H', data, pos)[0]
+            pos += 2
+        else:
+            item = struct.unpack_from('>I', data, pos)[0]
+            pos += 4
+        n = data[pos]
+        pos += 1
+        indices = []
+        for _ in range(n):
+            if flags & 1:
+                indices.append(struct.unpack_from('>H', data, pos)[0] & 0x7FFF)
+                pos += 2
+            else:
+                indices.append(data[pos] & 0x7F)
+                pos += 1
+        associations[item] = indices
+    return associations
+
+
+def _parse_iinf(data, start, end):
+    version = data[start]
+    pos = start + 4 + (2 if version == 0 else 4)  # entry count, the boxes follow anyway
+    infos = {}
+    for box_type, box_start, _ in iter_boxes(data, pos, end):
+        if box_type != b'infe' or data[box_start] < 2:
+            continue
+        if data[box_start] == 2:
+            item, = struct.unpack_from('>H', data, box_start + 4)
+            infos[item] = data[box_start + 8:box_start + 12]
+        else:
+            item, = struct.unpack_from('>I', data, box_start + 4)
+            infos[item] = data[box_start + 10:box_start + 14]
+    return infos
+
+
+def _read_uint(data, pos, size):
+    return int.from_bytes(data[pos:pos + size], 'big') if size else 0
+
+
+def _parse_iloc(data, pos):
+    """item id -> (file offset, length) of the first extent of items stored in the file."""
+    version = data[pos]
+    offset_size, length_size = data[pos + 4] >> 4, data[pos + 4] & 0x0F
+    base_offset_size, index_size = data[pos + 5] >> 4, data[pos + 5] & 0x0F
+    pos += 6
+    if version < 2:
+        count = struct.unpack_from('>H', data, pos)[0]
+        pos += 2
+    else:
+        count = struct.unpack_from('>I', data, pos)[0]
+        pos += 4
+    locations = {}
+    for _ in range(count):
+        if version < 2:
+            item = struct.unpack_from('>H', data, pos)[0]
+            pos += 2
+        else:
+            item = struct.unpack_from('>I', data, pos)[0]
+            pos += 4
+        construction = 0
+        if version in (1, 2):
+            construction = struct.unpack_from('>H', data, pos)[0] & 0x0F
+            pos += 2
+        pos += 2  # data reference index
+        base_offset = _read_uint(data, pos, base_offset_size)
+        pos += base_offset_size
+        extent_count = struct.unpack_from('>H', data, pos)[0]
+        pos += 2
+        extents = []
+        for _ in range(extent_count):
+            if version in (1, 2):
+                pos += index_size
+            extents.append((_read_uint(data, pos, offset_size),
+                            _read_uint(data, pos + offset_size, length_size)))
+            pos += offset_size + length_size
+        if construction == 0 and extents:
+            offset, length = extents[0]
+            locations[item] = (base_offset + offset, length)
+    return locations
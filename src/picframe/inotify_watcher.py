@@ -0,0 +1,224 @@
+"""
+Linux inotify based change detection for the image cache.
+
+The watcher keeps one inotify watch per (non hidden, non temporary) directory below
+the picture folder and translates kernel events into sets of changed and deleted
+paths. It talks to the kernel through ctypes so no extra dependency is needed. On
+systems without inotify `InotifyWatcher.start()` returns False and the caller keeps
+using the periodic full scan.
+"""
+import os
+import ctypes
+import ctypes.util
+import errno
+import logging
+import select
+import struct
+from picframe.folder_scanner import is_ignored_dir
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+# IN_MODIFY is left out on purpose, a file being copied is only of interest once it is closed.
+# IN_ATTRIB catches `cp -p` and `touch`, which change the mtime after the data has been written.
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR)
+
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+READ_SIZE = 64 * 1024
+
+
+class WatcherEvents:
+    """Changes collected from the kernel queue since the last read."""
+
+    def __init__(self):
+        self.changed_files = set()
+        self.deleted_files = set()
+        self.new_dirs = set()
+        self.deleted_dirs = set()
+        self.overflow = False
+
+    def __bool__(self):
+        return bool(self.changed_files or self.deleted_files or self.new_dirs or self.deleted_dirs or self.overflow)
+
+    def file_changed(self, path):
+        self.deleted_files.discard(path)
+        self.changed_files.add(path)
+
+    def file_deleted(self, path):
+        self.changed_files.discard(path)
+        self.deleted_files.add(path)
+
+    def dir_created(self, path):
+        self.deleted_dirs.discard(path)
+        self.new_dirs.add(path)
+
+    def dir_deleted(self, path):
+        self.new_dirs.discard(path)
+        self.deleted_dirs.add(path)
+        prefix = path + os.sep
+        # anything queued below a vanished directory is covered by the directory itself
+        for collection in (self.changed_files, self.deleted_files, self.new_dirs):
+            collection.difference_update([p for p in collection if p.startswith(prefix)])
+
+
+class InotifyWatcher:
+    """Recursive inotify watch on a directory tree."""
+
+    def __init__(self, root, follow_links=False):
+        self.__logger = logging.getLogger("inotify_watcher.InotifyWatcher")
+        self.__root = root
+        self.__follow_links = follow_links
+        self.__fd = None
+        self.__libc = None
+        self.__wd_to_path = {}
+        self.__path_to_wd = {}
+
+    @property
+    def active(self):
+        return self.__fd is not None
+
+    def start(self):
+        """Open the inotify queue and watch the whole tree.
+
+        Returns False if inotify is not available or the watch limit is too low,
+        in which case the watcher is left closed.
+        """
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        except (OSError, AttributeError) as e:
+            self.__logger.warning("inotify is not available on this system: %s", e)
+            return False
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            self.__logger.warning("inotify_init1 failed: %s", os.strerror(ctypes.get_errno()))
+            return False
+        self.__libc = libc
+        self.__fd = fd
+        try:
+            self.add_tree(self.__root)
+        except OSError as e:
+            self.__logger.warning("Could not watch %s, falling back to polling: %s", self.__root, e)
+            self.close()
+            return False
+        self.__logger.info("Watching %d directories below %s", len(self.__path_to_wd), self.__root)
+        return True
+
+    def close(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+        self.__fd = None
+        self.__wd_to_path.clear()
+        self.__path_to_wd.clear()
+
+    def add_tree(self, top):
+        """Watch `top` and every directory below it. Adding an already watched
+        directory is harmless, so this is also used to resync after an overflow.
+        """
+        added = []
+        for dir_path, dir_names, _ in os.walk(top, followlinks=self.__follow_links):
+            dir_names[:] = [d for d in dir_names if not is_ignored_dir(d)]
+            if dir_path != self.__root and is_ignored_dir(os.path.basename(dir_path)):
+                continue
+            if self.__add_watch(dir_path):
+                added.append(dir_path)
+        return added
+
+    def read_events(self, timeout=0.0):
+        """Drain the kernel queue, waiting at most `timeout` seconds for the first event."""
+        events = WatcherEvents()
+        if self.__fd is None:
+            return events
+        ready, _, _ = select.select([self.__fd], [], [], timeout)
+        if not ready:
+            return events
+        while True:
+            try:
+                buf = os.read(self.__fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+            self.__parse(buf, events)
+        if events.overflow:
+            self.__logger.warning("inotify queue overflow, a full rescan is needed")
+        return events
+
+    def __add_watch(self, path):
+        wd = self.__libc.inotify_add_watch(self.__fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return False  # vanished or unreadable in the meantime
+            raise OSError(err, os.strerror(err), path)
+        new = wd not in self.__wd_to_path
+        old_path = self.__wd_to_path.get(wd)
+        if old_path is not None and old_path != path:
+            self.__path_to_wd.pop(old_path, None)  # directory was moved inside the tree
+        self.__wd_to_path[wd] = path
+        self.__path_to_wd[path] = wd
+        return new
+
+    def __forget_tree(self, path):
+        prefix = path + os.sep
+        for p in [p for p in self.__path_to_wd if p == path or p.startswith(prefix)]:
+            wd = self.__path_to_wd.pop(p)
+            if self.__wd_to_path.get(wd) == p:
+                del self.__wd_to_path[wd]
+
+    def __parse(self, buf, events):
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buf):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(buf, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(buf[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                events.overflow = True
+                continue
+            if mask & IN_IGNORED:
+                path = self.__wd_to_path.pop(wd, None)
+                if path is not None and self.__path_to_wd.get(path) == wd:
+                    del self.__path_to_wd[path]
+                continue
+            dir_path = self.__wd_to_path.get(wd)
+            if dir_path is None:
+                continue
+            if mask & IN_DELETE_SELF:
+                if dir_path == self.__root:
+                    events.overflow = True  # the whole library went away, let the full scan sort it out
+                continue
+            if not name:
+                continue
+            path = os.path.join(dir_path, name)
+
+            if mask & IN_ISDIR:
+                if is_ignored_dir(name):
+                    continue
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    events.dir_created(path)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.__forget_tree(path)
+                    events.dir_deleted(path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_ATTRIB):
+                events.file_changed(path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                events.file_deleted(path)
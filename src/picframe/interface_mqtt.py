@@ -266,6 +266,7 @@ class InterfaceMQTT:
         self.__setup_button(client, "next", "mdi:skip-next", available_topic)
 
         client.subscribe(self.__device_id + "/purge_files", qos=0)  # close down without killing!
+        client.subscribe(self.__device_id + "/rescan", qos=0)
         client.subscribe(self.__device_id + "/stop", qos=0)  # close down without killing!
 
     def __get_dev_element(self) -> dict:
@@ -718,6 +719,11 @@ class InterfaceMQTT:
         elif message.topic == self.__device_id + "/purge_files":
             self.__controller.purge_files()
 
+        # index new files now, the payload can limit this to one folder
+        elif message.topic == self.__device_id + "/rescan":
+            self.__logger.info("Recieved rescan: %s", msg)
+            self.__controller.rescan(msg)
+
         # stop loops and end program
         elif message.topic == self.__device_id + "/stop":
             self.__controller.stop()
@@ -773,10 +779,10 @@ class InterfaceMQTT:
         sensor_state_payload["directory"] = actual_dir
         # image counter sensor
         sensor_state_payload["image_counter"] = str(self.__controller.get_number_of_files())
-        # date_from
-        sensor_state_payload["date_from"] = int(self.__controller.date_from)
+        # date_from, 0 when no filter is set
+        sensor_state_payload["date_from"] = int(self.__controller.date_from or 0)
         # date_to
-        sensor_state_payload["date_to"] = int(self.__controller.date_to)
+        sensor_state_payload["date_to"] = int(self.__controller.date_to or 0)
         # location_filter
         sensor_state_payload["location_filter"] = self.__controller.location_filter
         # tags_filter
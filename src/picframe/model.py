@@ -1,13 +1,18 @@
 import yaml
 import os
+import json
 import time
 import logging
+import threading
 import locale
 import random
 import subprocess
-from picframe import geo_reverse, image_cache
+from picframe import geo_reverse, image_cache, query_filter
+from picframe.playback_state import PlaybackState
+from picframe.playlist import Playlist
 
 DEFAULT_CONFIGFILE = "~/picframe_data/config/configuration.yaml"
+SNAPSHOT_CHECK_DELAY = 10.0  # seconds after a warm start before the snapshot is compared with the cache
 DEFAULT_CONFIG = {
     'viewer': {
         'blur_amount': 12,
@@ -93,8 +98,20 @@ DEFAULT_CONFIG = {
         'geo_key': 'this_needs_to@be_changed',  # use your email address
         'db_file': '~/picframe_data/data/pictureframe.db3',
         'portrait_pairs': False,
+        'portrait_pairs_by': 'order',
+        'geo_grid': 0.001,
+        'geo_backend': 'nominatim',
+        'geo_places_file': '~/picframe_data/data/cities1000.txt',
+        'geo_retry_interval': 86400.0,
         'deleted_pictures': '~/DeletedPictures',
         'update_interval': 2.0,
+        'use_inotify': False,
+        'index_workers': 1,
+        'full_scan_interval': 86400,
+        'db_batch_size': 100,
+        'db_commit_interval': 2.0,
+        'max_update_interval': 60.0,
+        'rescan_trigger': '/dev/shm/picframe_rescan',
         'log_level': 'WARNING',
         'log_file': '',
         'location_filter': '',
@@ -104,7 +121,11 @@ DEFAULT_CONFIG = {
         'resume_from_album_subfolder': '', # New option
         'playlist_max_albums': 20,
         'playlist_max_files': 2000,
+        'prefetch_files': 16,
+        'state_db_file': '~/picframe/playback_state.db3',
+        'playlist_snapshot': '~/picframe/playlist_snapshot.bin',
         'video_playback_mode': 'mpv',
+        'video_handoff': 'restart',
         'video_slideshow_step_time': 10.0,
         'video_slideshow_fade_time': 2.0,
         'video_slideshow_time_delay': 4.0,
@@ -150,8 +171,9 @@ class Pic:  # TODO could this be done more elegantly with namedtuple
                  f_number=0, exposure_time=None, iso=0, focal_length=None,
                  make=None, model=None, lens=None, rating=None, latitude=None,
                  longitude=None, width=0, height=0, is_portrait=0, location=None, title=None,
-                 caption=None, tags=None):
+                 caption=None, tags=None, folder=None):
         self.fname = fname
+        self.folder = folder
         self.last_modified = last_modified
         self.file_id = file_id
         self.orientation = orientation
@@ -207,8 +229,10 @@ class Model:
                     root_logger.removeHandler(hdlr)
             root_logger.addHandler(filehandler)      # set the new handler
 
-        self.__file_list = []  # this is now a list of tuples i.e (file_id1,) or (file_id1, file_id2)
+        self.__file_list = Playlist()  # slides of (file_id1,) or (file_id1, file_id2)
         self.__number_of_files = 0  # this is shortcut for len(__file_list)
+        self.__list_changes = None  # image_cache.get_change_count() when the shuffled __file_list was built
+        self.__prefetched = {}  # file_id -> all_data row of the next slides, see __get_file_row()
         self.__reload_files = True
         self.__initial_sync_triggered = False
         self.__file_index = 0  # pointer to next position in __file_list
@@ -223,39 +247,54 @@ class Model:
         self.__pic_dir = os.path.normpath(os.path.expanduser(model_config['pic_dir']))
         self.__subdirectory = os.path.expanduser(model_config['subdirectory'])
         self.__load_geoloc = model_config['load_geoloc']
-        self.__geo_reverse = geo_reverse.GeoReverse(model_config['geo_key'],
-                                                    key_list=self.get_model_config()['key_list'])
+        if model_config['geo_backend'] == 'offline':
+            self.__geo_reverse = geo_reverse.OfflineGeoReverse(model_config['geo_places_file'],
+                                                               key_list=self.get_model_config()['key_list'])
+        else:
+            self.__geo_reverse = geo_reverse.GeoReverse(model_config['geo_key'],
+                                                        key_list=self.get_model_config()['key_list'])
         self.__image_cache = image_cache.ImageCache(self.__pic_dir,
                                                     model_config['follow_links'],
                                                     os.path.expanduser(model_config['db_file']),
                                                     self.__geo_reverse,
                                                     model_config['update_interval'],
                                                     model_config['portrait_pairs'],
-                                                    model_config['ffprobe_path'])
+                                                    model_config['ffprobe_path'],
+                                                    model_config['use_inotify'],
+                                                    model_config['index_workers'],
+                                                    model_config['full_scan_interval'],
+                                                    model_config['db_batch_size'],
+                                                    model_config['db_commit_interval'],
+                                                    model_config['max_update_interval'],
+                                                    model_config['rescan_trigger'],
+                                                    model_config['portrait_pairs_by'],
+                                                    model_config['geo_grid'],
+                                                    model_config['geo_retry_interval'],
+                                                    self.__load_geoloc)
         self.__deleted_pictures = model_config['deleted_pictures']
         self.__no_files_img = os.path.expanduser(model_config['no_files_img'])
         self.__sort_cols = model_config['sort_cols']
         self.__col_names = None
         # init where clauses through setters
-        self.__where_clauses = {}
+        self.__filters = query_filter.FilterSet()
+        self.__date_from = None
+        self.__date_to = None
         self.location_filter = model_config['location_filter']
         self.tags_filter = model_config['tags_filter']
 
         self.__shown_albums_log_path = os.path.expanduser("~/picframe/shown_albums.log")
+        self.__playback_state = PlaybackState(os.path.expanduser(model_config['state_db_file']),
+                                              self.__shown_albums_log_path)
         self.__resume_album = None
-        self.__resume_file = None
-        self.__shown_albums = set()
-        if os.path.exists(self.__shown_albums_log_path):
-            with open(self.__shown_albums_log_path, 'r') as f:
-                lines = [line.strip() for line in f if line.strip()]
-            if lines:
-                last_line = lines[-1]
-                if os.path.isfile(last_line):
-                    self.__resume_file = last_line
-                    self.__shown_albums = set(lines[:-1])
-                else:
-                    self.__shown_albums = set(lines)
+        self.__resume_file = self.__playback_state.current_file
+        if self.__resume_file and not os.path.isfile(self.__resume_file):
+            self.__resume_file = None
+        self.__shown_albums = self.__playback_state.shown_albums()
         self.__current_album_path = None
+        self.__album_batch = []  # albums in the playlist with group_by_dir
+        self.__album_root = os.path.join(self.__pic_dir, self.__subdirectory)  # the picture directory they are below
+        self.__snapshot_path = os.path.expanduser(model_config['playlist_snapshot'])
+        self.__load_snapshot()
 
     def get_viewer_config(self):
         return self.__config['viewer']
@@ -341,7 +380,8 @@ class Model:
     def location_filter(self, val):
         self.__config['model']['location_filter'] = val
         if len(val) > 0:
-            self.set_where_clause("location_filter", self.__build_filter(val, "location"))
+            self.set_where_clause("location_filter",
+                                  query_filter.text_filter(val, "location", self.__image_cache.fts_available()))
         else:
             self.set_where_clause("location_filter")  # remove from where_clause
         self.__reload_files = True
@@ -354,52 +394,131 @@ class Model:
     def tags_filter(self, val):
         self.__config['model']['tags_filter'] = val
         if len(val) > 0:
-            self.set_where_clause("tags_filter", self.__build_filter(val, "tags"))
+            self.set_where_clause("tags_filter",
+                                  query_filter.text_filter(val, "tags", self.__image_cache.fts_available()))
         else:
             self.set_where_clause("tags_filter")  # remove from where_clause
         self.__reload_files = True
 
-    def __build_filter(self, val, field):
-        if val.count("(") != val.count(")"):
-            return None  # this should clear the filter and not raise an error
-        val = val.replace(";", "").replace("'", "").replace("%", "").replace('"', '')  # SQL scrambling
-        tokens = ("(", ")", "AND", "OR", "NOT")  # now copes with NOT
-        val_split = val.replace("(", " ( ").replace(")", " ) ").split()  # so brackets not joined to words
-        filter = []
-        last_token = ""
-        for s in val_split:
-            s_upper = s.upper()
-            if s_upper in tokens:
-                if s_upper in ("AND", "OR"):
-                    if last_token in ("AND", "OR"):
-                        return None  # must have a non-token between
-                    last_token = s_upper
-                filter.append(s)
-            else:
-                if last_token is not None:
-                    filter.append("{} LIKE '%{}%'".format(field, s))
-                else:
-                    filter[-1] = filter[-1].replace("%'", " {}%'".format(s))
-                last_token = None
-        return "({})".format(" ".join(filter))  # if OR outside brackets will modify the logic of rest of where clauses
+    @property
+    def date_from(self):
+        return self.__date_from
+
+    @date_from.setter
+    def date_from(self, val):
+        self.__date_from = val
+        self.set_where_clause("date_filter", query_filter.date_filter(self.__date_from, self.__date_to))
+        self.__reload_files = True
+
+    @property
+    def date_to(self):
+        return self.__date_to
+
+    @date_to.setter
+    def date_to(self, val):
+        self.__date_to = val
+        self.set_where_clause("date_filter", query_filter.date_filter(self.__date_from, self.__date_to))
+        self.__reload_files = True
 
     def set_where_clause(self, key, value=None):
-        # value must be a string for later join()
-        if (value is None or len(value) == 0):
-            if key in self.__where_clauses:
-                self.__where_clauses.pop(key)
-            return
-        self.__where_clauses[key] = value
+        # value is a query_filter.Filter, None removes the filter
+        self.__filters.set(key, value)
 
     def pause_looping(self, val):
         self.__image_cache.pause_looping(val)
 
     def stop_image_chache(self):
+        self.__save_snapshot()
         self.__image_cache.stop()
+        self.__playback_state.close()
+
+    def __snapshot_key(self):
+        """The settings a saved playlist depends on, as they come back from JSON."""
+        model_config = self.get_model_config()
+        return json.loads(json.dumps([
+            self.__pic_dir, self.subdirectory, self.__filters.compile(), model_config['group_by_dir'], self.shuffle,
+            self.__sort_cols, model_config['recent_n'], model_config['portrait_pairs'],
+            model_config['portrait_pairs_by']]))
+
+    def __save_snapshot(self):
+        """Save the playlist and the position in it on the way out, e.g. for the restart after a video."""
+        if not self.__snapshot_path:
+            return
+        try:
+            if self.__reload_files or self.__number_of_files == 0:
+                if os.path.exists(self.__snapshot_path):
+                    os.remove(self.__snapshot_path)  # the next start has to build a new one anyway
+                return
+            self.__file_list.save(self.__snapshot_path, {
+                'key': self.__snapshot_key(),
+                'index': self.__file_index,
+                'num_run_through': self.__num_run_through,
+                'current_album': self.__current_album_path,
+                'albums': self.__album_batch,
+            })
+            self.__logger.info("Saved playlist of %d slides at %d", self.__number_of_files, self.__file_index)
+        except OSError as e:
+            self.__logger.warning("Could not save the playlist to %s: %s", self.__snapshot_path, e)
+
+    def __load_snapshot(self):
+        """Take over the playlist saved by the last clean exit, if it was built with the same settings.
+        The snapshot is used once, after a crash the playlist is built from the cache again.
+        """
+        if not self.__snapshot_path or not os.path.exists(self.__snapshot_path):
+            return
+        starttime = time.monotonic()
+        try:
+            playlist, state = Playlist.load(self.__snapshot_path)
+        except (OSError, ValueError) as e:
+            self.__logger.warning("Could not read the playlist snapshot %s: %s", self.__snapshot_path, e)
+            playlist, state = None, None
+        try:
+            os.remove(self.__snapshot_path)
+        except OSError:
+            pass
+        if state is None:
+            return
+        if state.get('key') != self.__snapshot_key() or not 0 <= state.get('index', -1) <= len(playlist):
+            self.__logger.info("Settings changed since the playlist snapshot was saved, building a new playlist")
+            return
+        self.__file_list = playlist
+        self.__number_of_files = len(playlist)
+        self.__file_index = state['index']
+        self.__num_run_through = state['num_run_through']
+        self.__current_album_path = state['current_album']
+        self.__album_batch = state['albums']
+        self.__resume_file = None  # the snapshot is the more exact bookmark
+        self.__reload_files = False
+        self.__logger.info("Resuming playlist of %d slides at %d from the snapshot in %.1f ms", self.__number_of_files,
+                           self.__file_index, (time.monotonic() - starttime) * 1000)
+        threading.Thread(target=self.__check_snapshot, args=(playlist,), daemon=True).start()
+
+    def __check_snapshot(self, playlist):
+        """Once the slideshow is running, look for files and albums of the snapshot that are gone.
+        Gone files are skipped when their turn comes, a playlist that is mostly gone is rebuilt.
+        """
+        time.sleep(SNAPSHOT_CHECK_DELAY)
+        try:
+            file_ids = playlist.file_ids()
+            missing = self.__image_cache.get_missing_file_ids(file_ids)
+            albums = {row['name'] for row in self.__image_cache.get_albums(self.__album_root)}
+            gone_albums = [album for album in self.__album_batch if album not in albums]
+        except Exception as e:  # the cache may be stopping
+            self.__logger.debug("Could not check the playlist snapshot: %s", e)
+            return
+        if playlist is not self.__file_list:
+            return  # replaced in the meantime
+        self.__logger.info("Playlist snapshot checked: %d of %d files and %d of %d albums gone",
+                           len(missing), len(file_ids), len(gone_albums), len(self.__album_batch))
+        if 2 * len(missing) > len(file_ids) or (self.__album_batch and len(gone_albums) == len(self.__album_batch)):
+            self.__reload_files = True
 
     def purge_files(self):
         self.__image_cache.purge_files()
 
+    def rescan(self, path=None):
+        self.__image_cache.rescan(path)
+
     def get_directory_list(self):
         _, root = os.path.split(self.__pic_dir)
         actual_dir = root
@@ -471,7 +590,8 @@ class Model:
             if self.__file_index >= self.__number_of_files:
                 self.__num_run_through += 1
                 if self.shuffle and self.__num_run_through >= self.get_model_config()['reshuffle_num']:
-                    self.__reload_files = True
+                    if not self.__reshuffle():
+                        self.__reload_files = True
                 self.__file_index = 0
                 if self.get_model_config()['group_by_dir']:
                     self.__reload_files = True # Force reload to select a new album
@@ -481,10 +601,10 @@ class Model:
 
             # Load the current image set
             file_ids = self.__file_list[self.__file_index]
-            pic_row = self.__image_cache.get_file_info(file_ids[0])
+            pic_row = self.__get_file_row(file_ids[0])
             pic1 = Pic(**pic_row) if pic_row is not None else None
             if len(file_ids) == 2:
-                pic_row = self.__image_cache.get_file_info(file_ids[1])
+                pic_row = self.__get_file_row(file_ids[1])
                 pic2 = Pic(**pic_row) if pic_row is not None else None
 
             # Verify the images in the selected image set actually exist on disk
@@ -504,7 +624,7 @@ class Model:
                     self.__logger.info(f"Switching to album: {current_dir}")
                     self.__current_album_path = current_dir
                     self.__shown_albums.add(current_dir)
-                    self.__write_shown_albums_log()
+                    self.__playback_state.add_shown_album(current_dir)
 
             # Increment the image index for next time
             self.__file_index += 1
@@ -520,11 +640,44 @@ class Model:
         self.__current_pics = (pic1, pic2)
         return self.__current_pics
 
+    def __reshuffle(self):
+        """Show the playlist in a new order without querying the cache, if it was shuffled by seed and
+        no file has changed since it was built. False if it has to be built again.
+        """
+        if self.__file_list.seed is None or self.__list_changes != self.__image_cache.get_change_count():
+            return False
+        self.__file_list.shuffle(random.getrandbits(32))
+        self.__number_of_files = len(self.__file_list)
+        self.__num_run_through = 0
+        self.__logger.info("Reshuffled the playlist of %d slides", self.__number_of_files)
+        return True
+
+    def __sort_clause(self):
+        """ORDER BY clause for sort_cols, leaving out anything that isn't a column of all_data."""
+        if self.__col_names is None:
+            self.__col_names = self.__image_cache.get_column_names()
+        sort_list = []
+        for col in self.__sort_cols.split(","):
+            colsplit = col.split()
+            if colsplit[0] in self.__col_names and (len(colsplit) == 1 or colsplit[1].upper() in ("ASC", "DESC")):
+                sort_list.append(col)
+        sort_list.append("fname ASC")
+        return ",".join(sort_list)
+
+    def __get_file_row(self, file_id):
+        """The all_data row of a file of the current slide. On a miss the rows of the next
+        prefetch_files slides are read with one query, instead of one query per slide.
+        """
+        if file_id not in self.__prefetched:
+            slides = self.__file_list.slides(self.__file_index, self.get_model_config()['prefetch_files'])
+            self.__prefetched = self.__image_cache.get_file_rows(
+                [file_id] + [slide_id for slide in slides for slide_id in slide])
+        row = self.__prefetched.pop(file_id, None)
+        self.__image_cache.record_display(file_id, row)
+        return row
+
     def get_number_of_files(self):
-        return sum(
-                    sum(1 for pic in pics if pic is not None)
-                    for pics in self.__file_list
-                )
+        return self.__file_list.file_count()
 
     def get_current_pics(self):
         return self.__current_pics
@@ -611,31 +764,20 @@ class Model:
                 self.__reload_files = True
 
     def save_current_file_state(self, file_path):
-        """Writes the path of the currently displayed file to the log."""
-        try:
-            with open(self.__shown_albums_log_path, 'r+') as f:
-                lines = f.readlines()
-                # If the last line is a file path, remove it before appending the new one
-                if lines and os.path.isfile(lines[-1].strip()):
-                    lines.pop()
-                f.seek(0)
-                f.writelines(lines)
-                f.write(f"{file_path}\n")
-                f.truncate()
-        except (IOError, FileNotFoundError) as e:
-            self.__logger.error("Could not write current file state to %s: %s", self.__shown_albums_log_path, e)
+        """Bookmarks the currently displayed file. Committed in batches, see PlaybackState."""
+        self.__playback_state.set_current_file(file_path, max(0, self.__file_index - 1))
 
     def save_resume_state(self):
         """
-        Writes the path of the file *after* the current one to the log for resuming after a video.
+        Bookmarks the file *after* the current one for resuming after a video, committed straight away.
         """
         if self.__file_index >= self.__number_of_files:
             return # End of album, nothing to resume
 
         next_file_id = self.__file_list[self.__file_index][0] # file_index points to the *next* file
-        next_file_row = self.__image_cache.get_file_info(next_file_id)
+        next_file_row = self.__image_cache.get_file_rows([next_file_id]).get(next_file_id)
         if next_file_row:
-            self.save_current_file_state(next_file_row['fname'])
+            self.__playback_state.set_current_file(next_file_row['fname'], self.__file_index, commit=True)
 
     def __get_files(self):
         # Set scanning flag
@@ -656,24 +798,16 @@ class Model:
 
         resumed = False # Flag to check if we resumed from a specific file
 
+        self.__prefetched = {}
+        self.__album_batch = []
         if group_by_dir:
-            self.__file_list = []
-            
-            # 1. Get all available albums
-            all_albums = []
-            if os.path.isdir(picture_dir):
-                for year_dir in sorted(os.listdir(picture_dir)):
-                    if year_dir.startswith('.') or year_dir.endswith('.tmp'):
-                        continue
-                    year_path = os.path.join(picture_dir, year_dir)
-                    if os.path.isdir(year_path):
-                        for loc_dir in sorted(os.listdir(year_path)):
-                            if loc_dir.startswith('.') or loc_dir.endswith('.tmp'):
-                                continue
-                            loc_path = os.path.join(year_path, loc_dir)
-                            if os.path.isdir(loc_path):
-                                all_albums.append(loc_path)
+            self.__file_list = Playlist()
             
+            # 1. Get all available albums (year/album folders with files in the cache or waiting to be indexed)
+            self.__album_root = picture_dir
+            album_info = {row['name']: row for row in self.__image_cache.get_albums(picture_dir)}
+            all_albums = list(album_info)
+
             if not all_albums:
                 self.__logger.warning("No albums found in picture directory.")
                 self.__number_of_files = 0
@@ -706,6 +840,7 @@ class Model:
             if not unshown_albums and not albums_to_load:
                 self.__logger.info("All albums shown. Resetting shown_albums.log.")
                 self.__shown_albums.clear()
+                self.__playback_state.clear_shown_albums()
                 unshown_albums = list(all_albums)
                 if resume_album: # Don't duplicate if we just reset
                     unshown_albums = [a for a in unshown_albums if a != resume_album]
@@ -724,79 +859,51 @@ class Model:
             # Loading a batch of albums provides a good buffer for lookahead and reduces scanning frequency.
             max_albums = model_config.get('playlist_max_albums', 20)
             max_files = model_config.get('playlist_max_files', 2000)
-            loaded_albums_count = 0
-            empty_albums_count = 0
-            
+            where_clause, params = self.__filters.compile()
+            file_counts = None if where_clause == "1" else {}  # files the filters select, per album
+            batch = []
+            batch_files = 0
+
             self.__logger.info(f"Loading batch of albums (max {max_albums} albums or {max_files} files)...")
-            
-            for album_path in albums_to_load:
+
+            for i, album_path in enumerate(albums_to_load):
                 # Check limits
-                if loaded_albums_count >= max_albums:
-                    break
-                if len(self.__file_list) >= max_files:
+                if len(batch) >= max_albums or batch_files >= max_files:
                     break
+                album = album_info[album_path]
+                if album['image_count'] + album['video_count'] == 0:
+                    self.__logger.debug(f"Album {album_path} has files on disk but not in DB yet. Waiting for cache.")
+                    continue
+                if file_counts is None:
+                    files = album['image_count'] + album['video_count']
+                else:
+                    if album_path not in file_counts:  # counted for the next few albums at a time
+                        file_counts.update(self.__image_cache.count_album_files(
+                            albums_to_load[i:i + max_albums], where_clause, params))
+                    files = file_counts[album_path]
+                    if files == 0:
+                        self.__logger.debug(f"Album {album_path} has no files the filters select.")
+                        continue
+                batch.append(album_path)
+                batch_files += files
 
-                where_list = [f"fname LIKE '{album_path}/%'"]
-                where_list.extend(self.__where_clauses.values())
-                where_clause = " AND ".join(where_list)
+            if batch:
+                sort_clause = "RANDOM()" if shuffle_global else self.__sort_clause()
 
-                sort_list = []
-                if shuffle_global:
-                    sort_list.append("RANDOM()")
-                else:
-                    if self.__col_names is None:
-                        self.__col_names = self.__image_cache.get_column_names()
-                    for col in self.__sort_cols.split(","):
-                        colsplit = col.split()
-                        if colsplit[0] in self.__col_names and (len(colsplit) == 1 or colsplit[1].upper() in ("ASC", "DESC")):
-                            sort_list.append(col)
-                    sort_list.append("fname ASC")
-                sort_clause = ",".join(sort_list)
-
-                files = self.__image_cache.query_cache(where_clause, sort_clause)
-                if files:
-                    self.__file_list.extend(files)
-                    self.__logger.info(f"Added {len(files)} files from album: {album_path}")
-                    loaded_albums_count += 1
-                else:
-                    # Check if directory is actually empty on disk to distinguish between "empty album" and "cache not ready"
-                    has_files_on_disk = False
-                    try:
-                        # Valid extensions (Images + Videos)
-                        valid_exts = set(image_cache.ImageCache.EXTENSIONS)
-                        valid_exts.update({'.mp4', '.mov', '.avi', '.mkv', '.webm', '.mpg', '.mpeg', '.m4v', '.ts', '.m2ts'})
-                        
-                        if os.path.isdir(album_path):
-                            for f in os.listdir(album_path):
-                                if os.path.splitext(f)[1].lower() in valid_exts:
-                                    has_files_on_disk = True
-                                    break
-                    except OSError:
-                        pass
+                self.__file_list.extend(self.__image_cache.query_cache(where_clause, sort_clause, params, albums=batch))
+                self.__album_batch = batch
+
+            self.__logger.info(f"Playlist populated with {len(self.__file_list)} files from {len(batch)} albums.")
 
-                    if has_files_on_disk:
-                        self.__logger.debug(f"Album {album_path} has files on disk but not in DB yet. Waiting for cache.")
-                    else:
-                        # Empty album, mark as shown so we don't try again immediately
-                        self.__shown_albums.add(album_path)
-                        empty_albums_count += 1
-            
-            self.__logger.info(f"Playlist populated with {len(self.__file_list)} files from {loaded_albums_count} albums.")
-            if empty_albums_count > 0:
-                self.__logger.info(f"Skipped {empty_albums_count} empty albums (marked as shown).")
-            
             # 5. Set Index (Resume)
             if resumed and resume_file_path:
                 try:
                     # Find the index of the file we want to resume FROM in the new file list
-                    # Note: file_list is a list of tuples (file_id, ...)
+                    # Note: file_list holds slides of (file_id, ...)
                     # We need to find the file_id corresponding to resume_file_path
-                    resume_file_id_rows = self.__image_cache.query_cache(f"fname = '{resume_file_path}'", "1")
-                    if resume_file_id_rows:
-                        resume_file_id = resume_file_id_rows[0][0]
-                        # Extract just the file_ids from the list for searching
-                        file_ids_in_list = [row[0] for row in self.__file_list]
-                        self.__file_index = file_ids_in_list.index(resume_file_id)
+                    resume_file_id = self.__image_cache.get_file_id(resume_file_path)
+                    if resume_file_id is not None:
+                        self.__file_index = self.__file_list.index(resume_file_id)
                         self.__logger.info("Resuming at index %d for file %s", self.__file_index, resume_file_path)
                     else:
                         self.__logger.warning("Resume file not found in DB.")
@@ -810,30 +917,35 @@ class Model:
         elif not resumed: # Only reset index if not resuming
             self.__file_index = 0
             # Existing logic for non-grouped display (flat list from pic_dir)
-            where_list = [f"fname LIKE '{picture_dir}/%'"]
-            where_list.extend(self.__where_clauses.values())
-            where_clause = " AND ".join(where_list) if len(where_list) > 0 else "1"
-
-            sort_list = []
+            path_filter = query_filter.path_filter(picture_dir)
             recent_n = model_config["recent_n"]
-            if recent_n > 0:
-                sort_list.append(f"last_modified < {time.time() - 3600 * 24 * recent_n:.0f}")
+            since = round(time.time() - 3600 * 24 * recent_n)
 
             if shuffle_global:
-                sort_list.append("RANDOM()")
+                # Sorted as without shuffle and shown in a seeded order (see Playlist.shuffle()), so the
+                # reshuffle after a pass needs no query. The recent files are a block of their own, shown first.
+                self.__list_changes = self.__image_cache.get_change_count()
+                blocks = [query_filter.recent_filter(since), query_filter.recent_filter(since, recent=False)] \
+                    if recent_n > 0 else [None]
+                self.__file_list = Playlist()
+                lengths = []
+                for block in blocks:
+                    where_clause, params = self.__filters.compile(*(f for f in (path_filter, block) if f is not None))
+                    slides = self.__image_cache.query_cache(where_clause, self.__sort_clause(), params)
+                    self.__file_list.extend(slides)
+                    lengths.append(len(slides))
+                self.__file_list.shuffle(random.getrandbits(32), lengths)
             else:
-                if self.__col_names is None:
-                    self.__col_names = self.__image_cache.get_column_names()
-                for col in self.__sort_cols.split(","):
-                    colsplit = col.split()
-                    if colsplit[0] in self.__col_names and (len(colsplit) == 1 or colsplit[1].upper() in ("ASC", "DESC")):
-                        sort_list.append(col)
-                sort_list.append("fname ASC")
-            sort_clause = ",".join(sort_list)
-
-            self.__file_list = self.__image_cache.query_cache(where_clause, sort_clause)
+                where_clause, params = self.__filters.compile(path_filter)
+                sort_list = []
+                if recent_n > 0:
+                    sort_list.append("last_modified < ?")  # the ORDER BY placeholder follows the WHERE ones
+                    params += (since,)
+                sort_list.append(self.__sort_clause())
+                self.__file_list = Playlist(self.__image_cache.query_cache(where_clause, ",".join(sort_list), params))
 
         self.__number_of_files = len(self.__file_list)
+        self.__logger.debug("Playlist of %d slides takes %d bytes", self.__number_of_files, self.__file_list.nbytes())
         if not resumed:
             self.__file_index = 0
 
@@ -857,14 +969,3 @@ class Model:
                 os.remove("/dev/shm/picframe_scanning.flag")
         except Exception as e:
             self.__logger.warning("Could not remove scanning flag file: %s", e)
-
-
-    def __write_shown_albums_log(self):
-        """Writes the current set of shown albums to the log file, overwriting it."""
-        try:
-            with open(self.__shown_albums_log_path, 'w') as f:
-                for album in sorted(list(self.__shown_albums)): # Sort for consistent output
-                    f.write(f"{album}\n")
-            self.__logger.info("Updated shown_albums.log with %d entries.", len(self.__shown_albums))
-        except (IOError, FileNotFoundError) as e:
-            self.__logger.error("Could not write to shown_albums.log: %s", e)
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+What has been shown: the albums played through and the file being shown.
+
+The state lives in a small SQLite db of its own (WAL, synchronous = NORMAL),
+so the slide by slide bookmark doesn't wait for the cache thread's write
+transactions. The bookmark is a single row that is updated in place and
+committed at most every STATE_COMMIT_INTERVAL seconds; album changes and
+the bookmark before a video restart are committed straight away.
+
+shown_albums.log stays the list of shown albums for sync_photos.sh, one path
+per line. A finished album is appended to it, the file is only rewritten when
+the albums start over. On the first start the albums and the bookmark (the
+last line, if it is a file) of an existing log are taken over.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+STATE_COMMIT_INTERVAL = 30.0  # seconds the bookmark may be held in an open transaction
+
+
+class PlaybackState:
+
+    def __init__(self, db_file, shown_albums_log):
+        self.__logger = logging.getLogger("playback_state.PlaybackState")
+        self.__log_path = shown_albums_log
+        self.__lock = threading.Lock()
+        self.__last_commit = time.monotonic()
+        if db_file != ':memory:':
+            os.makedirs(os.path.dirname(db_file) or '.', exist_ok=True)
+        self.__db = sqlite3.connect(db_file, check_same_thread=False)
+        self.__db.execute("PRAGMA journal_mode = WAL")
+        self.__db.execute("PRAGMA synchronous = NORMAL")
+        self.__db.execute("""
+            CREATE TABLE IF NOT EXISTS shown_album (
+                name TEXT NOT NULL PRIMARY KEY,
+                shown REAL NOT NULL
+            )""")
+        self.__db.execute("""
+            CREATE TABLE IF NOT EXISTS bookmark (
+                id INTEGER NOT NULL PRIMARY KEY CHECK (id = 1),
+                fname TEXT,
+                position INTEGER DEFAULT 0 NOT NULL,
+                saved REAL NOT NULL
+            )""")
+        if self.__db.execute("SELECT 1 FROM bookmark").fetchone() is None:
+            self.__migrate_log()
+        self.__db.commit()
+
+    def __migrate_log(self):
+        """Take over the albums and bookmark of shown_albums.log and drop the bookmark line from it."""
+        fname = None
+        albums = []
+        if os.path.exists(self.__log_path):
+            try:
+                with open(self.__log_path, 'r') as f:
+                    albums = [line.strip() for line in f if line.strip()]
+            except OSError as e:
+                self.__logger.error("Could not read %s: %s", self.__log_path, e)
+            if albums and os.path.isfile(albums[-1]):
+                fname = albums.pop()
+        now = time.time()
+        self.__db.executemany("INSERT OR IGNORE INTO shown_album VALUES(?, ?)", [(album, now) for album in albums])
+        self.__db.execute("INSERT INTO bookmark VALUES(1, ?, 0, ?)", (fname, now))
+        if fname is not None:
+            self.__logger.info("Took over %d albums and the bookmark from %s", len(albums), self.__log_path)
+            self.__write_log(albums)
+
+    def __write_log(self, albums):
+        try:
+            with open(self.__log_path, 'w') as f:
+                f.writelines("{}\n".format(album) for album in albums)
+        except OSError as e:
+            self.__logger.error("Could not write to %s: %s", self.__log_path, e)
+
+    def shown_albums(self):
+        return {row[0] for row in self.__db.execute("SELECT name FROM shown_album")}
+
+    def add_shown_album(self, album):
+        with self.__lock:
+            cursor = self.__db.execute("INSERT OR IGNORE INTO shown_album VALUES(?, ?)", (album, time.time()))
+            self.__commit(force=True)
+        if cursor.rowcount:
+            try:
+                with open(self.__log_path, 'a') as f:
+                    f.write("{}\n".format(album))
+            except OSError as e:
+                self.__logger.error("Could not write to %s: %s", self.__log_path, e)
+
+    def clear_shown_albums(self):
+        with self.__lock:
+            self.__db.execute("DELETE FROM shown_album")
+            self.__commit(force=True)
+        self.__write_log([])
+
+    @property
+    def current_file(self):
+        row = self.__db.execute("SELECT fname FROM bookmark").fetchone()
+        return row[0] if row is not None else None
+
+    @property
+    def position(self):
+        row = self.__db.execute("SELECT position FROM bookmark").fetchone()
+        return row[0] if row is not None else 0
+
+    def set_current_file(self, fname, position=0, commit=False):
+        """Bookmark `fname` at playlist `position`. `commit` makes it durable straight away,
+        e.g. before the process exits for a video.
+        """
+        with self.__lock:
+            self.__db.execute("UPDATE bookmark SET fname = ?, position = ?, saved = ?",
+                              (fname, position, time.time()))
+            self.__commit(force=commit)
+
+    def __commit(self, force=False):
+        now = time.monotonic()
+        if force or now - self.__last_commit >= STATE_COMMIT_INTERVAL:
+            self.__db.commit()
+            self.__last_commit = now
+
+    def close(self):
+        with self.__lock:
+            self.__db.commit()
+            self.__db.close()
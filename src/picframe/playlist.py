@@ -0,0 +1,330 @@
+"""
+The order in which the file ids of the cache are shown.
+
+A slide is one file id or, with portrait pairs, two. The ids are held in two
+typed arrays, the first id of each slide and its partner (0 for none), rather
+than as a list of tuples: 4 bytes per id instead of about 90 for the list
+entry, the tuple and the int objects, so a playlist of 200k slides takes under
+2 MB. The partner array is only created once a pair is added.
+
+A shuffled playlist keeps the arrays in the order they were filled and shows
+them through a seeded Permutation, computed slide by slide as it is needed.
+Shuffling again only takes a new seed instead of sorting the library by
+RANDOM(), and (seed, position) is enough to come back to the same place.
+
+save() writes the arrays as they are in memory, behind a small header and a
+JSON block for the caller's state, and load() maps the file and copies the
+arrays straight back, so a restart gets its playlist without a query.
+"""
+import os
+import json
+import mmap
+import random
+import struct
+from array import array
+from bisect import bisect_left, bisect_right, insort
+
+TYPECODE = 'I'  # unsigned 32 bit, widened to 64 bit if a larger id ever turns up
+WIDE_TYPECODE = 'Q'
+SNAPSHOT_MAGIC = b'PFPL'
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = struct.Struct('=4sHcBQI')  # magic, version, typecode, has partners, slides, length of the JSON
+FEISTEL_ROUNDS = 4
+
+
+class Permutation:
+    """A pseudo-random order of range(n) given by `seed` (an int or str), without storing it.
+
+    The positions are run through a Feistel network over the smallest even number of bits
+    that holds n-1, which is a bijection on that power of two. Results of n and above
+    are fed through again (cycle walking) until they fall into range(n), which takes
+    fewer than four passes on average because the power of two is less than 4 * n.
+    """
+
+    def __init__(self, n, seed):
+        self.__n = n
+        bits = max(2, (n - 1).bit_length())
+        self.__half = (bits + 1) // 2
+        self.__mask = (1 << self.__half) - 1
+        rng = random.Random(seed)
+        self.__keys = [rng.getrandbits(32) for _ in range(FEISTEL_ROUNDS)]
+
+    def __len__(self):
+        return self.__n
+
+    def __round(self, x, key):
+        # the finaliser of MurmurHash3, so every bit of the output depends on every bit of x and key
+        x = ((x ^ key) * 0xCC9E2D51) & 0xFFFFFFFF
+        x = ((x ^ (x >> 16)) * 0x85EBCA6B) & 0xFFFFFFFF
+        return (x ^ (x >> 13)) & self.__mask
+
+    def __encrypt(self, x):
+        left, right = x >> self.__half, x & self.__mask
+        for key in self.__keys:
+            left, right = right, left ^ self.__round(right, key)
+        return (left << self.__half) | right
+
+    def __decrypt(self, x):
+        left, right = x >> self.__half, x & self.__mask
+        for key in reversed(self.__keys):
+            left, right = right ^ self.__round(left, key), left
+        return (left << self.__half) | right
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.__n:
+            raise IndexError("permutation index out of range")
+        i = self.__encrypt(i)
+        while i >= self.__n:
+            i = self.__encrypt(i)
+        return i
+
+    def index(self, value):
+        """The position `value` is moved to, the inverse of []."""
+        if not 0 <= value < self.__n:
+            raise ValueError("{} is not in the permutation".format(value))
+        value = self.__decrypt(value)
+        while value >= self.__n:
+            value = self.__decrypt(value)
+        return value
+
+
+class Playlist:
+
+    def __init__(self, slides=()):
+        self.__first = array(TYPECODE)
+        self.__second = None
+        # set by shuffle(): consecutive blocks of the arrays, each shown in the order of its Permutation
+        # (None for a block added unshuffled by extend()), and the deleted positions in that order
+        self.__seed = None
+        self.__starts = None
+        self.__perms = None
+        self.__removed = []
+        self.extend(slides)
+
+    def extend(self, slides):
+        """Append slides given as (file_id,) or (file_id1, file_id2) tuples, as from query_cache().
+        On a shuffled playlist they are shown after the shuffled ones, in the order given.
+        """
+        count = len(self.__first)
+        for slide in slides:
+            try:
+                self.__append(slide)
+            except OverflowError:
+                self.__widen()
+                self.__append(slide)
+        if self.__starts is not None and len(self.__first) > count:
+            self.__starts.append(count)
+            self.__perms.append(None)
+
+    def __append(self, slide):
+        second = slide[1] if len(slide) > 1 else 0
+        if second and self.__second is None:
+            self.__second = array(self.__first.typecode, bytes(len(self.__first) * self.__first.itemsize))
+        self.__first.append(slide[0])  # append to the first array last, a failed append leaves both the same length
+        if self.__second is not None:
+            try:
+                self.__second.append(second)
+            except OverflowError:
+                self.__first.pop()
+                raise
+
+    def __widen(self):
+        self.__first = array(WIDE_TYPECODE, self.__first)
+        if self.__second is not None:
+            self.__second = array(WIDE_TYPECODE, self.__second)
+
+    @property
+    def seed(self):
+        """The seed of the last shuffle(), None for a playlist in the order it was filled."""
+        return self.__seed
+
+    def shuffle(self, seed, blocks=None):
+        """Show the slides in the pseudo-random order given by `seed`. `blocks` are the lengths of
+        consecutive runs of slides that are shuffled separately, e.g. the recent files first, None
+        for the blocks of the last shuffle or the whole playlist. Takes the same time whatever the
+        length of the playlist, unless slides were deleted since the last shuffle.
+        """
+        lengths = self.__compact()
+        if blocks is None:
+            blocks = lengths if lengths is not None else [len(self.__first)]
+        if sum(blocks) != len(self.__first):
+            raise ValueError("the blocks don't add up to the length of the playlist")
+        self.__seed = seed
+        self.__starts = []
+        self.__perms = []
+        start = 0
+        for k, length in enumerate(blocks):
+            self.__starts.append(start)
+            self.__perms.append(self.__block_permutation(length, k))
+            start += length
+
+    def __block_permutation(self, length, k):
+        return Permutation(length, "{}/{}".format(self.__seed, k))
+
+    def __block_lengths(self):
+        ends = self.__starts[1:] + [len(self.__first)]
+        return [end - start for start, end in zip(self.__starts, ends)]
+
+    def __compact(self):
+        """Drop the slots of deleted slides from the arrays, keeping the order they were filled in.
+        The block lengths after that, None if the playlist isn't shuffled.
+        """
+        if self.__starts is None:
+            return None
+        lengths = self.__block_lengths()
+        if self.__removed:
+            for k, start in enumerate(self.__starts):
+                lengths[k] -= bisect_left(self.__removed, start + lengths[k]) - bisect_left(self.__removed, start)
+            if self.__second is not None:
+                self.__second = array(self.__second.typecode,
+                                      (second for first, second in zip(self.__first, self.__second) if first))
+            self.__first = array(self.__first.typecode, (first for first in self.__first if first))
+            self.__removed = []
+        return lengths
+
+    def __locate(self, i):
+        """The array slot of the slide at position `i`."""
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("playlist index out of range")
+        if self.__starts is None:
+            return i
+        for removed in self.__removed:  # skip the deleted positions up to i
+            if removed > i:
+                break
+            i += 1
+        k = bisect_right(self.__starts, i) - 1
+        start, perm = self.__starts[k], self.__perms[k]
+        return start + perm[i - start] if perm is not None else i
+
+    def __len__(self):
+        return len(self.__first) - len(self.__removed)
+
+    def __getitem__(self, i):
+        i = self.__locate(i)
+        if self.__second is None or not self.__second[i]:
+            return (self.__first[i],)
+        return (self.__first[i], self.__second[i])
+
+    def __delitem__(self, i):
+        if self.__starts is None:
+            del self.__first[i]
+            if self.__second is not None:
+                del self.__second[i]
+            return
+        # a shuffled playlist keeps the slot empty, moving the other slides would change their order
+        slot = self.__locate(i)
+        self.__first[slot] = 0
+        if self.__second is not None:
+            self.__second[slot] = 0
+        insort(self.__removed, self.__position(slot))
+
+    def __position(self, slot):
+        """The position in the shuffled order of array slot `slot`, counting deleted slides."""
+        k = bisect_right(self.__starts, slot) - 1
+        start, perm = self.__starts[k], self.__perms[k]
+        return start + perm.index(slot - start) if perm is not None else slot
+
+    def index(self, file_id):
+        """Position of the slide showing `file_id`, ValueError if there is none."""
+        if not file_id:
+            raise ValueError("0 is not a file id")
+        try:
+            slot = self.__first.index(file_id)
+        except ValueError:
+            if self.__second is None:
+                raise
+            slot = self.__second.index(file_id)
+        if self.__starts is None:
+            return slot
+        position = self.__position(slot)
+        return position - bisect_left(self.__removed, position)
+
+    def slides(self, start, count):
+        """Up to `count` slides from position `start` on, wrapping around at the end."""
+        n = len(self)
+        return [self[(start + i) % n] for i in range(min(count, n))]
+
+    def file_ids(self):
+        """Every file id in the playlist."""
+        file_ids = self.__first.tolist()
+        if self.__removed:
+            file_ids = [file_id for file_id in file_ids if file_id]
+        if self.__second is None:
+            return file_ids
+        return file_ids + [file_id for file_id in self.__second if file_id]
+
+    def file_count(self):
+        """Number of file ids in the playlist, counting both of a pair."""
+        count = len(self)
+        if self.__second is None:
+            return count
+        return count + len(self.__second) - self.__second.count(0)
+
+    def __order(self):
+        """The shuffle as it goes into a snapshot, see load()."""
+        if self.__starts is None:
+            return None
+        return {'seed': self.__seed,
+                'blocks': [[length, perm is not None] for length, perm in zip(self.__block_lengths(), self.__perms)],
+                'removed': self.__removed}
+
+    def save(self, path, state):
+        """Write the playlist and the JSON serialisable `state` to `path`, replacing it atomically."""
+        state_json = json.dumps({'state': state, 'order': self.__order()}).encode('utf-8')
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, self.__first.typecode.encode(),
+                                      self.__second is not None, len(self.__first), len(state_json))
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(state_json)
+            f.write(self.__first.tobytes())
+            if self.__second is not None:
+                f.write(self.__second.tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """(Playlist, state) from a file written by save(). ValueError if it isn't one."""
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if len(mm) < SNAPSHOT_HEADER.size:
+                raise ValueError("{} is too short for a playlist snapshot".format(path))
+            magic, version, typecode, has_second, count, state_len = SNAPSHOT_HEADER.unpack_from(mm)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError("{} is not a playlist snapshot of this version".format(path))
+            playlist = cls()
+            first = array(typecode.decode())
+            ids_len = count * first.itemsize
+            offset = SNAPSHOT_HEADER.size + state_len
+            if len(mm) != offset + ids_len * (2 if has_second else 1):
+                raise ValueError("{} has the wrong size".format(path))
+            snapshot = json.loads(mm[SNAPSHOT_HEADER.size:offset].decode('utf-8'))
+            with memoryview(mm) as view:
+                first.frombytes(view[offset:offset + ids_len])
+                playlist.__first = first
+                if has_second:
+                    playlist.__second = array(first.typecode)
+                    playlist.__second.frombytes(view[offset + ids_len:])
+        order = snapshot['order']
+        if order is not None:
+            playlist.__seed = order['seed']
+            playlist.__starts = []
+            playlist.__perms = []
+            start = 0
+            for k, (length, shuffled) in enumerate(order['blocks']):
+                playlist.__starts.append(start)
+                playlist.__perms.append(playlist.__block_permutation(length, k) if shuffled else None)
+                start += length
+            if start != count:
+                raise ValueError("{} has the wrong block lengths".format(path))
+            playlist.__removed = order['removed']
+        return playlist, snapshot['state']
+
+    def nbytes(self):
+        """Memory taken by the ids."""
+        size = len(self.__first) * self.__first.itemsize
+        if self.__second is not None:
+            size += len(self.__second) * self.__second.itemsize
+        return size
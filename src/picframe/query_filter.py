@@ -0,0 +1,118 @@
+"""
+Parameterised WHERE clauses for the all_data view.
+
+Filters are compiled to a `Filter` holding SQL with ? placeholders and the values
+that go with them, so paths and search words never end up inside the SQL text.
+The SQL only depends on the shape of the filters (which ones are set, how many
+words a tag search has), not on their values. A `FilterSet` caches the joined
+clause per shape, so the same filters always give the identical statement text
+and sqlite3 reuses its prepared statement instead of parsing a new one for every
+album. Text searches use the meta_fts full text index where the cache has one.
+"""
+import logging
+from collections import namedtuple
+
+Filter = namedtuple('Filter', ['sql', 'params'])
+
+TOKENS = ("(", ")", "AND", "OR", "NOT")
+FTS_COLUMNS = ("tags", "caption", "title", "location")  # columns of the meta_fts index, see ImageCache
+FTS_MATCH = "file_id IN (SELECT rowid FROM meta_fts WHERE meta_fts MATCH ?)"
+
+logger = logging.getLogger("query_filter")
+
+
+def path_filter(path):
+    """Files in folder `path` and its sub folders. A range over the folder name index:
+    every name below 'path/' sorts before 'path0' ('0' follows '/').
+    """
+    path = path.rstrip('/')
+    return Filter("(folder = ? OR (folder >= ? AND folder < ?))", (path, path + '/', path + '0'))
+
+
+def date_filter(date_from=None, date_to=None):
+    """Files taken from `date_from` up to `date_to` (unix times, None or 0 for open ended)."""
+    sql = []
+    params = []
+    if date_from:
+        sql.append("exif_datetime >= ?")
+        params.append(float(date_from))
+    if date_to:
+        sql.append("exif_datetime <= ?")
+        params.append(float(date_to))
+    if not sql:
+        return None
+    return Filter("({})".format(" AND ".join(sql)), tuple(params))
+
+
+def recent_filter(since, recent=True):
+    """Files last modified at or after `since` (a unix time), with `recent` False the ones before."""
+    return Filter("(last_modified >= ?)" if recent else "(last_modified < ?)", (since,))
+
+
+def text_filter(val, field, fts=False):
+    """Search `field` for the words in `val`, which can be combined with AND, OR, NOT and
+    brackets. Words without an operator in between are searched as one phrase, so
+    "New York OR Paris" finds "New York" or "Paris". None if the expression is malformed.
+
+    With `fts` each phrase is looked up in the meta_fts full text index, matching whole words
+    and word beginnings ("york" and "yor" find "New York", "ork" doesn't). Otherwise, or for a
+    field that isn't indexed, it is a LIKE substring search over every row.
+    """
+    if val.count("(") != val.count(")"):
+        return None  # this should clear the filter and not raise an error
+    val_split = val.replace("(", " ( ").replace(")", " ) ").split()  # so brackets not joined to words
+    sql = []
+    params = []
+    last_token = ""
+    for s in val_split:
+        s_upper = s.upper()
+        if s_upper in TOKENS:
+            if s_upper in ("AND", "OR"):
+                if last_token in ("AND", "OR"):
+                    return None  # must have a non-token between
+                last_token = s_upper
+            sql.append(s_upper)
+        else:
+            if last_token is not None:
+                sql.append("{} LIKE ?".format(field))
+                params.append(s)
+            else:
+                params[-1] += " " + s
+            last_token = None
+    if not params:
+        return None
+    if fts and field in FTS_COLUMNS:
+        # the boolean logic stays in SQL, FTS5 has no unary NOT. A LIKE expression is NULL for a NULL
+        # field whatever the operators, so files without e.g. a location are left out here as well.
+        params = ['{} : ("{}" *)'.format(field, p.replace('"', '""')) for p in params]
+        sql = " ".join(FTS_MATCH if part == "{} LIKE ?".format(field) else part for part in sql)
+        return Filter("({} IS NOT NULL AND ({}))".format(field, sql), tuple(params))
+    # the escaping keeps % and _ typed by the user literal
+    params = ["%{}%".format(p.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")) for p in params]
+    sql = " ".join(part + " ESCAPE '\\'" if part.endswith("LIKE ?") else part for part in sql)
+    return Filter("({})".format(sql), tuple(params))  # if OR outside brackets will modify the logic of rest of where clauses
+
+
+class FilterSet:
+    """The filters currently set, by name, combined with AND."""
+
+    def __init__(self):
+        self.__filters = {}
+        self.__clauses = {}  # shape -> joined SQL
+
+    def set(self, key, filter=None):
+        if filter is None:
+            self.__filters.pop(key, None)
+        else:
+            self.__filters[key] = filter
+
+    def compile(self, *extra):
+        """(WHERE clause, params) of `extra` filters followed by the ones set."""
+        filters = list(extra) + [self.__filters[key] for key in sorted(self.__filters)]
+        shape = tuple(f.sql for f in filters)
+        sql = self.__clauses.get(shape)
+        if sql is None:
+            sql = " AND ".join(shape) if shape else "1"
+            self.__clauses[shape] = sql
+            logger.debug("New filter shape: %s", sql)
+        return sql, tuple(p for f in filters for p in f.params)
@@ -0,0 +1,135 @@
+"""
+In process reader for the moov atom of MP4, MOV and M4V files.
+
+Phones and cameras write their videos as ISO BMFF (QuickTime) containers, which
+keep everything picframe needs in the moov box: the coded size and rotation
+matrix of the video track, the duration and the creation time. Reading it takes a
+few small reads instead of an ffprobe process. `read_video_header` returns None
+for other containers or anything unusual, the caller then falls back to ffprobe.
+"""
+import os
+import struct
+import logging
+from picframe.image_header import iter_boxes
+
+MOOV_LIMIT = 16 * 1024 * 1024  # larger moov boxes (hours of video) are left to ffprobe
+TOP_LEVEL_BOXES = frozenset((b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot', b'uuid'))
+MAC_EPOCH_OFFSET = 2082844800  # seconds from 1904-01-01 to 1970-01-01
+FIXED_ONE = 0x10000  # 1.0 as 16.16 fixed point
+
+logger = logging.getLogger("video_header")
+
+
+def read_video_header(file_path_name):
+    """dict with width, height (as coded), rotation (clockwise degrees), duration (seconds)
+    and creation_time (unix time or None) of the first video track, or None.
+    """
+    try:
+        with open(file_path_name, 'rb') as f:
+            moov = _find_moov(f, os.fstat(f.fileno()).st_size)
+        if moov is None:
+            return None
+        return _parse_moov(moov)
+    except (OSError, struct.error, ValueError, IndexError) as e:
+        logger.debug("No moov info for %s: %s", file_path_name, e)
+    return None
+
+
+def _find_moov(f, file_size):
+    pos = 0
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        head = f.read(16)
+        size, box_type = struct.unpack_from('>I4s', head)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', head, 8)[0]
+            header = 16
+        elif size == 0:
+            size = file_size - pos
+        if box_type not in TOP_LEVEL_BOXES or size < header:
+            return None  # not a QuickTime/ISO BMFF file
+        if box_type == b'moov':
+            if size > MOOV_LIMIT:
+                return None
+            f.seek(pos + header)
+            return f.read(size - header)
+        pos += size  # mdat is skipped with a seek, wherever it is
+    return None
+
+
+def _parse_moov(moov):
+    timescale = duration = creation = None
+    video = None
+    for box_type, start, end in iter_boxes(moov):
+        if box_type == b'mvhd':
+            if moov[start] == 1:
+                creation, _, timescale, duration = struct.unpack_from('>QQIQ', moov, start + 4)
+            else:
+                creation, _, timescale, duration = struct.unpack_from('>IIII', moov, start + 4)
+        elif box_type == b'trak' and video is None:
+            video = _parse_trak(moov, start, end)
+    if video is None:
+        return None
+    width, height, rotation = video
+    return {
+        'width': width,
+        'height': height,
+        'rotation': rotation,
+        'duration': duration / timescale if timescale else None,
+        'creation_time': creation - MAC_EPOCH_OFFSET if creation else None,
+    }
+
+
+def _parse_trak(data, start, end):
+    """(width, height, rotation) of a video track, None for any other track."""
+    matrix = None
+    tkhd_size = (0, 0)
+    is_video = False
+    coded_size = None
+    for box_type, box_start, box_end in iter_boxes(data, start, end):
+        if box_type == b'tkhd':
+            # the matrix follows creation/modification time, track id, duration and 16 reserved bytes
+            pos = box_start + (4 + 32 if data[box_start] == 1 else 4 + 20) + 16
+            matrix = struct.unpack_from('>9i', data, pos)
+            width, height = struct.unpack_from('>II', data, pos + 36)
+            tkhd_size = (width >> 16, height >> 16)
+        elif box_type == b'mdia':
+            is_video, coded_size = _parse_mdia(data, box_start, box_end)
+    if not is_video:
+        return None
+    width, height = coded_size if coded_size and all(coded_size) else tkhd_size
+    if not width or not height:
+        return None
+    return width, height, _rotation(matrix)
+
+
+def _parse_mdia(data, start, end):
+    is_video = False
+    coded_size = None
+    for box_type, box_start, box_end in iter_boxes(data, start, end):
+        if box_type == b'hdlr':
+            is_video = data[box_start + 8:box_start + 12] == b'vide'
+        elif box_type == b'minf':
+            for sub_type, sub_start, sub_end in iter_boxes(data, box_start, box_end):
+                if sub_type == b'stbl':
+                    for stbl_type, stbl_start, _ in iter_boxes(data, sub_start, sub_end):
+                        if stbl_type == b'stsd':
+                            # first visual sample entry: size, format, 6 reserved, data ref index,
+                            # 16 bytes pre defined/reserved, then width and height
+                            coded_size = struct.unpack_from('>HH', data, stbl_start + 8 + 8 + 8 + 16)
+    return is_video, coded_size
+
+
+def _rotation(matrix):
+    if matrix is None:
+        return 0
+    a, b, _, c, d = matrix[:5]
+    if a == 0 and d == 0:
+        if b == FIXED_ONE and c == -FIXED_ONE:
+            return 90
+        if b == -FIXED_ONE and c == FIXED_ONE:
+            return 270
+    elif a == -FIXED_ONE and d == -FIXED_ONE:
+        return 180
+    return 0
@@ -21,6 +21,8 @@ import gc
 # supported display modes for display switch
 dpms_mode = ("unsupported", "pi", "x_dpms")
 
+VIDEO_END_FILE = "/dev/shm/picframe_video_end"  # end time of the last mpv video, for the handoff timing
+
 
 # utility functions with no dependency on ViewerDisplay properties
 def txt_to_bit(txt):
@@ -55,6 +57,7 @@ class ViewerDisplay:
             self.__solid_background = [0.2, 0.2, 0.3, 1.0] # Force dark blue background on video restart
         else:
             self.__solid_background = config['solid_background']
+        self.__video_end_tm = self.__read_video_end_tm()
         self.__outer_mat_color = config['outer_mat_color']
         self.__inner_mat_color = config['inner_mat_color']
         self.__outer_mat_border = config['outer_mat_border']
@@ -803,6 +806,26 @@ class ViewerDisplay:
     def is_in_transition(self):
         return self.__in_transition
 
+    def __read_video_end_tm(self):
+        """End time of the video this process was restarted for, None if it wasn't."""
+        try:
+            with open(VIDEO_END_FILE) as f:
+                tm = float(f.read())
+            os.remove(VIDEO_END_FILE)
+        except (OSError, ValueError):
+            return None
+        return tm if os.getenv('PICFRAME_RESTART_CODE') == '10' else None
+
+    def __log_video_handoff(self):
+        """Logs how long the screen stayed without a photo after the last video."""
+        self.__logger.info("Video handoff: first photo drawn %.0f ms after the video ended",
+                           (time.time() - self.__video_end_tm) * 1000.0)
+        self.__video_end_tm = None
+        try:
+            os.remove(VIDEO_END_FILE)
+        except OSError:
+            pass
+
     def slideshow_start(self):
         self.__display = pi3d.Display.create(
             x=self.__display_x, y=self.__display_y,
@@ -1073,6 +1096,8 @@ class ViewerDisplay:
         # Draw Foreground Sprite (New Image) - Fading In
         self.__slide.set_alpha(smooth_alpha)
         self.__slide.draw()
+        if self.__video_end_tm is not None:
+            self.__log_video_handoff()
         
         self.__draw_overlay()
         if self.clock_is_on:
@@ -1331,7 +1356,14 @@ class ViewerDisplay:
     def slideshow_stop(self):
         if self.__display:
             self.__display.destroy()
+        self.__display = None
+        # everything below was made in the destroyed GL context, slideshow_start() makes it again
         self.__clock_overlay = None
+        self.__image_overlay = None
+        self.__prev_overlay_time = None
+        self.__textblocks = [None, None]
+        self.__text_bkg = None
+        self.__icon_sprite = None
         self.__sfg = None # Ensure foreground texture is reloaded
         self.__sbg = None # Ensure background texture is reloaded
 
@@ -1391,6 +1423,14 @@ class ViewerDisplay:
         # --- Step 4: Blank the screen AGAIN after video finishes ---
         _blank_screen()
 
+        # Time the handoff to the next photo, kept in a file for the run after a restart
+        self.__video_end_tm = time.time()
+        try:
+            with open(VIDEO_END_FILE, "w") as f:
+                f.write(repr(self.__video_end_tm))
+        except OSError as e:
+            self.__logger.debug("Could not write %s: %s", VIDEO_END_FILE, e)
+
     def play_video_slideshow(self, pic, video_extractor: VideoExtractor, fade_time: float, time_delay: float):
         video_path = pic.fname
         self.__video_slideshow_playing = True
@@ -0,0 +1,38 @@
+import sqlite3
+import threading
+import pytest
+# ensure that picframe is in the path
+# pip install -e .
+from picframe.cache_db import CacheDb
+
+
+@pytest.fixture
+def cache_db(tmp_path):
+    db = CacheDb(str(tmp_path / "cache.db3"))
+    db.writer.execute("PRAGMA journal_mode = WAL")
+    db.writer.execute("CREATE TABLE file (file_id INTEGER PRIMARY KEY, name TEXT)")
+    db.writer.commit()
+    yield db
+    db.close()
+
+
+def test_reader_per_thread(cache_db):
+    readers = []
+    t = threading.Thread(target=lambda: readers.append(cache_db.reader()))
+    t.start()
+    t.join()
+    assert cache_db.reader() is cache_db.reader()
+    assert readers[0] is not cache_db.reader()
+    assert cache_db.reader() is not cache_db.writer
+
+
+def test_reader_is_read_only(cache_db):
+    with pytest.raises(sqlite3.OperationalError):
+        cache_db.reader().execute("INSERT INTO file(name) VALUES('a')")
+
+
+def test_reader_sees_committed_state_only(cache_db):
+    cache_db.writer.execute("INSERT INTO file(name) VALUES('a')")
+    assert cache_db.reader().execute("SELECT count(*) FROM file").fetchone()[0] == 0
+    cache_db.writer.commit()
+    assert cache_db.reader().execute("SELECT count(*) FROM file").fetchone()[0] == 1
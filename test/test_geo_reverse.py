@@ -0,0 +1,48 @@
+# ensure that picframe is in the path
+# pip install -e .
+from picframe.geo_reverse import OfflineGeoReverse, format_address
+
+KEY_LIST = [['tourism', 'amenity', 'isolated_dwelling'],
+            ['suburb', 'village'],
+            ['city', 'county'],
+            ['region', 'state', 'province'],
+            ['country']]
+
+# geonameid, name, asciiname, alternatenames, latitude, longitude, feature class, feature code, country code, cc2,
+# admin1, admin2, admin3, admin4, population, elevation, dem, timezone, modification date
+PLACES = [
+    ("2657896", "Zürich", "Zurich", "", "47.36667", "8.55", "P", "PPLA", "CH", "", "ZH", "112", "", "", "341730"),
+    ("2658822", "Uster", "Uster", "", "47.34713", "8.72091", "P", "PPL", "CH", "", "ZH", "111", "", "", "32000"),
+    ("7285161", "Maur", "Maur", "", "47.34", "8.67", "P", "PPL", "CH", "", "ZH", "111", "", "", "8900"),
+    ("2643743", "London", "London", "", "51.50853", "-0.12574", "P", "PPLC", "GB", "", "ENG", "GLA", "", "", "8961989"),
+    ("2198148", "Somosomo", "Somosomo", "", "-16.77", "179.97", "P", "PPL", "FJ", "", "03", "", "", "", "1000"),
+]
+
+
+def write_places(tmp_path):
+    (tmp_path / "cities1000.txt").write_text(
+        "\n".join("\t".join(place + ("", "", "", "")) for place in PLACES) + "\n", encoding="utf-8")
+    (tmp_path / "admin1CodesASCII.txt").write_text("CH.ZH\tZurich\tZurich\t2657895\n", encoding="utf-8")
+    (tmp_path / "admin2Codes.txt").write_text("CH.ZH.111\tBezirk Uster\tBezirk Uster\t6458797\n", encoding="utf-8")
+    (tmp_path / "countryInfo.txt").write_text("# ISO\tISO3\tISO-Numeric\tfips\tCountry\n"
+                                              "CH\tCHE\t756\tSZ\tSwitzerland\n", encoding="utf-8")
+    return str(tmp_path / "cities1000.txt")
+
+
+def test_format_address():
+    adr = {'village': 'Maur', 'county': 'Bezirk Uster', 'state': 'Zurich', 'country': 'Switzerland'}
+    assert format_address(adr, KEY_LIST) == "Maur, Bezirk Uster, Zurich, Switzerland"
+    assert format_address({'city': 'Uster'}) == "Uster"
+
+
+def test_offline_nearest_place(tmp_path):
+    geo = OfflineGeoReverse(write_places(tmp_path), key_list=KEY_LIST)
+    assert geo.get_address(47.37, 8.54) == "Zürich, Zurich, Switzerland"
+    assert geo.get_address(47.345, 8.68) == "Maur, Bezirk Uster, Zurich, Switzerland"
+    assert geo.get_address(51.5, -0.1) == "London, GB"  # no admin or country names for GB
+    assert geo.get_address(-16.8, -179.95) == "Somosomo, FJ"  # across the date line
+    assert geo.get_address(0.0, -30.0) == ""  # middle of the Atlantic
+
+
+def test_offline_missing_file(tmp_path):
+    assert OfflineGeoReverse(str(tmp_path / "missing.txt")).get_address(47.37, 8.54) == ""
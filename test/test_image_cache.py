@@ -0,0 +1,440 @@
+import os
+import time
+import shutil
+import sqlite3
+from pathlib import Path
+import pytest
+# ensure that picframe is in the path
+# pip install -e .
+from picframe.image_cache import ImageCache
+from picframe.query_filter import path_filter, text_filter
+
+
+@pytest.fixture
+def cache(tmp_path):
+    (tmp_path / "pictures").mkdir()
+    cache = ImageCache(str(tmp_path / "pictures"), False, str(tmp_path / "cache.db3"), None, 3600)
+    db = sqlite3.connect(str(tmp_path / "cache.db3"))
+    db.executemany("INSERT INTO folder(folder_id, name) VALUES(?, ?)",
+                   [(1, "/pics/2020"), (2, "/pics/2020/summer"), (3, "/pics/2020-old"), (4, "/pics/2021")])
+    db.executemany("INSERT INTO file(file_id, folder_id, basename, extension) VALUES(?, ?, ?, 'jpg')",
+                   [(1, 1, "a"), (2, 2, "b"), (3, 3, "c"), (4, 4, "d")])
+    db.executemany("INSERT INTO meta(file_id) VALUES(?)", [(i,) for i in range(1, 5)])
+    db.commit()
+    yield cache, db
+    db.close()
+    cache.stop()
+
+
+def test_path_filter(cache):
+    image_cache, db = cache
+    for path, file_ids in (("/pics/2020", [(1,), (2,)]), ("/pics/2020/", [(1,), (2,)]),
+                           ("/pics/2020/summer", [(2,)]), ("/pics/it's", [])):
+        where, params = path_filter(path)
+        assert image_cache.query_cache(where, "fname ASC", params) == file_ids
+
+
+def test_subtree_query_plan(cache):
+    # the folder name index has to drive the query, not a scan over all files
+    _, db = cache
+    where, params = path_filter("/pics/2020")
+    sql = "EXPLAIN QUERY PLAN SELECT file_id FROM all_data WHERE {} ORDER BY fname ASC".format(where)
+    plan = [row[3] for row in db.execute(sql, params)]
+    assert any(step.startswith("SEARCH folder USING") and "sqlite_autoindex_folder_1" in step for step in plan)
+    assert not any(step.startswith("SCAN file") or step == "SCAN folder" for step in plan)
+
+
+def test_get_file_id(cache):
+    image_cache, _ = cache
+    assert image_cache.get_file_id("/pics/2020/summer/b.jpg") == 2
+    assert image_cache.get_file_id("/pics/2020/summer/a.jpg") is None
+
+
+def test_fts_index(cache):
+    image_cache, db = cache
+    assert image_cache.fts_available()
+    db.execute("UPDATE meta SET tags = 'New York, usa', latitude = 1, longitude = 2 WHERE file_id = 2")
+    db.execute("UPDATE meta SET tags = 'Paris' WHERE file_id = 3")
+    db.execute("INSERT INTO location(latitude, longitude, description) VALUES(1, 2, 'Zürich')")
+    db.commit()
+    for val, field, file_ids in (("york", "tags", [(2,)]), ("new york OR paris", "tags", [(2,), (3,)]),
+                                 ("NOT york", "tags", [(3,)]),  # as with LIKE, not the files without tags
+                                 ("zurich", "location", [(2,)])):
+        where, params = text_filter(val, field, fts=True)
+        assert image_cache.query_cache(where, "file_id ASC", params) == file_ids
+    db.execute("DELETE FROM file WHERE file_id = 2")  # meta and meta_fts follow through the triggers
+    db.commit()
+    assert db.execute("SELECT rowid FROM meta_fts WHERE meta_fts MATCH 'york'").fetchall() == []
+    # the lookup of the location triggers doesn't scan meta
+    plan = db.execute("EXPLAIN QUERY PLAN SELECT file_id FROM meta WHERE latitude = 1 AND longitude = 2").fetchall()
+    assert "meta_position" in plan[0][3]
+
+
+@pytest.mark.parametrize("pairs_by, expected", [
+    ("order", [(1, 2), (3,), (4, 5), (6,)]),
+    ("date", [(1, 4), (2, 6), (3,), (5,)]),
+    ("album", [(1, 5), (2, 4), (3,), (6,)]),
+])
+def test_portrait_pairs(tmp_path, pairs_by, expected):
+    (tmp_path / "pictures").mkdir()
+    image_cache = ImageCache(str(tmp_path / "pictures"), False, str(tmp_path / "cache.db3"), None, 3600,
+                             portrait_pairs=True, portrait_pairs_by=pairs_by)
+    db = sqlite3.connect(str(tmp_path / "cache.db3"))
+    db.executemany("INSERT INTO folder(folder_id, name) VALUES(?, ?)", [(1, "/pics/a"), (2, "/pics/b")])
+    day = 86400 * 10000
+    # file_id, folder, portrait, day taken: 1, 2, 4, 5 and 6 are portraits, 3 is landscape
+    files = [(1, 1, True, day), (2, 2, True, day + 86400), (3, 1, False, day), (4, 2, True, day),
+             (5, 1, True, day + 2 * 86400), (6, 2, True, day + 86400)]
+    db.executemany("INSERT INTO file(file_id, folder_id, basename, extension) VALUES(?, ?, ?, 'jpg')",
+                   [(file_id, folder_id, "f{}".format(file_id)) for file_id, folder_id, _, _ in files])
+    db.executemany("INSERT INTO meta(file_id, width, height, exif_datetime) VALUES(?, ?, ?, ?)",
+                   [(file_id, 3 if portrait else 4, 4 if portrait else 3, taken + 43200)
+                    for file_id, _, portrait, taken in files])
+    db.commit()
+    try:
+        assert image_cache.query_cache("1", "file_id ASC") == expected
+    finally:
+        db.close()
+        image_cache.stop()
+
+
+def test_display_stats_deferred(cache):
+    image_cache, db = cache
+    for file_id in (2, 3, 2):
+        assert image_cache.get_file_info(file_id)['file_id'] == file_id
+    assert db.execute("SELECT sum(displayed_count) FROM file").fetchone()[0] == 0  # nothing written yet
+    image_cache.stop()  # flushes the statistics
+    sql = "SELECT file_id, displayed_count FROM file WHERE displayed_count > 0 ORDER BY file_id"
+    assert db.execute(sql).fetchall() == [(2, 2), (3, 1)]
+
+
+def test_display_stats_flushed_on_pause(cache):
+    image_cache, db = cache
+    image_cache.get_file_info(2)
+    image_cache.pause_looping(True)
+    sql = "SELECT displayed_count FROM file WHERE file_id = 2"
+    assert wait_for(lambda: db.execute(sql).fetchone()[0] == 1)
+
+
+def test_get_file_rows(cache):
+    image_cache, db = cache
+    rows = image_cache.get_file_rows([4, 2, 9, 2, None])
+    assert sorted(rows) == [2, 4]
+    assert rows[2]['fname'] == "/pics/2020/summer/b.jpg"
+    image_cache.stop()
+    assert db.execute("SELECT sum(displayed_count) FROM file").fetchone()[0] == 0  # reading is not showing
+
+
+class CountingGeocoder:
+    def __init__(self):
+        self.calls = []
+
+    def get_address(self, lat, lon):
+        self.calls.append((lat, lon))
+        return "" if lat < 0 else "Place {:.0f}".format(lat)
+
+
+def test_geo_cache_and_fill(tmp_path):
+    (tmp_path / "pictures").mkdir()
+    geocoder = CountingGeocoder()
+    image_cache = ImageCache(str(tmp_path / "pictures"), False, str(tmp_path / "cache.db3"), geocoder, 3600,
+                             geo_grid=0.001, geo_fill=True)
+    db = sqlite3.connect(str(tmp_path / "cache.db3"))
+    db.execute("INSERT INTO folder(folder_id, name) VALUES(1, '/pics')")
+    # 1 and 2 are a few metres apart, 3 gets no address, 4 has no position
+    positions = [(1, 47.00001, 8.00001), (2, 47.00002, 8.00003), (3, -47.0, 8.0), (4, None, None)]
+    db.executemany("INSERT INTO file(file_id, folder_id, basename, extension) VALUES(?, 1, ?, 'jpg')",
+                   [(file_id, "f{}".format(file_id)) for file_id, _, _ in positions])
+    db.executemany("INSERT INTO meta(file_id, latitude, longitude) VALUES(?, ?, ?)", positions)
+    db.commit()
+    try:
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline and len(geocoder.calls) < 2:
+            time.sleep(0.1)
+        time.sleep(1.5)  # time for another round, which mustn't ask again
+        assert sorted(geocoder.calls) == [(-47.0, 8.0), (47.00001, 8.00001)] or \
+            sorted(geocoder.calls) == [(-47.0, 8.0), (47.00002, 8.00003)]
+        assert [row[0] for row in db.execute("SELECT location FROM all_data ORDER BY file_id")] == \
+            ["Place 47", "Place 47", None, None]
+    finally:
+        db.close()
+        image_cache.stop()
+
+
+def wait_for(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and not condition():
+        time.sleep(0.1)
+    return condition()
+
+
+def test_album_table(tmp_path):
+    pictures = tmp_path / "pictures"
+    source = sorted(p for p in (Path(__file__).parent / "kamera").iterdir() if p.suffix.lower() == ".jpg")[:3]
+    for album, files in (("2020/a", source), ("2021/b", source[:1]), ("2021/b/extra", source[1:2])):
+        (pictures / album).mkdir(parents=True)
+        for f in files:
+            shutil.copy(f, pictures / album)
+    (pictures / "2021" / "loose.jpg").write_bytes(source[0].read_bytes())  # not in an album
+    image_cache = ImageCache(str(pictures), False, str(tmp_path / "cache.db3"), None, 0.2)
+    try:
+        def albums():
+            return [(row['name'][len(str(pictures)) + 1:], row['image_count'], row['pending'])
+                    for row in image_cache.get_albums(str(pictures))]
+        assert wait_for(lambda: albums() == [("2020/a", 3, 0), ("2021/b", 2, 0)])
+        # below a subdirectory the albums are the folders two levels below that
+        assert [(row['name'], row['image_count']) for row in image_cache.get_albums(str(pictures / "2021"))] \
+            == [(str(pictures / "2021/b/extra"), 1)]
+
+        # one query for several albums, album by album in the order asked for
+        in_order = [str(pictures / "2021/b"), str(pictures / "2020/a")]
+        file_ids = [row[0] for row in image_cache.query_cache("1", "fname ASC", albums=in_order)]
+        assert len(file_ids) == 5
+        assert file_ids[:2] == [image_cache.get_file_id(str(pictures / "2021/b" / source[0].name)),
+                                image_cache.get_file_id(str(pictures / "2021/b/extra" / source[1].name))]
+        assert image_cache.count_album_files(in_order, "fname LIKE ?", ("%/extra/%",)) \
+            == {in_order[0]: 1, in_order[1]: 0}
+
+        changes = image_cache.get_change_count()
+        os.remove(pictures / "2020/a" / source[0].name)
+        shutil.rmtree(pictures / "2021/b")
+        image_cache.rescan()  # within the same second as the last scan of the folders
+        assert wait_for(lambda: albums() == [("2020/a", 2, 0)])
+        assert image_cache.get_change_count() > changes
+    finally:
+        image_cache.stop()
+
+
+def test_parallel_index(tmp_path):
+    pictures = tmp_path / "pictures"
+    source = sorted(p for p in (Path(__file__).parent / "kamera").iterdir() if p.suffix.lower() == ".jpg")
+    (pictures / "2020/a").mkdir(parents=True)
+    for f in source[:4]:
+        shutil.copy(f, pictures / "2020/a")
+    image_cache = ImageCache(str(pictures), False, str(tmp_path / "cache.db3"), None, 0.2, index_workers=2)
+    try:
+        def indexed():
+            return len(image_cache.query_cache("1"))
+        assert wait_for(lambda: indexed() == 4)
+        (pictures / "2020/b").mkdir()
+        for f in source[4:8]:
+            shutil.copy(f, pictures / "2020/b")
+        image_cache.rescan()
+        assert wait_for(lambda: indexed() == 8)  # the second burst goes through the same workers
+    finally:
+        image_cache.stop()
+
+
+def test_video_info_purged(tmp_path):
+    pictures = tmp_path / "pictures"
+    (pictures / "2021/b").mkdir(parents=True)
+    videos = sorted(p for p in (Path(__file__).parent / "mixed").iterdir() if p.suffix.lower() == ".mp4")[:2]
+    for f in videos:
+        shutil.copy(f, pictures / "2021/b")
+    image_cache = ImageCache(str(pictures), False, str(tmp_path / "cache.db3"), None, 0.2)
+    db = sqlite3.connect(str(tmp_path / "cache.db3"))
+    try:
+        def probed():
+            return sorted(os.path.basename(row[0]) for row in db.execute("SELECT fname FROM video_info"))
+        assert wait_for(lambda: probed() == [f.name for f in videos])
+        os.remove(pictures / "2021/b" / videos[0].name)
+        image_cache.rescan()
+        assert wait_for(lambda: len(image_cache.query_cache("1")) == 1)
+        assert len(probed()) == 2  # kept until the next full scan
+        image_cache.purge_files()
+        image_cache.rescan()
+        assert wait_for(lambda: probed() == [videos[1].name])
+    finally:
+        db.close()
+        image_cache.stop()
+
+
+def test_display_jobs_while_indexing(tmp_path):
+    pictures = tmp_path / "pictures"
+    pictures.mkdir()
+    indexed_when_asked = []
+
+    def indexed():
+        where, params = path_filter(str(pictures))
+        return len(image_cache.query_cache(where, "fname ASC", params))
+
+    class Geocoder:
+        def get_address(self, lat, lon):
+            indexed_when_asked.append(indexed())
+            return "Place"
+
+    image_cache = ImageCache(str(pictures), False, str(tmp_path / "cache.db3"), Geocoder(), 3600, db_batch_size=1)
+    db = sqlite3.connect(str(tmp_path / "cache.db3"))
+    db.execute("INSERT INTO folder(folder_id, name) VALUES(1, '/pics')")
+    db.execute("INSERT INTO file(file_id, folder_id, basename, extension) VALUES(1, 1, 'f1', 'jpg')")
+    db.execute("INSERT INTO meta(file_id, latitude, longitude) VALUES(1, 47.0, 8.0)")
+    db.commit()
+    source = sorted(p for p in (Path(__file__).parent / "kamera").iterdir() if p.suffix.lower() == ".jpg")
+    (pictures / "2020/a").mkdir(parents=True)
+    for i in range(60):
+        shutil.copy(source[i % len(source)], pictures / "2020/a" / "{:02d}.jpg".format(i))
+    try:
+        image_cache.rescan()
+        image_cache.get_file_info(1)  # shown while the new files are indexed, its location is missing
+        assert wait_for(lambda: indexed() == 60)
+        assert indexed_when_asked and indexed_when_asked[0] < 60  # not left until the indexing is done
+    finally:
+        db.close()
+        image_cache.stop()
+
+
+def test_no_full_scan_on_restart(tmp_path, caplog):
+    pictures = tmp_path / "pictures"
+    (pictures / "2020/a").mkdir(parents=True)
+    source = sorted(p for p in (Path(__file__).parent / "kamera").iterdir() if p.suffix.lower() == ".jpg")
+    shutil.copy(source[0], pictures / "2020/a")
+
+    def start():
+        image_cache = ImageCache(str(pictures), False, str(tmp_path / "cache.db3"), None, 0.2)
+        assert wait_for(lambda: len(image_cache.query_cache("1")) == 1)
+        image_cache.stop()
+
+    with caplog.at_level("INFO", logger="image_cache.ImageCache"):
+        start()
+        assert "Full reconciliation" in caplog.text
+        caplog.clear()
+        start()  # e.g. the restart after a video
+        assert "Full reconciliation" not in caplog.text
+
+
+@pytest.fixture
+def indexed(tmp_path):
+    """A cache over two copies of a picture, one per album, and a connection to its db."""
+    pictures = tmp_path / "pictures"
+    source = sorted(p for p in (Path(__file__).parent / "kamera").iterdir() if p.suffix.lower() == ".jpg")[:2]
+    for album, f in (("2020/a", source[0]), ("2020/b", source[1])):
+        (pictures / album).mkdir(parents=True)
+        shutil.copy(f, pictures / album)
+    image_cache = ImageCache(str(pictures), False, str(tmp_path / "cache.db3"), None, 3600)
+    db = sqlite3.connect(str(tmp_path / "cache.db3"))
+    assert wait_for(lambda: len(image_cache.query_cache("1")) == 2)
+    yield image_cache, db, pictures, source
+    db.close()
+    image_cache.stop()
+
+
+def file_record(image_cache, db, path):
+    file_id = image_cache.get_file_id(str(path))
+    if file_id is None:
+        return None
+    return db.execute("SELECT file_id, displayed_count FROM file WHERE file_id = ?", (file_id,)).fetchone()
+
+
+def test_revalidated_on_stop(indexed):
+    image_cache, db, pictures, source = indexed
+    path = pictures / "2020/a" / source[0].name
+    file_id = image_cache.get_file_id(str(path))
+    db.execute("UPDATE file SET last_modified = 0 WHERE file_id = ?", (file_id,))
+    db.commit()
+    image_cache.get_file_info(file_id)  # queues the check whether the file changed on disk
+    image_cache.stop()
+    sql = "SELECT last_modified FROM file WHERE file_id = ?"
+    assert db.execute(sql, (file_id,)).fetchone()[0] == path.stat().st_mtime
+
+
+@pytest.mark.parametrize("content_hash", [True, False])
+def test_move_renamed_folder(indexed, content_hash):
+    image_cache, db, pictures, source = indexed
+    old = file_record(image_cache, db, pictures / "2020/a" / source[0].name)
+    db.execute("UPDATE file SET displayed_count = 3 WHERE file_id = ?", (old[0],))
+    if not content_hash:  # a record from before schema v4, matched by inode and mtime
+        db.execute("UPDATE file SET content_hash = NULL WHERE file_id = ?", (old[0],))
+    db.commit()
+    (pictures / "2020/a").rename(pictures / "2020/c")
+    image_cache.rescan()
+    assert wait_for(lambda: file_record(image_cache, db, pictures / "2020/c" / source[0].name) is not None)
+    assert file_record(image_cache, db, pictures / "2020/c" / source[0].name) == (old[0], 3)
+
+
+def test_move_copied_then_deleted(indexed):
+    image_cache, db, pictures, source = indexed
+    old = file_record(image_cache, db, pictures / "2020/a" / source[0].name)
+    (pictures / "2021/c").mkdir(parents=True)
+    shutil.copy(pictures / "2020/a" / source[0].name, pictures / "2021/c/copy.jpg")  # a new inode
+    os.remove(pictures / "2020/a" / source[0].name)
+    image_cache.rescan()
+    assert wait_for(lambda: file_record(image_cache, db, pictures / "2021/c/copy.jpg") is not None)
+    assert file_record(image_cache, db, pictures / "2021/c/copy.jpg")[0] == old[0]
+
+
+@pytest.mark.parametrize("old_hash", ["kept", None])
+def test_reused_inode_is_not_a_move(indexed, old_hash):
+    image_cache, db, pictures, source = indexed
+    path = pictures / "2020/a" / source[0].name
+    old = file_record(image_cache, db, path)
+    data = bytearray(path.read_bytes())
+    data[-3] ^= 0xFF  # same size, different content
+    os.remove(path)
+    new = pictures / "2020/a/new.jpg"
+    new.write_bytes(bytes(data))
+    os.utime(new, (time.time() + 5, time.time() + 5))
+    # as if the file system had given the new file the inode of the deleted one
+    db.execute("UPDATE file SET inode = ?, displayed_count = 3 WHERE file_id = ?", (os.stat(new).st_ino, old[0]))
+    if old_hash is None:  # a record from before schema v4
+        db.execute("UPDATE file SET content_hash = NULL WHERE file_id = ?", (old[0],))
+    db.commit()
+    image_cache.rescan()
+    assert wait_for(lambda: file_record(image_cache, db, new) is not None)
+    assert file_record(image_cache, db, new)[1] == 0  # read as a new file, not the old record
+
+
+def test_duplicate_files(indexed):
+    image_cache, db, pictures, source = indexed
+    assert image_cache.get_duplicate_files() == []
+    shutil.copy(source[1], pictures / "2020/a/copy.jpg")
+    image_cache.rescan()
+    assert wait_for(lambda: len(image_cache.query_cache("1")) == 3)
+    assert image_cache.get_duplicate_files() == [sorted([str(pictures / "2020/a/copy.jpg"),
+                                                         str(pictures / "2020/b" / source[1].name)])]
+
+
+def test_schema_v10_indexes(tmp_path):
+    (tmp_path / "pictures").mkdir()
+    db_file = str(tmp_path / "cache.db3")
+
+    def indexes():
+        db = sqlite3.connect(db_file)
+        try:
+            sql = ("SELECT name FROM sqlite_master"
+                   " WHERE type = 'index' AND tbl_name = 'file' AND name NOT LIKE 'sqlite%'")
+            return {row[0] for row in db.execute(sql)}
+        finally:
+            db.close()
+
+    ImageCache(str(tmp_path / "pictures"), False, db_file, None, 3600).stop()
+    assert indexes() == {"file_identity"}
+    # a db left at v9 with the indexes of the v4 and v6 steps as they were first released
+    db = sqlite3.connect(db_file)
+    db.execute("DROP INDEX file_identity")
+    db.execute("CREATE INDEX file_size ON file (size)")
+    db.execute("CREATE INDEX file_last_modified ON file (last_modified)")
+    db.execute("UPDATE db_info SET schema_version = 9")
+    db.commit()
+    db.close()
+    ImageCache(str(tmp_path / "pictures"), False, db_file, None, 3600).stop()
+    assert indexes() == {"file_identity"}
+
+
+def test_folder_counts_rebuilt(indexed):
+    image_cache, db, pictures, source = indexed
+    albums = image_cache.get_albums(str(pictures))
+    assert [(row['name'], row['image_count']) for row in albums] \
+        == [(str(pictures / "2020/a"), 1), (str(pictures / "2020/b"), 1)]
+    image_cache.stop()
+    # a db left at v11, with its album table
+    db.execute("DROP TABLE folder_count")
+    db.execute("CREATE TABLE album (name TEXT NOT NULL PRIMARY KEY, image_count INTEGER, video_count INTEGER,"
+               " pending INTEGER)")
+    db.execute("UPDATE db_info SET schema_version = 11")
+    db.commit()
+    image_cache = ImageCache(str(pictures), False, str(pictures.parent / "cache.db3"), None, 3600)
+    try:
+        assert image_cache.get_albums(str(pictures)) == albums
+        assert db.execute("SELECT name FROM sqlite_master WHERE name = 'album'").fetchone() is None
+    finally:
+        image_cache.stop()
@@ -0,0 +1,50 @@
+import io
+import exifread
+# ensure that picframe is in the path
+# pip install -e .
+from picframe.image_header import read_header, parse_iptc
+
+
+def test_jpeg_header():
+    header = read_header("test/kamera/C09-SamsungS22_4000x3000_3MB.jpg")
+    assert header.format == 'JPEG'
+    assert (header.width, header.height) == (4000, 3000)
+    with open("test/kamera/C09-SamsungS22_4000x3000_3MB.jpg", 'rb') as f:
+        full = exifread.process_file(f, details=False)
+    tags = exifread.process_file(io.BytesIO(header.exif), details=False)
+    assert str(tags['Image Model']) == str(full['Image Model'])
+    assert str(tags['EXIF DateTimeOriginal']) == str(full['EXIF DateTimeOriginal'])
+
+
+def test_jpeg_iptc():
+    header = read_header("test/landscape/B04-1920x1200_exif_geo.jpg")
+    assert header.iptc['IPTC Keywords'] == 'AidaPrima, Events, Kreuzfahrt, Land'
+
+
+def test_heif_header():
+    header = read_header("test/pattern/1440x960.heic")
+    assert header.format == 'HEIF'
+    assert (header.width, header.height) == (1440, 960)
+    header = read_header("test/pattern/512x512.heic")  # a 3024x4032 phone picture despite the name
+    assert (header.width, header.height) == (3024, 4032)
+    assert 'Image Make' in exifread.process_file(io.BytesIO(header.exif), details=False)
+
+
+def test_other_formats_fall_back():
+    assert read_header("test/pattern/720x576.png") is None
+    assert read_header("nonsense") is None
+
+
+def test_parse_iptc():
+    record = b'\x1c\x02\x05\x00\x05Title\x1c\x02\x19\x00\x01a\x1c\x02\x19\x00\x01b'
+    block = b'Photoshop 3.0\x008BIM\x04\x04\x00\x00' + len(record).to_bytes(4, 'big') + record
+    assert parse_iptc(block) == {'IPTC Object Name': 'Title', 'IPTC Keywords': 'a, b'}
+
+
+def test_truncated_iptc_falls_back(tmp_path):
+    block = b'Photoshop 3.0\x008BIM\x04\x04'  # cut off before the resource name
+    app13 = b'\xff\xed' + (len(block) + 2).to_bytes(2, 'big') + block
+    sof = b'\xff\xc0\x00\x11\x08\x00\x10\x00\x20\x03' + b'\x00' * 9
+    path = tmp_path / "truncated.jpg"
+    path.write_bytes(b'\xff\xd8' + app13 + sof + b'\xff\xd9')
+    assert read_header(str(path)) is None
@@ -0,0 +1,56 @@
+import os
+import sys
+import pytest
+# ensure that picframe is in the path
+# pip install -e .
+from picframe.inotify_watcher import InotifyWatcher
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'), reason="inotify is linux only")
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    (tmp_path / "2020" / "album").mkdir(parents=True)
+    (tmp_path / ".hidden").mkdir()
+    w = InotifyWatcher(str(tmp_path))
+    assert w.start() is True
+    yield w
+    w.close()
+
+
+def test_file_events(watcher, tmp_path):
+    pic = tmp_path / "2020" / "album" / "a.jpg"
+    pic.write_bytes(b"x")
+    events = watcher.read_events(1.0)
+    assert str(pic) in events.changed_files
+
+    os.remove(pic)
+    events = watcher.read_events(1.0)
+    assert str(pic) in events.deleted_files
+    assert str(pic) not in events.changed_files
+
+
+def test_moved_in_album_is_a_new_dir(watcher, tmp_path):
+    # this is what sync_photos.sh does: fill album.tmp then rename it
+    tmp_album = tmp_path / "2020" / "new.tmp"
+    tmp_album.mkdir()
+    (tmp_album / "b.jpg").write_bytes(b"x")
+    os.rename(tmp_album, tmp_path / "2020" / "new")
+    events = watcher.read_events(1.0)
+    assert events.new_dirs == {str(tmp_path / "2020" / "new")}
+    assert not events.changed_files
+
+
+def test_deleted_dir_swallows_file_events(watcher, tmp_path):
+    album = tmp_path / "2020" / "album"
+    (album / "c.jpg").write_bytes(b"x")
+    os.remove(album / "c.jpg")
+    os.rmdir(album)
+    events = watcher.read_events(1.0)
+    assert events.deleted_dirs == {str(album)}
+    assert not events.deleted_files
+
+
+def test_hidden_dirs_are_ignored(watcher, tmp_path):
+    (tmp_path / ".hidden" / "d.jpg").write_bytes(b"x")
+    assert not watcher.read_events(0.2)
@@ -1,3 +1,4 @@
+import json
 import logging
 from unittest.mock import MagicMock, patch
 import pytest
@@ -189,3 +190,28 @@ def test_on_message(mock_mqtt_client, mock_controller, mqtt_config):
 
     # Verify that the controller's brightness was updated
     mock_controller.brightness = 0.5
+
+
+@patch("paho.mqtt.client.Client")
+def test_publish_state_without_date_filter(mock_mqtt_client, mock_controller, mqtt_config):
+    """Unset date filters are published as 0."""
+    mock_client_instance = mock_mqtt_client.return_value
+    mqtt_interface = InterfaceMQTT(mock_controller, mqtt_config)
+
+    mock_controller.get_directory_list.return_value = ("test_dir", ["dir1", "dir2"])
+    mock_controller.get_number_of_files.return_value = 10
+    mock_controller.date_from = None
+    mock_controller.date_to = None
+    mock_controller.location_filter = ""
+    mock_controller.tags_filter = ""
+    mock_controller.time_delay = 5
+    mock_controller.fade_time = 2
+    mock_controller.brightness = 0.8
+    mock_controller.matting_images = 0.5
+
+    mqtt_interface.publish_state()
+
+    published = {c.args[0]: c.args[1] for c in mock_client_instance.publish.call_args_list}
+    state = json.loads(published["homeassistant/sensor/picframe_test/state"])
+    assert state["date_from"] == 0
+    assert state["date_to"] == 0
@@ -0,0 +1,46 @@
+# ensure that picframe is in the path
+# pip install -e .
+import sqlite3
+from picframe.playback_state import PlaybackState
+
+
+def bookmark(db_file):
+    db = sqlite3.connect(str(db_file))
+    try:
+        return db.execute("SELECT fname, position FROM bookmark").fetchone()
+    finally:
+        db.close()
+
+
+def test_migrate_log(tmp_path):
+    current = tmp_path / "current.jpg"
+    current.write_bytes(b"")
+    log = tmp_path / "shown_albums.log"
+    log.write_text("/pics/2020/a\n/pics/2021/b\n{}\n".format(current))
+    state = PlaybackState(str(tmp_path / "state.db3"), str(log))
+    assert state.shown_albums() == {"/pics/2020/a", "/pics/2021/b"}
+    assert state.current_file == str(current)
+    assert log.read_text() == "/pics/2020/a\n/pics/2021/b\n"  # only albums left for sync_photos.sh
+    state.close()
+    log.write_text("/pics/2022/c\n")  # not taken over again
+    state = PlaybackState(str(tmp_path / "state.db3"), str(log))
+    assert state.shown_albums() == {"/pics/2020/a", "/pics/2021/b"}
+    state.close()
+
+
+def test_albums_and_bookmark(tmp_path):
+    log = tmp_path / "shown_albums.log"
+    state = PlaybackState(str(tmp_path / "state.db3"), str(log))
+    state.add_shown_album("/pics/2020/a")
+    state.add_shown_album("/pics/2021/b")
+    state.add_shown_album("/pics/2020/a")
+    assert log.read_text() == "/pics/2020/a\n/pics/2021/b\n"
+    state.clear_shown_albums()
+    assert state.shown_albums() == set() and log.read_text() == ""
+
+    state.set_current_file("/pics/2020/a/1.jpg", 3, commit=True)
+    state.set_current_file("/pics/2020/a/2.jpg", 4)  # held back until the next commit
+    assert bookmark(tmp_path / "state.db3") == ("/pics/2020/a/1.jpg", 3)
+    assert (state.current_file, state.position) == ("/pics/2020/a/2.jpg", 4)
+    state.close()
+    assert bookmark(tmp_path / "state.db3") == ("/pics/2020/a/2.jpg", 4)
@@ -0,0 +1,89 @@
+# ensure that picframe is in the path
+# pip install -e .
+import pytest
+from picframe.playlist import Permutation, Playlist
+
+
+def test_slides():
+    playlist = Playlist([(3,), (5, 7), (9,)])
+    assert len(playlist) == 3
+    assert [playlist[i] for i in range(3)] == [(3,), (5, 7), (9,)]
+    assert playlist.file_count() == 4
+    assert playlist.index(9) == 2
+    assert playlist.index(7) == 1  # second of a pair
+    with pytest.raises(ValueError):
+        playlist.index(4)
+    assert playlist.slides(2, 2) == [(9,), (3,)]
+    assert playlist.slides(0, 10) == [(3,), (5, 7), (9,)]
+    del playlist[1]
+    assert playlist.slides(0, 5) == [(3,), (9,)]
+    assert playlist.file_count() == 2
+
+
+def test_compact():
+    playlist = Playlist((i,) for i in range(1, 200001))
+    assert playlist.nbytes() == 800000  # no partner array without pairs
+    assert playlist.index(200000) == 199999
+    playlist.extend([(1, 2)])
+    assert playlist[200000] == (1, 2) and playlist[0] == (1,)
+    assert playlist.nbytes() == 2 * 200001 * 4
+
+
+def test_large_ids():
+    playlist = Playlist([(1,), (2 ** 40, 2 ** 41)])
+    assert playlist[1] == (2 ** 40, 2 ** 41)
+    assert playlist[0] == (1,)
+    assert len(playlist) == 2
+
+
+def test_permutation():
+    for n in (0, 1, 2, 3, 17, 1000):
+        perm = Permutation(n, 42)
+        order = [perm[i] for i in range(n)]
+        assert sorted(order) == list(range(n))
+        assert [perm.index(value) for value in order] == list(range(n))
+    assert [Permutation(1000, 42)[i] for i in range(10)] == order[:10]  # same seed, same order
+    assert [Permutation(1000, 43)[i] for i in range(10)] != order[:10]
+
+
+def test_shuffle():
+    slides = [(i,) for i in range(1, 101)] + [(101, 102)]
+    playlist = Playlist(slides)
+    playlist.shuffle(7, [20, 81])  # the first 20 stay first
+    shown = [playlist[i] for i in range(len(playlist))]
+    assert sorted(shown[:20]) == slides[:20] and sorted(shown[20:]) == slides[20:]
+    assert shown != slides
+    assert playlist.index(102) == shown.index((101, 102))
+    assert playlist.slides(100, 2) == [shown[100], shown[0]]
+    del playlist[5]
+    del playlist[0]
+    assert [playlist[i] for i in range(len(playlist))] == shown[1:5] + shown[6:]
+    assert playlist.index(shown[6][0]) == 4
+    with pytest.raises(ValueError):
+        playlist.index(shown[5][0])
+    assert playlist.file_count() == 100 and len(playlist.file_ids()) == 100
+    playlist.shuffle(8)  # keeps the blocks, without the deleted slides
+    reshuffled = [playlist[i] for i in range(len(playlist))]
+    assert sorted(reshuffled) == sorted(shown[1:5] + shown[6:])
+    assert len({slide[0] for slide in reshuffled[:18]} - set(range(1, 21))) == 0
+
+
+def test_snapshot(tmp_path):
+    path = str(tmp_path / "playlist.bin")
+    for slides in ([(3,), (5, 7), (9,)], [(1,), (2 ** 40,)], []):
+        Playlist(slides).save(path, {'index': 1, 'albums': ["/pics/2020/a"]})
+        playlist, state = Playlist.load(path)
+        assert [playlist[i] for i in range(len(playlist))] == slides
+        assert state == {'index': 1, 'albums': ["/pics/2020/a"]}
+    playlist = Playlist((i,) for i in range(1, 51))
+    playlist.shuffle(3, [10, 40])
+    del playlist[7]
+    playlist.save(path, {})
+    shown = [playlist[i] for i in range(len(playlist))]
+    playlist, _ = Playlist.load(path)
+    assert playlist.seed == 3
+    assert [playlist[i] for i in range(len(playlist))] == shown
+    with open(path, 'r+b') as f:
+        f.truncate(f.seek(0, 2) - 1)
+    with pytest.raises(ValueError):
+        Playlist.load(path)
@@ -0,0 +1,66 @@
+import sqlite3
+# ensure that picframe is in the path
+# pip install -e .
+from picframe import query_filter
+
+
+def matches(filter, values):
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE t (tags TEXT)")
+    db.executemany("INSERT INTO t VALUES(?)", [(v,) for v in values])
+    return [row[0] for row in db.execute("SELECT tags FROM t WHERE {} ORDER BY tags".format(filter.sql), filter.params)]
+
+
+def test_text_filter():
+    values = ["new york, usa", "paris, france", "york, uk", "it's 100% fun"]
+    assert matches(query_filter.text_filter("york", "tags"), values) == ["new york, usa", "york, uk"]
+    assert matches(query_filter.text_filter("New York OR paris", "tags"), values) == ["new york, usa", "paris, france"]
+    assert matches(query_filter.text_filter("york AND NOT usa", "tags"), values) == ["york, uk"]
+    assert matches(query_filter.text_filter("it's 100%", "tags"), values) == ["it's 100% fun"]
+    assert matches(query_filter.text_filter("0_", "tags"), values) == []
+    assert query_filter.text_filter("(york", "tags") is None
+    assert query_filter.text_filter("york OR AND paris", "tags") is None
+
+
+def test_filter_shape():
+    # the SQL only depends on which filters are set, not on their values
+    assert query_filter.text_filter("york", "tags").sql == query_filter.text_filter("paris", "tags").sql
+    assert query_filter.path_filter("/a").sql == query_filter.path_filter("/b/c'd").sql
+    assert query_filter.date_filter(None, None) is None
+    assert query_filter.date_filter(100, 0) == ("(exif_datetime >= ?)", (100.0,))
+    assert query_filter.recent_filter(100, recent=False) == ("(last_modified < ?)", (100,))
+
+    filters = query_filter.FilterSet()
+    assert filters.compile() == ("1", ())
+    filters.set("tags_filter", query_filter.text_filter("york", "tags"))
+    filters.set("date_filter", query_filter.date_filter(100, 200))
+    sql, params = filters.compile(query_filter.path_filter("/a"))
+    assert params == ("/a", "/a/", "/a0", 100.0, 200.0, "%york%")
+    sql_b, params_b = filters.compile(query_filter.path_filter("/b"))
+    assert sql_b is sql
+    filters.set("date_filter")
+    assert filters.compile()[1] == ("%york%",)
+
+
+def test_fts_filter():
+    filter = query_filter.text_filter('york AND NOT "usa', "tags", fts=True)
+    assert filter.sql == "(tags IS NOT NULL AND ({0} AND NOT {0}))".format(query_filter.FTS_MATCH)
+    assert filter.params == ('tags : ("york" *)', 'tags : ("""usa" *)')
+    assert "LIKE" in query_filter.text_filter("york", "make", fts=True).sql  # not in the index
+
+
+def test_fts_and_like_agree_on_null():
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE t (file_id INTEGER PRIMARY KEY, location TEXT)")
+    db.execute("CREATE VIRTUAL TABLE meta_fts USING fts5(tags, caption, title, location)")
+    values = [(1, "paris, france"), (2, "york, uk"), (3, None)]
+    db.executemany("INSERT INTO t VALUES(?, ?)", values)
+    db.executemany("INSERT INTO meta_fts(rowid, location) VALUES(?, ?)", values)
+    for val in ("paris", "NOT paris", "NOT (paris OR york)", "york OR NOT paris"):
+        results = []
+        for fts in (False, True):
+            filter = query_filter.text_filter(val, "location", fts=fts)
+            sql = "SELECT file_id FROM t WHERE {} ORDER BY file_id".format(filter.sql)
+            results.append([row[0] for row in db.execute(sql, filter.params)])
+        assert results[0] == results[1], val
+    assert results[0] == [2]
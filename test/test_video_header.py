@@ -0,0 +1,44 @@
+import struct
+# ensure that picframe is in the path
+# pip install -e .
+from picframe.video_header import read_video_header, MAC_EPOCH_OFFSET
+
+
+def box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def make_mp4(path, matrix, creation=0):
+    mvhd = box(b'mvhd', struct.pack('>IIIII', 0, creation, creation, 1000, 5500) + bytes(80))
+    tkhd = box(b'tkhd', struct.pack('>IIIIII', 0, 0, 0, 1, 0, 5500) + bytes(16) +
+               struct.pack('>9i', *matrix) + struct.pack('>II', 1920 << 16, 1080 << 16))
+    hdlr = box(b'hdlr', bytes(8) + b'vide' + bytes(12))
+    avc1 = (struct.pack('>I4s', 86, b'avc1') + bytes(6) + struct.pack('>H', 1) + bytes(16) +
+            struct.pack('>HH', 1920, 1080))
+    stsd = box(b'stsd', struct.pack('>II', 0, 1) + avc1 + bytes(86 - len(avc1)))
+    mdia = box(b'mdia', hdlr + box(b'minf', box(b'stbl', stsd)))
+    moov = box(b'moov', mvhd + box(b'trak', tkhd + mdia))
+    with open(path, 'wb') as f:
+        # moov behind mdat like a camera writes it
+        f.write(box(b'ftyp', b'isom' + bytes(4)) + box(b'mdat', bytes(1000)) + moov)
+
+
+def test_mp4_file():
+    info = read_video_header("test/modes/F04-1280x720p50_bit3584k.mp4")
+    assert (info['width'], info['height'], info['rotation']) == (1280, 720, 0)
+    assert 10.0 < info['duration'] < 10.2
+
+
+def test_rotation_and_creation_time(tmp_path):
+    path = str(tmp_path / "portrait.mp4")
+    one = 0x10000
+    make_mp4(path, (0, one, 0, -one, 0, 0, 0, 0, 0x40000000), creation=MAC_EPOCH_OFFSET + 1700000000)
+    info = read_video_header(path)
+    assert (info['width'], info['height'], info['rotation']) == (1920, 1080, 90)
+    assert info['duration'] == 5.5
+    assert info['creation_time'] == 1700000000
+
+
+def test_other_containers_fall_back():
+    assert read_video_header("test/clips/ext/1280x720p50_libx264_high_yuv420p_bt709_gop100_bit3584k_lcaac_160k_48k_2ch_en.mkv") is None  # noqa: E501
+    assert read_video_header("test/kamera/C01-FotoScan_578x519_80kB.jpg") is None